@@ -19,14 +19,18 @@ API 端点：
 
 import os
 import json
+import asyncio
 import logging
 import hashlib
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 from pathlib import Path
 
+import aiofiles
+import aiofiles.os
+import orjson
 from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
@@ -36,7 +40,7 @@ import re
 
 # 自动加载环境变量（必须在导入其他模块之前）
 from src.env_config import load_env, get_config
-from src.gcs_utils import GCSUploader
+from src import gcs_utils
 from cost_calculator import CostCalculator, UsageMetrics
 
 try:
@@ -89,7 +93,7 @@ class GeneratePodcastRequest(BaseModel):
         default=None,
         description="可选：GCS 存储 key 前缀（例如 stockflow/us/AAPL/2026-02-04/zh/chinese_2_hosts/dur5）。已配置 GCS_BUCKET_NAME 时将写入 <prefix>/{script.json,audio.mp3,manifest.json}。若启用 use_cache，则会先查 manifest.json 命中则直接返回。",
     )
-    use_cache: bool = Field(default=True, description="当已配置 GCS_BUCKET_NAME 且存在 <prefix>/manifest.json 时，是否直接命中返回（不重新生成）。")
+    use_cache: bool = Field(default=True, description="当已配置 GCS_BUCKET_NAME 且存在 <prefix>/manifest.json 时，是否直接命中返回（不重新生成）；为 False 时也跳过进程内脚本缓存，强制调用 LLM。")
     manifest_params: Optional[Dict[str, Any]] = Field(
         default=None,
         description="可选：写入 manifest.json 的参数（用于把调用方传入的 days/horizon/bt/dur/variant 等写清楚）。不会影响缓存命中逻辑。",
@@ -176,6 +180,29 @@ def _derive_cache_prefix_from_request(request: "GeneratePodcastRequest") -> str:
     derived = f"stockflow/auto/v1/{date_key}/{request.language}/{request.style_name}/dur{request.duration_minutes}/{digest}"
     return _sanitize_cache_prefix(derived)
 
+class ManifestModel(BaseModel):
+    """GCS 缓存目录中的 manifest.json（字段为 None 时不写入）"""
+    version: int = 1
+    podcast_id: str
+    podcast_name: str
+    topic: str
+    style: str
+    tone: str
+    dialogue_style: str
+    duration_minutes: int
+    language: str
+    num_speakers: int
+    script_blob: str
+    audio_blob: str
+    script_preview: Optional[Dict[str, Any]] = None
+    token_usage: Optional[Dict[str, int]] = None
+    tts_character_count: Optional[int] = None
+    cost_breakdown: Optional[Dict[str, float]] = None
+    audio_duration_seconds: Optional[float] = None
+    audio_file_size_bytes: Optional[int] = None
+    created_at: datetime
+    stockflow_params: Optional[Dict[str, Any]] = None
+
 class ScriptResponse(BaseModel):
     """脚本响应"""
     podcast_id: str
@@ -258,6 +285,13 @@ async def startup_event():
     
     logger.info("✅ 播客引擎 v4 已准备好！")
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时释放 LLM 客户端的连接池"""
+    if script_generator is not None:
+        script_generator.close()
+
 # ============================================================================
 # Web界面路由
 # ============================================================================
@@ -396,8 +430,8 @@ async def generate_podcast_v4(request: GeneratePodcastRequest):
             if request.use_cache:
                 try:
                     manifest_blob = f"{cache_prefix}/manifest.json"
-                    if GCSUploader.blob_exists(gcs_bucket_name, manifest_blob):
-                        manifest = GCSUploader.download_json(gcs_bucket_name, manifest_blob)
+                    if gcs_utils.blob_exists(gcs_bucket_name, manifest_blob):
+                        manifest = gcs_utils.download_json(gcs_bucket_name, manifest_blob)
                         script_blob = str(manifest.get("script_blob") or "")
                         audio_blob = str(manifest.get("audio_blob") or "")
 
@@ -405,12 +439,12 @@ async def generate_podcast_v4(request: GeneratePodcastRequest):
                         audio_uri = f"gs://{gcs_bucket_name}/{audio_blob}" if audio_blob else None
 
                         script_signed_url = (
-                            GCSUploader.generate_signed_url(gcs_bucket_name, script_blob, expiration_hours=24)
+                            gcs_utils.generate_signed_url(gcs_bucket_name, script_blob, expiration_hours=24)
                             if script_blob
                             else None
                         )
                         audio_signed_url = (
-                            GCSUploader.generate_signed_url(gcs_bucket_name, audio_blob, expiration_hours=24)
+                            gcs_utils.generate_signed_url(gcs_bucket_name, audio_blob, expiration_hours=24)
                             if audio_blob
                             else None
                         )
@@ -562,7 +596,7 @@ CRITICAL REQUIREMENTS:
         if llm_language != template_language:
             logger.info(f"   🔄 语言代码映射: {template_language} (TTS) → {llm_language} (LLM)")
         
-        script: PodcastScript = script_generator.generate_script(
+        script: PodcastScript = await script_generator.generate_script_async(
             topic=request.topic,
             num_speakers=num_speakers,
             duration_minutes=request.duration_minutes,
@@ -572,7 +606,8 @@ CRITICAL REQUIREMENTS:
             speaker_names=speaker_names,  # 现在是 None，让 LLM 生成
             template_speaker_ids=template_speaker_ids,  # ✅ 传递 template 中的讲话人 ID
             additional_context=final_context,  # ✅ 包含源内容
-            custom_instructions=custom_inst
+            custom_instructions=custom_inst,
+            use_cache=request.use_cache,
         )
         
         logger.info(f"✅ 脚本生成成功")
@@ -584,7 +619,7 @@ CRITICAL REQUIREMENTS:
         logger.info(f"\n4️⃣ 保存脚本...")
         
         script_path = generated_scripts_dir / f"{podcast_id}_script.json"
-        script_generator.save_script(script, str(script_path))
+        await asyncio.to_thread(script_generator.save_script, script, str(script_path))
         logger.info(f"✅ 脚本已保存: {script_path}")
 
         script_uri = str(script_path)
@@ -593,7 +628,7 @@ CRITICAL REQUIREMENTS:
                 if not cache_prefix:
                     raise RuntimeError("GCS 已启用但未生成 cache_key_prefix")
                 script_blob = f"{cache_prefix}/script.json"
-                script_uri = GCSUploader.upload_file(
+                script_uri = await gcs_utils.upload_file_async(
                     local_path=script_path,
                     bucket_name=gcs_bucket_name,
                     destination_path=script_blob,
@@ -654,17 +689,23 @@ CRITICAL REQUIREMENTS:
                     
                     logger.info(f"  ✅ 已从 template 配置 {len(speaker_voice_map)} 个讲话人声音")
                 
-                # 使用合成器生成音频（返回 tuple: path, tts_chars, duration, file_size）
-                output_path, tts_character_count, audio_duration_seconds, audio_file_size_bytes = synthesizer.generate_from_script(
+                # 已配置 GCS 时音频直接从内存上传，仅在 DEBUG_KEEP_LOCAL 时额外落盘
+                keep_local = not gcs_bucket_name or get_config().debug_keep_local
+                
+                # 使用合成器生成音频（返回 tuple: path, tts_chars, duration, file_size, buffer）
+                # TTS 调用与 ffmpeg MP3 导出均为阻塞操作，放到线程中执行以免卡住事件循环
+                output_path, tts_character_count, audio_duration_seconds, audio_file_size_bytes, audio_buffer = await asyncio.to_thread(
+                    synthesizer.generate_from_script,
                     script_data=script_data,
                     podcast_name=None,  # None 会自动从脚本标题生成名称
-                    speaker_voice_map=speaker_voice_map
+                    speaker_voice_map=speaker_voice_map,
+                    keep_local=keep_local,
                 )
                 
-                if output_path and Path(output_path).exists():
-                    audio_file = str(output_path)
+                if audio_buffer is not None and audio_file_size_bytes:
+                    audio_file = str(output_path) if output_path else None
                     file_size_mb = audio_file_size_bytes / 1024 / 1024
-                    logger.info(f"✅ 音频已生成: {output_path}")
+                    logger.info(f"✅ 音频已生成: {output_path or '(内存)'}")
                     logger.info(f"   文件大小: {file_size_mb:.2f} MB")
                     logger.info(f"   TTS字符数: {tts_character_count}")
                     logger.info(f"   音频时长: {audio_duration_seconds:.1f}秒")
@@ -675,14 +716,28 @@ CRITICAL REQUIREMENTS:
                             if not cache_prefix:
                                 raise RuntimeError("GCS 已启用但未生成 cache_key_prefix")
                             audio_blob = f"{cache_prefix}/audio.mp3"
-                            audio_uri = GCSUploader.upload_file(
-                                local_path=Path(output_path),
+                            audio_uri = await asyncio.to_thread(
+                                gcs_utils.upload_fileobj,
+                                fileobj=audio_buffer,
                                 bucket_name=gcs_bucket_name,
                                 destination_path=audio_blob,
+                                content_type="audio/mpeg",
                             )
                             logger.info(f"☁️ 音频已上传至 GCS: {audio_uri}")
                         except Exception as upload_err:
                             logger.error(f"❌ 音频上传 GCS 失败: {upload_err}", exc_info=True)
+                            # 上传失败时把内存中的音频落盘，避免结果丢失
+                            if output_path is None:
+                                output_path = synthesizer.output_dir / f"{podcast_id}.mp3"
+                                try:
+                                    await asyncio.to_thread(output_path.write_bytes, audio_buffer.getvalue())
+                                except OSError as write_err:
+                                    logger.error(f"❌ 音频本地保存失败: {write_err}")
+                                    output_path = None
+                            if output_path is not None:
+                                audio_file = str(output_path)
+                                audio_uri = audio_file
+                                logger.warning(f"⚠️  音频已保存在本地: {audio_file}")
                     else:
                         logger.debug("GCS_BUCKET_NAME 未配置，跳过音频上传。")
                 else:
@@ -701,7 +756,7 @@ CRITICAL REQUIREMENTS:
             try:
                 bucket_and_path = script_uri.replace('gs://', '')
                 bucket, blob_path = bucket_and_path.split('/', 1)
-                script_signed_url = GCSUploader.generate_signed_url(
+                script_signed_url = gcs_utils.generate_signed_url(
                     bucket_name=bucket,
                     blob_name=blob_path,
                     expiration_hours=24
@@ -715,7 +770,7 @@ CRITICAL REQUIREMENTS:
             try:
                 bucket_and_path = audio_uri.replace('gs://', '')
                 bucket, blob_path = bucket_and_path.split('/', 1)
-                audio_signed_url = GCSUploader.generate_signed_url(
+                audio_signed_url = gcs_utils.generate_signed_url(
                     bucket_name=bucket,
                     blob_name=blob_path,
                     expiration_hours=24
@@ -795,29 +850,28 @@ CRITICAL REQUIREMENTS:
             try:
                 script_blob = f"{cache_prefix}/script.json"
                 audio_blob = f"{cache_prefix}/audio.mp3" if (audio_uri and str(audio_uri).startswith("gs://")) else ""
-                manifest = {
-                    "version": 1,
-                    "podcast_id": podcast_id,
-                    "podcast_name": podcast_name,
-                    "topic": request.topic,
-                    "style": request.style_name,
-                    "tone": tone.value,
-                    "dialogue_style": dialogue_style.value,
-                    "duration_minutes": request.duration_minutes,
-                    "language": request.language,
-                    "num_speakers": num_speakers,
-                    "script_blob": script_blob,
-                    "audio_blob": audio_blob,
-                    "script_preview": response.script_preview,
-                    "token_usage": response.token_usage,
-                    "tts_character_count": response.tts_character_count,
-                    "cost_breakdown": response.cost_breakdown,
-                    "audio_duration_seconds": response.audio_duration_seconds,
-                    "audio_file_size_bytes": response.audio_file_size_bytes,
-                    "created_at": datetime.now().isoformat(),
-                    "stockflow_params": request.manifest_params or None,
-                }
-                GCSUploader.upload_json(gcs_bucket_name, f"{cache_prefix}/manifest.json", manifest)
+                manifest = ManifestModel(
+                    podcast_id=podcast_id,
+                    podcast_name=podcast_name,
+                    topic=request.topic,
+                    style=request.style_name,
+                    tone=tone.value,
+                    dialogue_style=dialogue_style.value,
+                    duration_minutes=request.duration_minutes,
+                    language=request.language,
+                    num_speakers=num_speakers,
+                    script_blob=script_blob,
+                    audio_blob=audio_blob,
+                    script_preview=response.script_preview,
+                    token_usage=response.token_usage,
+                    tts_character_count=response.tts_character_count,
+                    cost_breakdown=response.cost_breakdown,
+                    audio_duration_seconds=response.audio_duration_seconds,
+                    audio_file_size_bytes=response.audio_file_size_bytes,
+                    created_at=datetime.now(),
+                    stockflow_params=request.manifest_params or None,
+                ).model_dump(mode="json", exclude_none=True)
+                gcs_utils.upload_json(gcs_bucket_name, f"{cache_prefix}/manifest.json", manifest)
                 logger.info(f"✅ 已写入 manifest: gs://{gcs_bucket_name}/{cache_prefix}/manifest.json")
             except Exception as manifest_err:
                 logger.error(f"❌ 写入缓存 manifest 失败: {manifest_err}", exc_info=True)
@@ -837,22 +891,25 @@ async def get_script(podcast_id: str):
     
     script_path = generated_scripts_dir / f"{podcast_id}_script.json"
     
-    if not script_path.exists():
+    # 使用异步文件 I/O，避免磁盘读取阻塞事件循环
+    if not await aiofiles.os.path.exists(script_path):
         raise HTTPException(
             status_code=404,
             detail=f"脚本不存在: {podcast_id}"
         )
     
-    with open(script_path, 'r', encoding='utf-8') as f:
-        script_data = json.load(f)
+    async with aiofiles.open(script_path, 'rb') as f:
+        raw = await f.read()
+    script_data = orjson.loads(raw)
     
-    return ScriptResponse(
-        podcast_id=podcast_id,
-        podcast_name=script_data.get("title", "Unknown"),
-        topic=script_data.get("topic", ""),
-        script=script_data,
-        created_at=datetime.now()
-    )
+    # 脚本内容原样透传，直接用 orjson 序列化，跳过 pydantic 校验与 jsonable_encoder
+    return ORJSONResponse({
+        "podcast_id": podcast_id,
+        "podcast_name": script_data.get("title", "Unknown"),
+        "topic": script_data.get("topic", ""),
+        "script": script_data,
+        "created_at": datetime.now(),
+    })
 
 @app.get("/v4")
 async def root():
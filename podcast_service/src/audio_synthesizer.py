@@ -1,26 +1,30 @@
 #!/usr/bin/env python3
 """
 音频合成器 - 将播客脚本合成为 MP3 音频
-使用 Google Cloud Text-to-Speech 和 pydub 的方式
-（复用昨天验证过的技术）
+使用 Google Cloud Text-to-Speech 合成 LINEAR16 PCM，
+拼接后通过单次 ffmpeg 调用编码为 MP3
 """
 
 import os
 import io
+import re
+import wave
+import functools
 import logging
+import subprocess
 from pathlib import Path
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 from datetime import datetime
 
 from google.cloud import texttospeech
-from pydub import AudioSegment
 
 # Import cost calculator
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from cost_calculator import UsageMetrics
+from src.llm_script_generator import ssml_char_count
 
 # ============================================================================
 # 日志配置
@@ -32,27 +36,124 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# PCM 音频参数（TTS 输出 16-bit 单声道 LINEAR16）
+_SAMPLE_RATE_HZ = 22050
+_SAMPLE_WIDTH_BYTES = 2
+_MP3_BITRATE = '192k'
+
+# 文件名清洗：非字母数字（含下划线）的连续字符统一替换为单个下划线
+_FILENAME_SANITIZE = re.compile(r'[\W_]+')
+
+
+@functools.lru_cache(maxsize=8)
+def _silence(pause_ms: int, frame_rate: int) -> bytes:
+    """生成指定时长的 16-bit 单声道静音 PCM（按停顿时长和采样率缓存复用）"""
+    num_frames = frame_rate * pause_ms // 1000
+    return b'\x00' * (num_frames * _SAMPLE_WIDTH_BYTES)
+
+
+@functools.lru_cache(maxsize=512)
+def _title_to_filename(title: str) -> str:
+    """将脚本标题转换为文件名描述（小写，只保留字母、数字，以下划线分隔）"""
+    return _FILENAME_SANITIZE.sub('_', title.lower()).strip('_')
+
 # ============================================================================
 # 数据模型
 # ============================================================================
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SpeakerVoiceConfig:
-    """讲话人声音配置"""
+    """讲话人声音配置（不可变，可在合成器实例间共享）"""
     speaker_id: str
     speaker_name: str
     language_code: str
     voice_name: str
     ssml_gender: texttospeech.SsmlVoiceGender
 
+# ============================================================================
+# 默认声音映射（导入时构建一次，所有合成器实例共享）
+# ============================================================================
+
+_VOICE_MAPS: Dict[str, Dict[str, SpeakerVoiceConfig]] = {
+    'en-US': {
+        'speaker_1': SpeakerVoiceConfig(
+            speaker_id='speaker_1',
+            speaker_name='Speaker 1',
+            language_code='en-US',
+            voice_name='en-US-Neural2-I',  # 男性
+            ssml_gender=texttospeech.SsmlVoiceGender.MALE,
+        ),
+        'speaker_2': SpeakerVoiceConfig(
+            speaker_id='speaker_2',
+            speaker_name='Speaker 2',
+            language_code='en-US',
+            voice_name='en-US-Neural2-F',  # 女性
+            ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
+        ),
+        'speaker_3': SpeakerVoiceConfig(
+            speaker_id='speaker_3',
+            speaker_name='Speaker 3',
+            language_code='en-US',
+            voice_name='en-US-Neural2-J',  # 男性
+            ssml_gender=texttospeech.SsmlVoiceGender.MALE,
+        ),
+    },
+    'ko-KR': {
+        'speaker_1': SpeakerVoiceConfig(
+            speaker_id='speaker_1',
+            speaker_name='Speaker 1',
+            language_code='ko-KR',
+            voice_name='ko-KR-Neural2-A',  # 男性
+            ssml_gender=texttospeech.SsmlVoiceGender.MALE,
+        ),
+        'speaker_2': SpeakerVoiceConfig(
+            speaker_id='speaker_2',
+            speaker_name='Speaker 2',
+            language_code='ko-KR',
+            voice_name='ko-KR-Neural2-B',  # 女性
+            ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
+        ),
+        'speaker_3': SpeakerVoiceConfig(
+            speaker_id='speaker_3',
+            speaker_name='Speaker 3',
+            language_code='ko-KR',
+            voice_name='ko-KR-Neural2-C',  # 男性
+            ssml_gender=texttospeech.SsmlVoiceGender.MALE,
+        ),
+    },
+    'zh-CN': {
+        'speaker_1': SpeakerVoiceConfig(
+            speaker_id='speaker_1',
+            speaker_name='Speaker 1',
+            language_code='zh-CN',
+            voice_name='cmn-CN-Neural2-A',  # 男性
+            ssml_gender=texttospeech.SsmlVoiceGender.MALE,
+        ),
+        'speaker_2': SpeakerVoiceConfig(
+            speaker_id='speaker_2',
+            speaker_name='Speaker 2',
+            language_code='zh-CN',
+            voice_name='cmn-CN-Neural2-B',  # 女性
+            ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
+        ),
+        'speaker_3': SpeakerVoiceConfig(
+            speaker_id='speaker_3',
+            speaker_name='Speaker 3',
+            language_code='zh-CN',
+            voice_name='cmn-CN-Neural2-D',  # 男性
+            ssml_gender=texttospeech.SsmlVoiceGender.MALE,
+        ),
+    },
+}
+
 # ============================================================================
 # 音频合成器
 # ============================================================================
 
 class AudioSynthesizer:
     """
-    使用 Google Cloud TTS 和 pydub 合成播客音频
-    这是昨天验证过的成功方法
+    使用 Google Cloud TTS 合成播客音频
+    各段落以 PCM 形式拼接，最后只调用一次 ffmpeg 编码为 MP3
     """
     
     def __init__(self, project_id: str = None):
@@ -62,17 +163,17 @@ class AudioSynthesizer:
         self.output_dir = Path('data/generated_podcasts')
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
-        # 音频配置（与昨天相同）
+        # 音频配置：直接取 PCM，避免逐段 MP3 解码
         self.audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            sample_rate_hertz=22050,
+            audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+            sample_rate_hertz=_SAMPLE_RATE_HZ,
             speaking_rate=1.0,
             pitch=0.0,
         )
         
         logger.info(f"✅ 音频合成器初始化完成 (项目: {self.project_id})")
     
-    def synthesize_segment(self, ssml_text: str, voice_config: SpeakerVoiceConfig) -> tuple:
+    def synthesize_segment(self, ssml_text: str, voice_config: SpeakerVoiceConfig) -> bytes:
         """
         合成单个音频段落
         
@@ -81,7 +182,7 @@ class AudioSynthesizer:
             voice_config: 讲话人声音配置
         
         Returns:
-            (MP3字节数据, 字符数)
+            PCM字节数据
         """
         try:
             request = texttospeech.SynthesizeSpeechRequest(
@@ -95,11 +196,7 @@ class AudioSynthesizer:
             )
             
             response = self.client.synthesize_speech(request=request)
-            # Count characters in SSML text (excluding SSML tags)
-            import re
-            text_only = re.sub(r'<[^>]+>', '', ssml_text)
-            char_count = len(text_only)
-            return response.audio_content, char_count
+            return self._wav_to_pcm(response.audio_content)
         
         except Exception as e:
             logger.error(f"❌ 合成失败 ({voice_config.speaker_name}): {e}")
@@ -109,18 +206,23 @@ class AudioSynthesizer:
         self,
         script_data: Dict,
         podcast_name: str = None,
-        speaker_voice_map: Dict[str, SpeakerVoiceConfig] = None
+        speaker_voice_map: Dict[str, SpeakerVoiceConfig] = None,
+        keep_local: bool = True,
     ) -> tuple:
         """
         从脚本数据生成完整播客 MP3
         
+        MP3 直接导出到内存缓冲区，调用方可将其直接上传到 GCS，
+        无需先写盘再读回；仅在 keep_local=True 时才额外落盘。
+        
         Args:
             script_data: LLMScriptGenerator 生成的脚本 JSON
             podcast_name: 播客名称（自动生成如果为空）
             speaker_voice_map: 讲话人到声音的映射
+            keep_local: 是否同时在 output_dir 保留本地 MP3 文件
         
         Returns:
-            (生成的MP3文件路径, TTS字符数, 音频时长秒, 文件大小字节)
+            (本地MP3文件路径或None, TTS字符数, 音频时长秒, 文件大小字节, MP3内存缓冲区)
         """
         
         # 生成文件名：podcast_{内容描述}_{时间戳}
@@ -128,14 +230,7 @@ class AudioSynthesizer:
         
         if not podcast_name:
             # 从脚本标题生成描述（去除特殊字符，只保留字母、数字、下划线）
-            title = script_data.get('title', 'podcast')
-            # 将标题转为小写，替换空格和特殊字符为下划线
-            description = ''.join(
-                c if c.isalnum() or c == '_' else '_' 
-                for c in title.lower()
-            )
-            # 移除连续的下划线
-            description = '_'.join(filter(None, description.split('_')))
+            description = _title_to_filename(script_data.get('title', 'podcast'))
             podcast_name = f"podcast_{description}_{timestamp}"
         else:
             podcast_name = f"podcast_{podcast_name}_{timestamp}"
@@ -160,88 +255,120 @@ class AudioSynthesizer:
         segments = script_data.get('segments', [])
         total_tts_chars = 0
         
-        logger.info(f"正在合成 {len(segments)} 个对话段落...\n")
-        
+        # 先一次性校验所有段落，再进入 TTS 调用，避免在已消耗部分 RPC 后才发现配置缺失
+        valid_segments = []
         for idx, segment in enumerate(segments, 1):
-            speaker_id = segment.get('speaker_id')
-            speaker_name = segment.get('speaker_name')
-            ssml_text = segment.get('ssml_text')
-            
-            if not ssml_text:
-                logger.warning(f"[{idx}/{len(segments)}] ⚠️  无 SSML 文本: {speaker_name}")
+            if not segment.get('ssml_text'):
+                logger.warning(f"[{idx}/{len(segments)}] ⚠️  无 SSML 文本: {segment.get('speaker_name')}")
                 continue
-            
-            # 获取声音配置
-            voice_config = speaker_voice_map.get(speaker_id)
+            voice_config = speaker_voice_map.get(segment.get('speaker_id'))
             if not voice_config:
-                logger.warning(f"[{idx}/{len(segments)}] ⚠️  无声音配置: {speaker_id}")
+                logger.warning(f"[{idx}/{len(segments)}] ⚠️  无声音配置: {segment.get('speaker_id')}")
                 continue
-            
-            logger.info(f"[{idx}/{len(segments)}] 合成 {speaker_name} ({voice_config.voice_name})")
+            valid_segments.append((idx, segment, voice_config))
+        
+        if not valid_segments:
+            raise ValueError("没有可合成的音频段落（缺少 SSML 文本或声音配置）")
+        
+        logger.info(f"正在合成 {len(valid_segments)}/{len(segments)} 个对话段落...\n")
+        
+        for idx, segment, voice_config in valid_segments:
+            ssml_text = segment['ssml_text']
+            logger.info(f"[{idx}/{len(segments)}] 合成 {segment.get('speaker_name')} ({voice_config.voice_name})")
             
             try:
-                # 合成 - 现在返回 (audio_bytes, char_count)
-                audio_bytes, char_count = self.synthesize_segment(ssml_text, voice_config)
+                pcm_bytes = self.synthesize_segment(ssml_text, voice_config)
+                # 字符数在脚本生成时已预先计算；旧脚本缺少该字段时才现场计算
+                char_count = segment.get('char_count')
+                if not char_count:
+                    char_count = ssml_char_count(ssml_text)
                 total_tts_chars += char_count
-                audio = AudioSegment.from_mp3(io.BytesIO(audio_bytes))
-                segments_audio.append(audio)
+                segments_audio.append(pcm_bytes)
                 
-                duration_sec = len(audio) / 1000
+                duration_sec = self._pcm_duration_seconds(pcm_bytes)
                 logger.info(f"              ✅ 成功 ({duration_sec:.1f}s, {char_count}字符)\n")
             
             except Exception as e:
                 logger.error(f"              ❌ 失败: {e}\n")
                 raise
         
-        if not segments_audio:
-            raise ValueError("没有成功合成的音频段落")
-        
         logger.info(f"✅ 所有段落合成完成\n")
         
         # 合并所有段落
         logger.info("📦 合并音频段落...")
         merged = self._merge_segments(segments_audio)
         
-        # 导出 MP3
-        output_file = self.output_dir / f"{podcast_name}.mp3"
-        merged.export(str(output_file), format='mp3', bitrate='192k')
+        # 编码 MP3 到内存（避免写盘再读回上传）
+        audio_buffer = io.BytesIO(self._encode_mp3(merged))
+        
+        output_file = None
+        if keep_local:
+            output_file = self.output_dir / f"{podcast_name}.mp3"
+            output_file.write_bytes(audio_buffer.getbuffer())
         
         # 统计信息
-        duration_sec = len(merged) / 1000
-        file_size_bytes = output_file.stat().st_size
+        duration_sec = self._pcm_duration_seconds(merged)
+        file_size_bytes = audio_buffer.getbuffer().nbytes
         file_size_mb = file_size_bytes / (1024 * 1024)
         
         logger.info(f"✅ 播客生成成功!")
-        logger.info(f"   输出文件: {output_file.name}")
+        logger.info(f"   输出文件: {output_file.name if output_file else '(内存)'}")
         logger.info(f"   文件大小: {file_size_mb:.2f} MB")
         logger.info(f"   实际时长: {int(duration_sec // 60)}分{int(duration_sec % 60)}秒")
         logger.info(f"   TTS字符数: {total_tts_chars}")
         logger.info("")
         
-        return output_file, total_tts_chars, duration_sec, file_size_bytes
+        return output_file, total_tts_chars, duration_sec, file_size_bytes, audio_buffer
     
-    def _merge_segments(self, segments: List[AudioSegment], pause_ms: int = 200) -> AudioSegment:
+    def _merge_segments(self, segments: List[bytes], pause_ms: int = 200) -> bytes:
         """
-        合并音频段落
+        合并音频段落（PCM 直接拼接，段落间插入静音帧）
         
         Args:
-            segments: 音频段落列表
+            segments: PCM 音频段落列表
             pause_ms: 段落间停顿时长（毫秒）
         
         Returns:
-            合并后的音频
+            合并后的 PCM 数据
         """
         if not segments:
             raise ValueError("没有音频段落可合并")
         
-        silence = AudioSegment.silent(duration=pause_ms)
+        return _silence(pause_ms, _SAMPLE_RATE_HZ).join(segments)
+    
+    @staticmethod
+    def _wav_to_pcm(audio_content: bytes) -> bytes:
+        """去掉 LINEAR16 响应中的 WAV 头，返回原始 PCM 帧"""
+        with wave.open(io.BytesIO(audio_content), 'rb') as wav:
+            return wav.readframes(wav.getnframes())
+    
+    @staticmethod
+    def _pcm_duration_seconds(pcm: bytes) -> float:
+        """根据 PCM 字节数计算时长（秒）"""
+        return len(pcm) / (_SAMPLE_RATE_HZ * _SAMPLE_WIDTH_BYTES)
+    
+    @staticmethod
+    def _encode_mp3(pcm: bytes) -> bytes:
+        """
+        通过单个 ffmpeg 进程将 PCM 编码为 MP3（stdin 输入，stdout 输出）
         
-        merged = segments[0]
-        for segment in segments[1:]:
-            merged += silence
-            merged += segment
+        Args:
+            pcm: 16-bit 单声道 PCM 数据
         
-        return merged
+        Returns:
+            MP3 字节数据
+        """
+        cmd = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-f', 's16le', '-ar', str(_SAMPLE_RATE_HZ), '-ac', '1', '-i', 'pipe:0',
+            '-b:a', _MP3_BITRATE, '-f', 'mp3', 'pipe:1',
+        ]
+        result = subprocess.run(cmd, input=pcm, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg 编码 MP3 失败: {result.stderr.decode('utf-8', errors='replace').strip()}"
+            )
+        return result.stdout
     
     def _get_default_voice_map(
         self,
@@ -259,86 +386,12 @@ class AudioSynthesizer:
             讲话人 ID 到声音配置的映射
         """
         
-        voice_maps = {
-            'en-US': {
-                'speaker_1': SpeakerVoiceConfig(
-                    speaker_id='speaker_1',
-                    speaker_name='Speaker 1',
-                    language_code='en-US',
-                    voice_name='en-US-Neural2-I',  # 男性
-                    ssml_gender=texttospeech.SsmlVoiceGender.MALE,
-                ),
-                'speaker_2': SpeakerVoiceConfig(
-                    speaker_id='speaker_2',
-                    speaker_name='Speaker 2',
-                    language_code='en-US',
-                    voice_name='en-US-Neural2-F',  # 女性
-                    ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
-                ),
-                'speaker_3': SpeakerVoiceConfig(
-                    speaker_id='speaker_3',
-                    speaker_name='Speaker 3',
-                    language_code='en-US',
-                    voice_name='en-US-Neural2-J',  # 男性
-                    ssml_gender=texttospeech.SsmlVoiceGender.MALE,
-                ),
-            },
-            'ko-KR': {
-                'speaker_1': SpeakerVoiceConfig(
-                    speaker_id='speaker_1',
-                    speaker_name='Speaker 1',
-                    language_code='ko-KR',
-                    voice_name='ko-KR-Neural2-A',  # 男性
-                    ssml_gender=texttospeech.SsmlVoiceGender.MALE,
-                ),
-                'speaker_2': SpeakerVoiceConfig(
-                    speaker_id='speaker_2',
-                    speaker_name='Speaker 2',
-                    language_code='ko-KR',
-                    voice_name='ko-KR-Neural2-B',  # 女性
-                    ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
-                ),
-                'speaker_3': SpeakerVoiceConfig(
-                    speaker_id='speaker_3',
-                    speaker_name='Speaker 3',
-                    language_code='ko-KR',
-                    voice_name='ko-KR-Neural2-C',  # 男性
-                    ssml_gender=texttospeech.SsmlVoiceGender.MALE,
-                ),
-            },
-            'zh-CN': {
-                'speaker_1': SpeakerVoiceConfig(
-                    speaker_id='speaker_1',
-                    speaker_name='Speaker 1',
-                    language_code='zh-CN',
-                    voice_name='cmn-CN-Neural2-A',  # 男性
-                    ssml_gender=texttospeech.SsmlVoiceGender.MALE,
-                ),
-                'speaker_2': SpeakerVoiceConfig(
-                    speaker_id='speaker_2',
-                    speaker_name='Speaker 2',
-                    language_code='zh-CN',
-                    voice_name='cmn-CN-Neural2-B',  # 女性
-                    ssml_gender=texttospeech.SsmlVoiceGender.FEMALE,
-                ),
-                'speaker_3': SpeakerVoiceConfig(
-                    speaker_id='speaker_3',
-                    speaker_name='Speaker 3',
-                    language_code='zh-CN',
-                    voice_name='cmn-CN-Neural2-D',  # 男性
-                    ssml_gender=texttospeech.SsmlVoiceGender.MALE,
-                ),
-            },
-        }
-        
         # 获取该语言的映射，或使用英文作为备选
-        voice_map_for_lang = voice_maps.get(language_code, voice_maps['en-US'])
+        voice_map_for_lang = _VOICE_MAPS.get(language_code, _VOICE_MAPS['en-US'])
         
         # 返回需要的讲话人数量
-        result = {}
-        for i in range(1, num_speakers + 1):
-            speaker_id = f'speaker_{i}'
-            if speaker_id in voice_map_for_lang:
-                result[speaker_id] = voice_map_for_lang[speaker_id]
-        
-        return result
+        return {
+            speaker_id: voice_map_for_lang[speaker_id]
+            for speaker_id in (f'speaker_{i}' for i in range(1, num_speakers + 1))
+            if speaker_id in voice_map_for_lang
+        }
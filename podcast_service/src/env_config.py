@@ -6,13 +6,52 @@
 import os
 import sys
 import logging
+import functools
+from functools import cached_property
 from pathlib import Path
 from typing import Optional, Dict, Any
-from dotenv import load_dotenv, find_dotenv
+from dotenv import dotenv_values, find_dotenv
 
 # 设置日志
 logger = logging.getLogger(__name__)
 
+# .env 文件搜索路径（按优先级，导入时计算一次）
+_ENV_SEARCH_PATHS = (
+    '.env',  # 当前目录
+    str(Path.cwd() / '.env'),  # 工作目录
+    str(Path(__file__).parent / '.env'),  # 脚本所在目录
+    str(Path(__file__).parent.parent / '.env'),  # 上一级目录
+)
+
+
+# 布尔型变量视为 True 的取值
+_TRUTHY = frozenset({'true', '1', 'yes', 'on', 'y', 't'})
+
+
+def _parse_bool(value: str) -> bool:
+    """解析布尔型环境变量"""
+    return value.strip().lower() in _TRUTHY
+
+
+def _build_default_env_content(required_vars, optional_vars) -> str:
+    """生成默认 .env 文件内容"""
+    lines = [
+        "# 播客引擎 v4 - 环境配置",
+        "# ⚠️  请设置 OPENAI_API_KEY",
+        "",
+    ]
+    for key, default_value in optional_vars.items():
+        if default_value == '':
+            lines.append(f"# {key}=your-value-here")
+        else:
+            lines.append(f"{key}={default_value}")
+
+    # 添加必需变量（未设置）
+    lines.append("")
+    lines.append("# 必需配置（必须设置）")
+    lines.extend(f"# {var}=your-actual-value-here" for var in required_vars)
+    return "\n".join(lines) + "\n"
+
 
 class EnvConfig:
     """环境变量配置类 - 自动加载和管理所有环境变量"""
@@ -33,6 +72,7 @@ class EnvConfig:
         'LLM_MAX_TOKENS': '4000',
         'TTS_ENGINE': 'google-cloud',  # 使用 Google Cloud TTS (已验证质量)
         'TTS_VOICE_ID': 'default',
+        'TTS_RPM': '1000',  # TTS 每分钟请求上限（按项目配额设置）
         'DATA_DIR': 'data',
         'SCRIPTS_DIR': 'data/generated_scripts',
         'PODCASTS_DIR': 'data/generated_podcasts',
@@ -40,58 +80,74 @@ class EnvConfig:
         'MAX_CONCURRENT_REQUESTS': '5',
         'REQUEST_TIMEOUT': '300',
         'DEBUG': 'false',
+        'DEBUG_KEEP_LOCAL': 'false',  # 已配置 GCS 时是否仍在本地保留音频文件
         'ENVIRONMENT': 'production',
         'GCS_BUCKET_NAME': '',
     }
 
+    # 类定义时预先展开为元组，构造实例时直接遍历
+    _REQUIRED_TUPLE: tuple = tuple(REQUIRED_VARS)
+    _OPTIONAL_ITEMS: tuple = tuple(OPTIONAL_VARS.items())
+
+    # 需要类型转换的变量：加载时解析一次，属性访问时直接返回
+    TYPED_VARS = {
+        'API_PORT': int,
+        'LLM_TEMPERATURE': float,
+        'LLM_MAX_TOKENS': int,
+        'MAX_CONCURRENT_REQUESTS': int,
+        'REQUEST_TIMEOUT': int,
+        'DEBUG': _parse_bool,
+        'DEBUG_KEEP_LOCAL': _parse_bool,
+        'GCS_BUCKET_NAME': str.strip,
+    }
+
+    # 默认 .env 文件内容（类定义时生成一次）
+    _DEFAULT_ENV_CONTENT = _build_default_env_content(REQUIRED_VARS, OPTIONAL_VARS)
+
     def __init__(self, env_file: Optional[str] = None, auto_create: bool = True):
         """
         初始化环境配置
         
+        配置在初始化后即固定：带类型的变量在加载时由 _parse_typed_vars 一次性解析，
+        下方的属性访问器直接返回解析好的值。
+        
         Args:
             env_file: .env 文件路径，如果为 None 将自动搜索
             auto_create: 是否自动在项目根目录创建 .env 文件
         """
         self._env_file = env_file or self._find_env_file()
         self._config: Dict[str, Any] = {}
+        self._typed: Dict[str, Any] = {}
         self._load_config(auto_create)
 
     @staticmethod
-    def _find_env_file() -> str:
-        """自动查找 .env 文件"""
-        # 按优先级搜索
-        search_paths = [
-            '.env',  # 当前目录
-            Path.cwd() / '.env',  # 工作目录
-            Path(__file__).parent / '.env',  # 脚本所在目录
-            Path(__file__).parent.parent / '.env',  # 上一级目录
-        ]
-
-        for path in search_paths:
-            path = Path(path)
-            if path.exists():
-                logger.info(f"✅ 找到 .env 文件: {path.absolute()}")
-                return str(path)
+    @functools.lru_cache(maxsize=1)
+    def _find_env_file() -> Optional[str]:
+        """自动查找 .env 文件（结果进程内缓存）"""
+        for path in _ENV_SEARCH_PATHS:
+            if os.path.isfile(path):
+                logger.info("✅ 找到 .env 文件: %s", os.path.abspath(path))
+                return path
 
         logger.warning("⚠️  未找到 .env 文件，将使用系统环境变量")
         return None
 
     def _load_config(self, auto_create: bool = True):
         """加载和验证配置"""
-        # 第一步：加载 .env 文件
+        # 第一步：加载 .env 文件（每个文件只解析一次，不覆盖已存在的系统环境变量）
         if self._env_file:
-            load_dotenv(self._env_file, override=False)
-            logger.info(f"📄 已加载 .env 文件: {self._env_file}")
+            self._apply_env_file(self._env_file)
+            logger.info("📄 已加载 .env 文件: %s", self._env_file)
         else:
-            # 尝试查找 .env 文件
+            # 常用位置都没有时，再用 find_dotenv() 向上查找父目录中的 .env
             dotenv_path = find_dotenv()
             if dotenv_path:
-                load_dotenv(dotenv_path, override=False)
-                logger.info(f"📄 已加载 .env 文件: {dotenv_path}")
+                self._apply_env_file(dotenv_path)
+                logger.info("📄 已加载 .env 文件: %s", dotenv_path)
             elif auto_create:
                 logger.warning("⚠️  未找到 .env 文件，将自动创建...")
                 self._create_default_env()
-                load_dotenv('.env', override=False)
+                self._apply_env_file('.env')
             else:
                 logger.warning("⚠️  未找到 .env 文件，使用系统环境变量")
 
@@ -101,28 +157,27 @@ class EnvConfig:
         # 第三步：加载所有变量
         self._load_all_vars()
 
+        # 第四步：解析带类型的变量
+        self._parse_typed_vars()
+
+    @staticmethod
+    def _read_env_file(env_file: str) -> Dict[str, str]:
+        """读取 .env 文件为 key→value 字典（文件只有十几行，每次直接解析）"""
+        return {k: v for k, v in dotenv_values(env_file).items() if v is not None}
+
+    def _apply_env_file(self, env_file: str):
+        """将 .env 中的变量写入 os.environ（不覆盖已存在的系统环境变量）"""
+        env = os.environ
+        new_vars = {k: v for k, v in self._read_env_file(env_file).items() if k not in env}
+        if new_vars:
+            env.update(new_vars)
+
     def _create_default_env(self):
         """创建默认的 .env 文件"""
         try:
             env_path = Path('.env')
-            
-            # 生成内容
-            content = "# 播客引擎 v4 - 环境配置\n"
-            content += "# ⚠️  请设置 OPENAI_API_KEY\n\n"
-            
-            for key, default_value in self.OPTIONAL_VARS.items():
-                if default_value == '':
-                    content += f"# {key}=your-value-here\n"
-                else:
-                    content += f"{key}={default_value}\n"
-            
-            # 添加必需变量（未设置）
-            content += "\n# 必需配置（必须设置）\n"
-            for var in self.REQUIRED_VARS:
-                content += f"# {var}=your-actual-value-here\n"
-            
-            env_path.write_text(content)
-            logger.info(f"✅ 已创建 .env 文件: {env_path.absolute()}")
+            env_path.write_text(self._DEFAULT_ENV_CONTENT)
+            logger.info("✅ 已创建 .env 文件: %s", env_path.absolute())
             logger.warning("⚠️  请在 .env 文件中设置 OPENAI_API_KEY")
             
         except Exception as e:
@@ -130,11 +185,8 @@ class EnvConfig:
 
     def _validate_required_vars(self):
         """验证必需的环境变量是否已设置"""
-        missing = []
-        
-        for var in self.REQUIRED_VARS:
-            if not os.getenv(var):
-                missing.append(var)
+        env = os.environ
+        missing = [var for var in self._REQUIRED_TUPLE if not env.get(var)]
         
         if missing:
             error_msg = f"❌ 缺少必需的环境变量: {', '.join(missing)}"
@@ -147,21 +199,34 @@ class EnvConfig:
 
     def _load_all_vars(self):
         """加载所有环境变量"""
+        env = os.environ
+        
         # 加载必需变量
-        for var in self.REQUIRED_VARS:
-            value = os.getenv(var)
+        for var in self._REQUIRED_TUPLE:
+            value = env.get(var)
             if value:
                 # 对于 API Key，只显示前缀
                 display_value = value[:10] + '...' if len(value) > 10 else value
-                logger.info(f"✅ {var}: {display_value}")
+                logger.info("✅ %s: %s", var, display_value)
             self._config[var] = value
 
         # 加载可选变量
-        for var, default in self.OPTIONAL_VARS.items():
-            value = os.getenv(var, default)
-            self._config[var] = value
-            if os.getenv(var):  # 只在用户自定义时显示
-                logger.debug(f"📌 {var}: {value}")
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        for var, default in self._OPTIONAL_ITEMS:
+            raw = env.get(var)
+            self._config[var] = raw if raw is not None else default
+            if raw and debug_enabled:  # 只在用户自定义时显示
+                logger.debug("📌 %s: %s", var, raw)
+
+    def _parse_typed_vars(self):
+        """将需要类型转换的变量一次性解析为对应类型"""
+        for var, caster in self.TYPED_VARS.items():
+            try:
+                self._typed[var] = caster(self._config[var])
+            except ValueError:
+                default = self.OPTIONAL_VARS[var]
+                logger.warning("⚠️  %s=%r 格式无效，使用默认值 %s", var, self._config[var], default)
+                self._typed[var] = caster(default)
 
     def get(self, key: str, default: Optional[Any] = None) -> Any:
         """获取配置值"""
@@ -175,40 +240,65 @@ class EnvConfig:
         """支持 in 操作符"""
         return key in self._config
 
-    @property
+    @cached_property
     def openai_api_key(self) -> str:
         """获取 OpenAI API Key"""
-        return self.get('OPENAI_API_KEY')
+        return self._config['OPENAI_API_KEY']
 
-    @property
+    @cached_property
     def api_host(self) -> str:
         """获取 API 主机"""
-        return self.get('API_HOST', '0.0.0.0')
+        return self._config['API_HOST']
 
-    @property
+    @cached_property
     def api_port(self) -> int:
         """获取 API 端口"""
-        return int(self.get('API_PORT', 8080))
+        return self._typed['API_PORT']
 
-    @property
+    @cached_property
     def log_level(self) -> str:
         """获取日志级别"""
-        return self.get('LOG_LEVEL', 'INFO')
+        return self._config['LOG_LEVEL']
 
-    @property
+    @cached_property
     def llm_model(self) -> str:
         """获取 LLM 模型名称"""
-        return self.get('LLM_MODEL', 'gpt-4o-mini')
+        return self._config['LLM_MODEL']
+
+    @cached_property
+    def llm_temperature(self) -> float:
+        """获取 LLM 温度"""
+        return self._typed['LLM_TEMPERATURE']
+
+    @cached_property
+    def llm_max_tokens(self) -> int:
+        """获取 LLM 最大输出 token 数"""
+        return self._typed['LLM_MAX_TOKENS']
 
-    @property
+    @cached_property
+    def max_concurrent_requests(self) -> int:
+        """获取最大并发请求数"""
+        return self._typed['MAX_CONCURRENT_REQUESTS']
+
+    @cached_property
+    def request_timeout(self) -> int:
+        """获取请求超时时间（秒）"""
+        return self._typed['REQUEST_TIMEOUT']
+
+    @cached_property
     def debug(self) -> bool:
         """获取调试模式"""
-        return self.get('DEBUG', 'false').lower() in ('true', '1', 'yes')
+        return self._typed['DEBUG']
+
+    @cached_property
+    def debug_keep_local(self) -> bool:
+        """获取是否在上传 GCS 后仍保留本地音频文件"""
+        return self._typed['DEBUG_KEEP_LOCAL']
 
-    @property
+    @cached_property
     def gcs_bucket_name(self) -> str:
         """获取 GCS 存储桶名称（可为空）"""
-        return self.get('GCS_BUCKET_NAME', '').strip()
+        return self._typed['GCS_BUCKET_NAME']
 
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -8,35 +8,81 @@ Google Cloud Storage 工具函数
 from __future__ import annotations
 
 import os
+import shutil
+import asyncio
+import mimetypes
+import functools
 import logging
-import requests
+import threading
 import datetime
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, BinaryIO, Dict, Optional
 from datetime import timedelta
 
-import google.auth
-from google.auth.transport.requests import Request as AuthRequest
-from google.cloud import storage
-from google.cloud.storage import Bucket
+# google-cloud-storage / google.auth / requests 导入开销较大，延迟到首次使用时再导入
+if TYPE_CHECKING:
+    import requests
+    from google.cloud import storage
+    from google.cloud.storage import Bucket
 
 logger = logging.getLogger(__name__)
 
+# 流式上传参数：GCS 要求 resumable 分块大小为 256 KiB 的整数倍；
+# 本地以 64 KiB 为单位读取并写入上传流
+_RESUMABLE_CHUNK_SIZE = 16 * 256 * 1024
+_COPY_BUFFER_SIZE = 64 * 1024
 
-class GCSUploader:
-    """简单的 GCS 上传器（单例形式复用 storage client）"""
+# 本地文件上传：超过阈值的文件以 8 MiB 分块做 resumable 上传
+_FILE_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+_FILE_STREAM_THRESHOLD = 1024 * 1024
+
+
+def _build_session() -> requests.Session:
+    """构建复用连接池的 HTTP 会话（用于元数据探测和凭证刷新）"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class _GCSUploader:
+    """GCS 上传器实现（通过模块级单例 _uploader 使用，复用 storage client）"""
+
+    def __init__(self) -> None:
+        self._client: Optional[storage.Client] = None
+        self._lock = threading.Lock()
+        self._bucket_cache: Dict[str, Bucket] = {}
+        self._session: Optional[requests.Session] = None
+
+    def _get_client(self) -> storage.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import storage
+
+                    self._client = storage.Client()
+        return self._client
 
-    _client: Optional[storage.Client] = None
+    def _get_session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = _build_session()
+        return self._session
 
-    @classmethod
-    def _get_client(cls) -> storage.Client:
-        if cls._client is None:
-            cls._client = storage.Client()
-        return cls._client
+    def _get_bucket(self, bucket_name: str) -> Bucket:
+        """按名称缓存 Bucket 句柄，避免每次调用都重新构造"""
+        bucket = self._bucket_cache.get(bucket_name)
+        if bucket is None:
+            bucket = self._bucket_cache.setdefault(bucket_name, self._get_client().bucket(bucket_name))
+        return bucket
 
-    @classmethod
     def upload_file(
-        cls,
+        self,
         local_path: Path,
         bucket_name: str,
         destination_path: str,
@@ -58,44 +104,95 @@ class GCSUploader:
         if not local_path.exists():
             raise FileNotFoundError(f"待上传的文件不存在: {local_path}")
 
-        client = cls._get_client()
-        bucket = client.bucket(bucket_name)
+        bucket = self._get_bucket(bucket_name)
+        size = local_path.stat().st_size
+        content_type = mimetypes.guess_type(local_path.name)[0]
+
+        logger.info("☁️  正在上传到 GCS: gs://%s/%s", bucket_name, destination_path)
+        if size > _FILE_STREAM_THRESHOLD:
+            # 大文件：固定分块的 resumable 上传，控制内存占用
+            blob = bucket.blob(destination_path, chunk_size=_FILE_UPLOAD_CHUNK_SIZE)
+            with open(local_path, "rb") as fp:
+                blob.upload_from_file(fp, size=size, rewind=False, content_type=content_type)
+        else:
+            blob = bucket.blob(destination_path)
+            blob.upload_from_filename(str(local_path), content_type=content_type)
+        logger.info("✅ 上传完成")
+
+        return f"gs://{bucket_name}/{destination_path}"
+
+    async def upload_file_async(
+        self,
+        local_path: Path,
+        bucket_name: str,
+        destination_path: str,
+    ) -> str:
+        """upload_file 的异步版本：在线程中执行上传，避免阻塞事件循环"""
+        return await asyncio.to_thread(
+            self.upload_file,
+            local_path=local_path,
+            bucket_name=bucket_name,
+            destination_path=destination_path,
+        )
+
+    def upload_fileobj(
+        self,
+        fileobj: BinaryIO,
+        bucket_name: str,
+        destination_path: str,
+        content_type: Optional[str] = None,
+    ) -> str:
+        """
+        将内存中的文件对象（如 io.BytesIO）直接上传到 GCS，不经过本地磁盘
+
+        通过 Blob.open('wb') 建立单个 resumable 上传会话，分块流式写入。
+
+        Args:
+            fileobj: 可读的二进制文件对象，会从头开始上传
+            bucket_name: 目标 GCS 存储桶名称
+            destination_path: 上传后的对象路径
+            content_type: 对象 Content-Type（例如 audio/mpeg）
+
+        Returns:
+            上传后的 gs:// URI
+        """
+        if not bucket_name:
+            raise ValueError("bucket_name 不能为空")
+
+        bucket = self._get_bucket(bucket_name)
         blob = bucket.blob(destination_path)
 
-        logger.info(f"☁️  正在上传到 GCS: gs://{bucket_name}/{destination_path}")
-        blob.upload_from_filename(str(local_path))
+        logger.info("☁️  正在上传到 GCS: gs://%s/%s", bucket_name, destination_path)
+        fileobj.seek(0)
+        with blob.open("wb", chunk_size=_RESUMABLE_CHUNK_SIZE, content_type=content_type) as writer:
+            shutil.copyfileobj(fileobj, writer, _COPY_BUFFER_SIZE)
         logger.info("✅ 上传完成")
 
         return f"gs://{bucket_name}/{destination_path}"
 
-    @classmethod
-    def blob_exists(cls, bucket_name: str, blob_name: str) -> bool:
+    def blob_exists(self, bucket_name: str, blob_name: str) -> bool:
         if not bucket_name:
             raise ValueError("bucket_name 不能为空")
         if not blob_name:
             raise ValueError("blob_name 不能为空")
-        client = cls._get_client()
-        bucket = client.bucket(bucket_name)
+        bucket = self._get_bucket(bucket_name)
         blob = bucket.blob(blob_name)
         return bool(blob.exists())
 
-    @classmethod
-    def download_json(cls, bucket_name: str, blob_name: str) -> dict:
+    def download_json(self, bucket_name: str, blob_name: str) -> dict:
         if not bucket_name:
             raise ValueError("bucket_name 不能为空")
         if not blob_name:
             raise ValueError("blob_name 不能为空")
-        client = cls._get_client()
-        bucket = client.bucket(bucket_name)
+        bucket = self._get_bucket(bucket_name)
         blob = bucket.blob(blob_name)
         raw = blob.download_as_text(encoding="utf-8")
         import json
 
         return json.loads(raw)
 
-    @classmethod
     def upload_json(
-        cls,
+        self,
         bucket_name: str,
         blob_name: str,
         payload: dict,
@@ -105,17 +202,15 @@ class GCSUploader:
             raise ValueError("bucket_name 不能为空")
         if not blob_name:
             raise ValueError("blob_name 不能为空")
-        client = cls._get_client()
-        bucket = client.bucket(bucket_name)
+        bucket = self._get_bucket(bucket_name)
         blob = bucket.blob(blob_name)
         import json
 
         blob.upload_from_string(json.dumps(payload, ensure_ascii=False, indent=2), content_type=content_type)
         return f"gs://{bucket_name}/{blob_name}"
 
-    @classmethod
     def generate_signed_url(
-        cls,
+        self,
         bucket_name: str,
         blob_name: str,
         expiration_hours: int = 24,
@@ -149,28 +244,27 @@ class GCSUploader:
         expiration_minutes = expiration_hours * 60
         
         try:
-            client = cls._get_client()
-            bucket = client.bucket(bucket_name)
+            bucket = self._get_bucket(bucket_name)
             blob = bucket.blob(blob_name)
             
-            # 1. 获取当前环境的凭证（包含 cloud-platform 权限）
-            creds, project = google.auth.default(
-                scopes=["https://www.googleapis.com/auth/cloud-platform"]
-            )
+            # 1. 获取当前环境的凭证（包含 cloud-platform 权限，进程内缓存）
+            creds, project = self._get_default_credentials()
             
-            # 2. 如果凭证不可用，则刷新
-            auth_req = AuthRequest(session=requests.Session())
-            if not creds.valid:
+            # 2. 仅在尚未获取 token 或 token 已过期时刷新
+            if not creds.token or creds.expired:
+                from google.auth.transport.requests import Request as AuthRequest
+
+                auth_req = AuthRequest(session=self._get_session())
                 creds.refresh(auth_req)
             
             # 3. 获取当前服务账号的邮箱
-            sa_email = cls._get_service_account_email()
+            sa_email = self._get_service_account_email()
             
             # 4. 使用 IAM 代签（service_account_email + access_token）生成 Signed URL（v4）
             #    注意：不能直接传 credentials=compute_engine.Credentials，
             #    否则库会尝试用本地私钥签名而报 "you need a private key to sign"。
             logger.info(
-                f"🔏 正在使用服务账号签名: {sa_email} (access_token present={bool(creds.token)})"
+                "🔏 正在使用服务账号签名: %s (access_token present=%s)", sa_email, bool(creds.token)
             )
             signed_url = blob.generate_signed_url(
                 version="v4",
@@ -180,7 +274,7 @@ class GCSUploader:
                 access_token=creds.token,  # 让库调用 IAM Credentials API 代签
             )
             
-            logger.info(f"✅ 生成签名 URL ({expiration_hours}小时有效期): {blob_name}")
+            logger.info("✅ 生成签名 URL (%s小时有效期): %s", expiration_hours, blob_name)
             return signed_url
             
         except Exception as e:
@@ -201,10 +295,38 @@ class GCSUploader:
             logger.error(f"❌ 生成签名 URL 失败: {e}")
             raise RuntimeError(f"无法生成签名 URL，请检查 IAM 权限: {e}") from e
     
-    @classmethod
-    def _get_service_account_email(cls) -> str:
+    @functools.lru_cache(maxsize=1)
+    def _get_default_credentials(self):
+        """获取并缓存 google.auth 默认凭证 (credentials, project)"""
+        import google.auth
+
+        return google.auth.default(
+            scopes=["https://www.googleapis.com/auth/cloud-platform"]
+        )
+
+    @functools.lru_cache(maxsize=1)
+    def _get_metadata_service_account_email(self) -> Optional[str]:
+        """
+        从元数据服务器（Cloud Run/GKE）获取服务账号邮箱。
+
+        结果（包括获取失败的 None）会被缓存，避免每次签名都探测元数据服务器。
+        """
+        try:
+            response = self._get_session().get(
+                "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/email",
+                headers={"Metadata-Flavor": "Google"},
+                timeout=2,
+            )
+            if response.ok:
+                return response.text.strip()
+        except Exception as e:
+            logger.debug("⚠️  无法从元数据服务器获得服务账号: %s", e)
+        return None
+
+    @functools.lru_cache(maxsize=1)
+    def _get_service_account_email(self) -> str:
         """
-        获取当前运行环境的服务账号邮箱。
+        获取当前运行环境的服务账号邮箱（成功结果进程内缓存）。
         
         优先级：
         1. 环境变量 GOOGLE_SERVICE_ACCOUNT_EMAIL
@@ -217,41 +339,53 @@ class GCSUploader:
         Raises:
             RuntimeError: 如果无法获取
         """
-        import os
-        
         # 1. 检查环境变量
         sa_email = os.getenv("GOOGLE_SERVICE_ACCOUNT_EMAIL")
         if sa_email:
-            logger.info(f"📧 从环境变量获得服务账号: {sa_email}")
+            logger.info("📧 从环境变量获得服务账号: %s", sa_email)
             return sa_email
         
         # 2. 尝试从元数据服务器获取（Cloud Run/GKE）
-        try:
-            response = requests.get(
-                "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/email",
-                headers={"Metadata-Flavor": "Google"},
-                timeout=2,
-            )
-            if response.ok:
-                sa_email = response.text.strip()
-                logger.info(f"📧 从元数据服务器获得服务账号: {sa_email}")
-                return sa_email
-        except Exception as e:
-            logger.debug(f"⚠️  无法从元数据服务器获得服务账号: {e}")
+        sa_email = self._get_metadata_service_account_email()
+        if sa_email:
+            logger.info("📧 从元数据服务器获得服务账号: %s", sa_email)
+            return sa_email
         
         # 3. 最后尝试从当前凭证中提取
         try:
-            creds, _ = google.auth.default(
-                scopes=["https://www.googleapis.com/auth/cloud-platform"]
-            )
+            creds, _ = self._get_default_credentials()
             if hasattr(creds, 'service_account_email'):
                 sa_email = creds.service_account_email
-                logger.info(f"📧 从凭证中获得服务账号: {sa_email}")
+                logger.info("📧 从凭证中获得服务账号: %s", sa_email)
                 return sa_email
         except Exception as e:
-            logger.debug(f"⚠️  无法从凭证中获得服务账号: {e}")
+            logger.debug("⚠️  无法从凭证中获得服务账号: %s", e)
         
         raise RuntimeError(
             "无法获取服务账号邮箱。请设置环境变量 GOOGLE_SERVICE_ACCOUNT_EMAIL，"
             "或确保运行在 Google Cloud（Cloud Run/GKE）环境中。"
         )
+
+
+# 模块级单例：存储客户端、会话和凭证在其内部按需延迟初始化
+_uploader = _GCSUploader()
+
+upload_file = _uploader.upload_file
+upload_file_async = _uploader.upload_file_async
+upload_fileobj = _uploader.upload_fileobj
+blob_exists = _uploader.blob_exists
+download_json = _uploader.download_json
+upload_json = _uploader.upload_json
+generate_signed_url = _uploader.generate_signed_url
+
+
+class GCSUploader:
+    """兼容旧接口：原类方法转发到模块级单例"""
+
+    upload_file = staticmethod(upload_file)
+    upload_file_async = staticmethod(upload_file_async)
+    upload_fileobj = staticmethod(upload_fileobj)
+    blob_exists = staticmethod(blob_exists)
+    download_json = staticmethod(download_json)
+    upload_json = staticmethod(upload_json)
+    generate_signed_url = staticmethod(generate_signed_url)
@@ -12,15 +12,23 @@ LLM 播客脚本生成器
 """
 
 import os
-import json
+import re
+import asyncio
+import hashlib
+import inspect
+import functools
 import logging
-from typing import Dict, List, Optional, Any
+import operator
+import string
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
 
-import openai
-from openai import OpenAI
+import orjson
 
 # ============================================================================
 # 日志配置
@@ -32,12 +40,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 脚本扩展时最多并行请求的部分数
+_EXPANSION_PARTS = 3
+
+# 预计时长低于目标的该比例时才进行扩展
+_EXPANSION_THRESHOLD = 0.85
+
+# 扩展请求的输出 token 上限：按所需内容量估算，并为 JSON 结构和估算误差预留余量
+_EXPANSION_TOKEN_HEADROOM = 1.5
+_EXPANSION_MIN_TOKENS = 1000
+_EXPANSION_MAX_TOKENS = 8000
+
+# 估算播报时长时计入的字符（汉字 / 日文假名+汉字 / 韩文）
+_HAN_RE = re.compile(r'[\u4e00-\u9fff]')
+_JA_RE = re.compile(r'[\u3040-\u309f\u30a0-\u30ff\u4e00-\u9fff]')
+_KO_RE = re.compile(r'[\uac00-\ud7af]')
+
+# 文本转 SSML 时替换的标点（每种语言一次扫描完成全部替换）
+_ZH_SSML_MAP = {
+    "。": '<break time="500ms"/>',
+    "，": '<break time="200ms"/>',
+}
+_ZH_SSML_RE = re.compile(r'[。，]')
+_EN_SSML_MAP = {
+    "!": '<emphasis level="strong">!</emphasis><break time="300ms"/>',
+    "?": '<break time="300ms"/>',
+}
+_EN_SSML_RE = re.compile(r'[!?]')
+
+# SSML 标签（计算 TTS 计费字符数时剔除）
+_SSML_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+def ssml_char_count(ssml_text: str) -> int:
+    """计算 SSML 中实际朗读的字符数（不含标签），即 TTS 计费字符数"""
+    return len(_SSML_TAG_PATTERN.sub('', ssml_text))
+
 # ============================================================================
 # 枚举定义
 # ============================================================================
 
-class PodcastTone(Enum):
-    """播客语调"""
+class PodcastTone(str, Enum):
+    """播客语调（成员本身即字符串值，可直接序列化）"""
     PROFESSIONAL = "professional"       # 专业严肃
     CASUAL = "casual"                   # 随意轻松
     EDUCATIONAL = "educational"         # 教育性
@@ -47,8 +91,8 @@ class PodcastTone(Enum):
     HUMOROUS = "humorous"               # 幽默
     DEBATE = "debate"                   # 辩论
 
-class DialogueStyle(Enum):
-    """对话风格"""
+class DialogueStyle(str, Enum):
+    """对话风格（成员本身即字符串值，可直接序列化）"""
     MONOLOGUE = "monologue"             # 单人独白
     INTERVIEW = "interview"             # 采访对话
     DEBATE = "debate"                   # 辩论讨论
@@ -60,7 +104,7 @@ class DialogueStyle(Enum):
 # 数据模型
 # ============================================================================
 
-@dataclass
+@dataclass(slots=True)
 class ScriptSegment:
     """脚本段落"""
     speaker_id: str
@@ -70,8 +114,47 @@ class ScriptSegment:
     duration_seconds: float
     segment_type: str      # "opening", "main", "closing" 等
     notes: Optional[str] = None
+    char_count: Optional[int] = None  # SSML 去标签后的字符数（TTS 计费字符数）；旧缓存脚本中缺失
+
+# 序列化时输出的段落字段（顺序即 JSON 中的键顺序）
+_SEGMENT_FIELDS = (
+    'speaker_id',
+    'speaker_name',
+    'text',
+    'ssml_text',
+    'duration_seconds',
+    'segment_type',
+    'notes',
+    'char_count',
+)
+_segment_values = operator.attrgetter(*_SEGMENT_FIELDS)
+
+@dataclass(slots=True)
+class TokenUsage:
+    """LLM token 使用统计（生成过程中累加，结束时转换为字典保存）"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+    @classmethod
+    def from_openai(cls, usage) -> "TokenUsage":
+        """从 OpenAI SDK 返回的 usage 对象构建"""
+        return cls(usage.prompt_tokens, usage.completion_tokens, usage.total_tokens)
+
+    def __iadd__(self, other: "TokenUsage") -> "TokenUsage":
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.total_tokens += other.total_tokens
+        return self
 
-@dataclass
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+        }
+
+@dataclass(slots=True)
 class PodcastScript:
     """完整播客脚本"""
     topic: str
@@ -93,27 +176,501 @@ class PodcastScript:
             'title': self.title,
             'description': self.description,
             'language': self.language,
-            'tone': self.tone.value,
-            'dialogue_style': self.dialogue_style.value,
+            'tone': self.tone,
+            'dialogue_style': self.dialogue_style,
             'num_speakers': self.num_speakers,
             'estimated_duration_seconds': self.estimated_duration_seconds,
             'segments': [
-                {
-                    'speaker_id': seg.speaker_id,
-                    'speaker_name': seg.speaker_name,
-                    'text': seg.text,
-                    'ssml_text': seg.ssml_text,
-                    'duration_seconds': seg.duration_seconds,
-                    'segment_type': seg.segment_type,
-                    'notes': seg.notes
-                }
-                for seg in self.segments
+                dict(zip(_SEGMENT_FIELDS, row))
+                for row in map(_segment_values, self.segments)
             ],
             'metadata': self.metadata
         }
         if self.token_usage:
             result['token_usage'] = self.token_usage
         return result
+    
+    def to_json_bytes(self) -> bytes:
+        """直接用 orjson 序列化 dataclass（枚举输出其值），跳过 to_dict 中间字典"""
+        return orjson.dumps(self, option=orjson.OPT_INDENT_2)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PodcastScript":
+        """从 to_dict()/to_json_bytes() 的结果还原脚本对象"""
+        return cls(
+            topic=data['topic'],
+            title=data['title'],
+            description=data['description'],
+            language=data['language'],
+            tone=PodcastTone(data['tone']),
+            dialogue_style=DialogueStyle(data['dialogue_style']),
+            num_speakers=data['num_speakers'],
+            estimated_duration_seconds=data['estimated_duration_seconds'],
+            segments=[
+                ScriptSegment(**{k: seg.get(k) for k in _SEGMENT_FIELDS if k in seg})
+                for seg in data.get('segments', ())
+            ],
+            metadata=dict(data.get('metadata') or {}),
+            token_usage=data.get('token_usage'),
+        )
+
+# ============================================================================
+# 脚本缓存
+# ============================================================================
+
+def _normalize_text(text: Optional[str]) -> str:
+    """合并多余空白，使仅有空格/换行差异的输入命中同一缓存"""
+    return " ".join(text.split()) if text else ""
+
+
+class ScriptCache:
+    """
+    进程内 LRU 脚本缓存
+    
+    以规范化后的生成参数为键，保存序列化后的脚本字节；命中时反序列化
+    出一个新的 PodcastScript，调用方修改结果不会影响缓存内容。
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def make_key(
+        model: str,
+        topic: str,
+        num_speakers: int,
+        duration_minutes: int,
+        language: str,
+        tone: PodcastTone,
+        dialogue_style: DialogueStyle,
+        speaker_names: Optional[List[str]],
+        template_speaker_ids: Optional[List[str]],
+        additional_context: Optional[str],
+        custom_instructions: Optional[str],
+    ) -> str:
+        """根据生成参数计算缓存键"""
+        signature = orjson.dumps([
+            model,
+            language,
+            tone,
+            dialogue_style,
+            num_speakers,
+            duration_minutes,
+            speaker_names,
+            template_speaker_ids,
+            _normalize_text(topic),
+            _normalize_text(additional_context),
+            _normalize_text(custom_instructions),
+        ])
+        return hashlib.sha256(signature).hexdigest()
+
+    def get(self, key: str) -> Optional[PodcastScript]:
+        """查找缓存，未命中返回 None"""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return PodcastScript.from_dict(orjson.loads(payload))
+
+    def put(self, key: str, script: PodcastScript) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        payload = orjson.dumps(script)
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """返回缓存命中统计"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+# ============================================================================
+# 提示词与语言常量
+# ============================================================================
+
+_TONE_DESC = {
+    PodcastTone.PROFESSIONAL: "保持专业、严肃的语气",
+    PodcastTone.CASUAL: "轻松、随意的对话风格",
+    PodcastTone.EDUCATIONAL: "教育性、讲解性的内容",
+    PodcastTone.ENTERTAINING: "娱乐性强、吸引听众",
+    PodcastTone.INVESTIGATIVE: "深度调查、批判性思维",
+    PodcastTone.STORYTELLING: "故事叙述风格、引人入胜",
+    PodcastTone.HUMOROUS: "幽默、轻松、能逗笑",
+    PodcastTone.DEBATE: "辩论性、观点碰撞",
+}
+
+_STYLE_DESC = {
+    DialogueStyle.MONOLOGUE: "单人独白、讲者主导",
+    DialogueStyle.INTERVIEW: "采访形式、问答互动",
+    DialogueStyle.DEBATE: "辩论形式、观点对立",
+    DialogueStyle.CONVERSATION: "随意对话、自然流畅",
+    DialogueStyle.NARRATION: "旁白解说、信息传达",
+    DialogueStyle.PANEL: "专家论坛、多人讨论",
+}
+
+_LANG_INDICATOR = {
+    "en-US": "英文",
+    "en-GB": "英文",
+    "zh-CN": "中文（简体）",
+    "zh-TW": "中文（繁体）",
+    "ko-KR": "韩文",
+    "ja-JP": "日文",
+}
+
+
+@dataclass(slots=True, frozen=True)
+class _LanguageProfile:
+    """按语言估算内容量所需的参数"""
+    rate: float                       # 播报语速（单位/秒）
+    unit: str                         # 内容量单位
+    unit_short: str                   # 内容量单位（简写）
+    char_pattern: Optional[re.Pattern]  # 计数字符的正则；None 表示按空白分词计数
+    tokens_per_unit: float            # 每个内容单位约占的输出 token 数
+
+
+# 语言代码前缀 → 语言参数（按顺序匹配）
+_LANG_PROFILES = (
+    ("zh", _LanguageProfile(3.5, "字符", "字", _HAN_RE, 1.0)),      # 中文约 3.5 字符/秒
+    ("cmn", _LanguageProfile(3.5, "字符", "字", _HAN_RE, 1.0)),
+    ("ja", _LanguageProfile(4.0, "文字", "文字", _JA_RE, 1.0)),     # 日文约 4.0 字符/秒
+    ("ko", _LanguageProfile(4.5, "글자", "글자", _KO_RE, 1.0)),     # 韩文约 4.5 字符/秒
+)
+# 英文及其他：按词数，约 2.5 词/秒
+_DEFAULT_LANG_PROFILE = _LanguageProfile(2.5, "words", "词", None, 1.4)
+
+
+@functools.lru_cache(maxsize=32)
+def _language_profile(language: str) -> _LanguageProfile:
+    """根据语言代码查找语言参数"""
+    for prefix, profile in _LANG_PROFILES:
+        if language.startswith(prefix):
+            return profile
+    return _DEFAULT_LANG_PROFILE
+
+@functools.lru_cache(maxsize=64)
+def _system_prompt(tone: PodcastTone, dialogue_style: DialogueStyle, language: str) -> str:
+    """构建系统提示词（只依赖语调/风格/语言，结果缓存复用）"""
+    lang_indicator = _LANG_INDICATOR.get(language, "英文")
+    
+    return f"""你是一位资深的播客脚本编剧和内容策划专家，专门创作深入、详细、高质量的长篇播客内容。
+
+你的任务是生成高质量的、内容丰富的播客脚本，满足以下要求：
+
+1. **语言**: {lang_indicator}
+2. **语调**: {_TONE_DESC.get(tone, "自然流畅")}
+3. **风格**: {_STYLE_DESC.get(dialogue_style, "自然对话")}
+
+**核心原则 - 内容长度和深度**:
+- 你必须生成完整、详细的内容，不要因为担心篇幅而缩短讨论
+- 每个主题都要深入展开，包含具体例子、数据、故事和案例
+- 讲话人之间要有充分的互动和来回对话
+- 宁可内容丰富而略长，也不要内容单薄而过短
+- 用户指定的目标时长是最低要求，你应该努力达到或超过这个时长
+
+生成脚本时，请遵循以下指南：
+- 内容真实、可信，避免虚构事实
+- 每个段落应该有明确的讲话人
+- 对话应该自然、有节奏，适合口头表达，但也要有足够的信息密度
+- 包含自然的停顿、语气变化等指示
+- 返回格式必须是有效的 JSON
+
+关键要求：
+- 必须返回有效的 JSON 格式
+- 每个讲话人的文本应该自然、有个性、信息丰富
+- 内容应该深入、详细、有价值，充分满足用户指定的时长要求
+"""
+
+
+@functools.lru_cache(maxsize=128)
+def _content_requirement(
+    has_source_content: bool,
+    duration_minutes: int,
+    min_segments: int,
+    min_words: int,
+    words_per_segment: int,
+    content_unit: str,
+    content_unit_short: str
+) -> str:
+    """构建用户提示词中的内容要求部分（与主题无关，结果缓存复用）"""
+    if has_source_content:
+        return f"""
+【🔴 严格要求 - 必须遵守】:
+1. **仅使用提供的源内容**: 你必须严格基于"额外背景"中提供的真实内容生成播客
+2. **禁止编造事实**: 不要添加任何源内容中没有提到的数据、事件、人名或引用
+3. **准确引用**: 如果提到具体数字、日期、公司名、人名，必须与源内容完全一致
+4. **可以做的**:
+   - 用自己的话重新表述源内容中的信息
+   - 解释和分析源内容中的数据和事件
+   - 讨论源内容中提到的事件的影响和意义
+   - 在源内容的事实基础上进行合理推理
+5. **不可以做的**:
+   - 编造源内容中不存在的统计数据
+   - 提及源内容中未出现的公司、项目或人物
+   - 添加源内容中没有的"专家观点"或"最新消息"
+   - 夸大或扭曲源内容中的信息
+
+如果源内容信息不足以填满 {duration_minutes} 分钟，你应该:
+- 深入分析已有信息的含义和影响
+- 讨论事件的背景和context
+- 探讨可能的后续影响和趋势
+- 但仍然不要编造新的事实
+"""
+    else:
+        return f"""
+【关键要求 - 必须严格遵守】:
+
+1. **长度要求（最重要）**:
+   - 整个脚本必须包含至少 {min_segments} 个对话段落
+   - 总内容量必须达到或超过 {min_words} {content_unit}
+   - 每个段落应该包含 {words_per_segment}-{words_per_segment + 50} {content_unit_short}
+   - 如果你发现内容不够长，必须增加更多讨论、举例、细节和互动
+
+2. **内容深度要求**:
+   - 对主题的每个方面都要深入讨论
+   - 包含具体的例子、数据、故事或案例
+   - 让讲话人之间有充分的互动和来回对话
+   - 不要匆忙结束话题，要充分展开
+
+3. **结构要求**:
+   - Opening (开场): 2-3个段落，介绍主题和讲话人
+   - Main (主体): 至少 {min_segments - 6} 个段落，深入讨论多个子话题
+   - Closing (结尾): 2-3个段落，总结要点
+"""
+
+
+# ============================================================================
+# 提示词模板（骨架固定，每次调用只替换变量）
+# ============================================================================
+
+_USER_PROMPT_TMPL = string.Template("""请为以下播客生成一个完整的、高质量的脚本。
+
+【播客信息】
+- 主题: ${topic}
+- 讲话人数: ${num_speakers}
+${speaker_list_block}- 目标时长: ${duration_minutes} 分钟（${duration_seconds} 秒）
+- 必须达到的总内容量: 至少 ${min_words} ${content_unit}
+- 必须包含的段落数: 至少 ${min_segments} 个段落
+- 语言: ${language}
+
+【额外背景】
+${additional_context}
+
+【自定义要求】
+${custom_instructions}
+${multi_speaker_instruction}
+
+${content_requirement}
+
+【输出格式要求】
+按给定的 JSON Schema 返回 title、description 和 segments，各段落字段：
+- speaker_id: 按讲话人编号使用 "speaker_1"、"speaker_2" ...
+- speaker_name: 讲话人名字
+- segment_type: "opening"（开场）/ "main"（主体）/ "closing"（结尾）
+- text: 段落内容（约${words_per_segment}${content_unit_short}）
+- notes: 语气、节奏等导演笔记，没有则为 null
+
+【质量检查清单】:
+- ✓ 是否有至少 ${min_segments} 个段落？
+- ✓ 总内容量是否达到 ${min_words} ${content_unit}？
+- ✓ 每个讲话人是否都充分参与？
+- ✓ 内容是否深入、有价值、信息丰富？
+- ✓ 是否包含具体的例子和细节？
+
+请确保生成的内容完整、有深度，不要为了速度而牺牲质量和长度。
+""")
+
+_EXPANSION_PROMPT_TMPL = string.Template("""当前播客脚本长度不足，需要继续扩展内容。
+
+【当前状态】
+- 主题: ${topic}
+- 当前时长: ${current_duration} 秒
+- 目标时长: ${target_duration} 秒
+- 需要增加: 约 ${needed_words} ${content_unit}
+
+【讲话人信息（必须严格使用这些ID和名字）】
+${speaker_list_for_prompt}
+
+【最近的对话内容】
+${context_summary}
+${part_instruction}
+【扩展要求】
+请继续这个播客的讨论，生成更多段落来达到目标时长：
+
+1. **继续当前话题**: 在现有讨论的基础上继续深入
+2. **新的子话题**: 可以引入相关的新角度或子话题
+3. **必须使用上述精确的speaker_id**: 例如使用 "${first_speaker_id}" 而不是 "speaker_1" 或其他变体
+4. **必须使用上述精确的speaker_name**: 保持名字完全一致
+5. **自然衔接**: 内容要与前面的对话自然衔接
+6. **生成至少 ${needed_words} ${content_unit}**: 确保达到所需的长度
+
+请按给定的 JSON Schema 返回扩展的段落数组（segments），segment_type 一般为 "main"，notes 没有则为 null。
+""")
+
+# 扩展提示词中近期对话上下文的字符预算
+_CONTEXT_MAX_CHARS = 600
+_CONTEXT_SEGMENT_MAX_CHARS = 200
+_CONTEXT_TRUNCATION_MARK = " … [truncated] … "
+
+
+def _compact_context(segments: List[ScriptSegment], max_chars: int = _CONTEXT_MAX_CHARS) -> str:
+    """
+    从最后一个段落向前取近期对话，总长度不超过 max_chars
+    
+    过长的段落保留开头和结尾、截去中间，便于模型自然衔接最后一句话。
+    """
+    keep_head = _CONTEXT_SEGMENT_MAX_CHARS // 2
+    keep_tail = _CONTEXT_SEGMENT_MAX_CHARS - keep_head - len(_CONTEXT_TRUNCATION_MARK)
+    lines = []
+    used = 0
+    for seg in reversed(segments):
+        text = seg.text
+        if len(text) > _CONTEXT_SEGMENT_MAX_CHARS:
+            text = text[:keep_head] + _CONTEXT_TRUNCATION_MARK + text[-keep_tail:]
+        line = f"{seg.speaker_name} ({seg.speaker_id}): {text}"
+        if lines and used + len(line) > max_chars:
+            break
+        lines.append(line)
+        used += len(line) + 1
+    lines.reverse()
+    return "\n".join(lines)
+
+# ============================================================================
+# 结构化输出
+# ============================================================================
+
+# 单个段落的 JSON Schema（strict 模式要求所有字段 required 且禁止额外字段）
+_SEGMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "speaker_id": {"type": "string"},
+        "speaker_name": {"type": "string"},
+        "segment_type": {"type": "string", "enum": ["opening", "main", "closing"]},
+        "text": {"type": "string"},
+        "notes": {"type": ["string", "null"]},
+    },
+    "required": ["speaker_id", "speaker_name", "segment_type", "text", "notes"],
+    "additionalProperties": False,
+}
+
+# 完整脚本的 response_format，模型输出保证符合该结构，无需在提示词中给出示例 JSON
+_SCRIPT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "podcast_script",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "description": {"type": "string"},
+                "segments": {"type": "array", "items": _SEGMENT_SCHEMA},
+            },
+            "required": ["title", "description", "segments"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# 扩展段落的 response_format
+_EXPANSION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "podcast_script_expansion",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "segments": {"type": "array", "items": _SEGMENT_SCHEMA},
+            },
+            "required": ["segments"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# ============================================================================
+# 流式响应解析
+# ============================================================================
+
+# JSON 中影响结构的字符（字符串内的转义、引号、括号）
+_JSON_STRUCT_CHARS = re.compile(r'[\\"{}\[\]]')
+
+
+class _SegmentStreamParser:
+    """
+    增量扫描流式返回的脚本 JSON
+    
+    每次 feed 一段增量文本，返回其中新闭合的 segments 数组元素（已解析为 dict），
+    使段落处理可以与后续内容的生成并行进行。完整文本保存在 text 中。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = 0
+        self._last_key = None          # 顶层对象中最近一个字符串（即最近的键）
+        self._segments_depth = None    # segments 数组所在深度
+        self._obj_start = None         # 当前段落对象的起始位置
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.text += chunk
+        text = self.text
+        completed = []
+        pos = self._pos
+        while True:
+            match = _JSON_STRUCT_CHARS.search(text, pos)
+            if match is None:
+                break
+            i = match.start()
+            c = text[i]
+            if c == '\\':
+                if i + 1 >= len(text):
+                    # 转义符位于末尾，等待下一段文本
+                    pos = i
+                    break
+                pos = i + 2
+                continue
+            pos = i + 1
+            if self._in_string:
+                if c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1:i]
+                continue
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == '{' or c == '[':
+                self._depth += 1
+                if c == '[' and self._depth == 2 and self._last_key == 'segments':
+                    self._segments_depth = 2
+                elif c == '{' and self._segments_depth is not None and self._depth == self._segments_depth + 1:
+                    self._obj_start = i
+            else:
+                if self._segments_depth is not None:
+                    if c == '}' and self._obj_start is not None and self._depth == self._segments_depth + 1:
+                        completed.append(orjson.loads(text[self._obj_start:i + 1]))
+                        self._obj_start = None
+                    elif c == ']' and self._depth == self._segments_depth:
+                        self._segments_depth = None
+                self._depth -= 1
+        self._pos = pos
+        return completed
 
 # ============================================================================
 # LLM 脚本生成器
@@ -125,7 +682,8 @@ class LLMScriptGenerator:
     def __init__(
         self,
         api_key: Optional[str] = None,
-        model: str = "gpt-4o-mini"
+        model: str = "gpt-4o-mini",
+        cache_size: int = 128
     ):
         """
         初始化生成器
@@ -133,16 +691,37 @@ class LLMScriptGenerator:
         Args:
             api_key: OpenAI API key (默认从环境变量读取)
             model: 使用的模型 (默认 gpt-4o-mini - 轻量级且高效)
+            cache_size: 脚本缓存条目上限，0 表示关闭缓存
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY 环境变量未设置")
         
         self.model = model
-        self.client = OpenAI(api_key=self.api_key)
+        # openai SDK 导入较慢，延迟到实际创建生成器时再导入
+        import httpx
+        from openai import OpenAI
+        # 共享的 HTTP/2 连接池：初次生成、扩展及后续请求复用已建立的 TLS 连接
+        self._http_client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=32,
+                max_keepalive_connections=16,
+                keepalive_expiry=600.0,
+            ),
+            timeout=httpx.Timeout(300.0, connect=10.0),
+        )
+        self.client = OpenAI(api_key=self.api_key, http_client=self._http_client)
+        self.cache = ScriptCache(cache_size) if cache_size > 0 else None
+        # 进行中的异步生成请求：缓存键 → 结果 Future
+        self._inflight: Dict[str, asyncio.Future] = {}
         
         logger.info(f"✅ LLM 脚本生成器初始化完成 (model={model})")
 
+    def close(self) -> None:
+        """关闭底层 HTTP 连接池"""
+        self._http_client.close()
+
     def _is_gpt5_model(self) -> bool:
         return self.model.lower().startswith("gpt-5")
 
@@ -152,17 +731,26 @@ class LLMScriptGenerator:
         max_output_tokens: int,
         temperature: float = 0.7,
         top_p: float = 0.95,
+        stream: bool = False,
+        response_format: Optional[Dict[str, Any]] = None,
     ):
         """
         按模型分开逻辑：
         - gpt-5 系列：只使用 max_completion_tokens，不传 temperature/top_p
         - 非 gpt-5：使用 max_tokens + temperature/top_p
+        
+        stream=True 时返回流式迭代器，最后一个 chunk 携带 usage。
+        response_format 用于结构化输出（json_schema），两类模型均支持。
         """
+        extra_kwargs = {"stream": True, "stream_options": {"include_usage": True}} if stream else {}
+        if response_format is not None:
+            extra_kwargs["response_format"] = response_format
         if self._is_gpt5_model():
             return self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 max_completion_tokens=max_output_tokens,
+                **extra_kwargs,
             )
         return self.client.chat.completions.create(
             model=self.model,
@@ -170,6 +758,7 @@ class LLMScriptGenerator:
             temperature=temperature,
             top_p=top_p,
             max_tokens=max_output_tokens,
+            **extra_kwargs,
         )
     
     def generate_script(
@@ -183,7 +772,8 @@ class LLMScriptGenerator:
         speaker_names: Optional[List[str]] = None,
         template_speaker_ids: Optional[List[str]] = None,
         additional_context: Optional[str] = None,
-        custom_instructions: Optional[str] = None
+        custom_instructions: Optional[str] = None,
+        use_cache: bool = True
     ) -> PodcastScript:
         """
         从 topic 生成播客脚本
@@ -198,18 +788,17 @@ class LLMScriptGenerator:
             speaker_names: 讲话人名字列表
             additional_context: 额外背景信息
             custom_instructions: 自定义生成指令
+            use_cache: 为 False 时跳过脚本缓存查找，强制调用 LLM（结果仍写入缓存）
         
         Returns:
-            PodcastScript 对象
+            PodcastScript 对象（缓存命中时 token_usage 为 None，本次没有消耗 token）
         """
         
-        logger.info(f"🎙️ 开始生成播客脚本...")
-        logger.info(f"   Topic: {topic[:60]}...")
-        logger.info(f"   Speakers: {num_speakers}")
-        logger.info(f"   Duration: {duration_minutes} min")
-        logger.info(f"   Language: {language}")
-        logger.info(f"   Tone: {tone.value}")
-        logger.info(f"   Style: {dialogue_style.value}")
+        logger.info(
+            "🎙️ 开始生成播客脚本...\n   Topic: %s...\n   Speakers: %s\n   Duration: %s min"
+            "\n   Language: %s\n   Tone: %s\n   Style: %s",
+            topic[:60], num_speakers, duration_minutes, language, tone.value, dialogue_style.value
+        )
         
         # IMPORTANT:
         # If caller does not provide `speaker_names` (None) we should NOT
@@ -218,6 +807,21 @@ class LLMScriptGenerator:
         # `speaker_names` as None so the LLM can generate realistic human
         # names based on role/gender when instructed.
         
+        # 相同参数的请求直接返回缓存的脚本，跳过 LLM 调用
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ScriptCache.make_key(
+                self.model, topic, num_speakers, duration_minutes, language,
+                tone, dialogue_style, speaker_names, template_speaker_ids,
+                additional_context, custom_instructions,
+            )
+            cached = self.cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                logger.info("⚡ 命中脚本缓存，跳过 LLM 调用 (%s)", self.cache.stats())
+                # 本次没有调用 LLM，不能再把原始生成的 token 消耗计入成本
+                cached.token_usage = None
+                return cached
+        
         # 构建提示词
         system_prompt = self._build_system_prompt(
             tone, dialogue_style, language
@@ -233,11 +837,12 @@ class LLMScriptGenerator:
             custom_instructions=custom_instructions
         )
         
-        logger.info(f"\n📝 调用 LLM 生成脚本...")
+        logger.info("\n📝 调用 LLM 生成脚本...")
         
-        # 调用 OpenAI API（按模型分支）
+        # 调用 OpenAI API（按模型分支，流式返回）
+        script_json = None
         try:
-            response = self._chat_completions_create_by_model(
+            stream = self._chat_completions_create_by_model(
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt},
@@ -245,32 +850,41 @@ class LLMScriptGenerator:
                 max_output_tokens=8000,
                 temperature=0.7,
                 top_p=0.95,
+                stream=True,
+                response_format=_SCRIPT_RESPONSE_FORMAT,
             )
             
-            # Extract response content
-            script_json = response.choices[0].message.content
-            logger.info(f"✅ LLM 响应收到")
+            # 边接收边解析：每个段落闭合后立即计算时长和 SSML
+            parser = _SegmentStreamParser()
+            prepared_segments = []
+            usage_obj = None
+            for chunk in stream:
+                if chunk.usage:
+                    usage_obj = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    for seg_data in parser.feed(delta):
+                        prepared_segments.append(self._prepare_segment(seg_data["text"], language))
+            
+            script_json = parser.text
+            logger.info("✅ LLM 响应收到")
 
             # 提取 token 使用统计
-            usage_dict = None
-            if hasattr(response, 'usage') and response.usage:
+            usage = None
+            if usage_obj:
                 try:
-                    # OpenAI SDK 返回的 usage 是一个对象，转换为字典
-                    usage_obj = response.usage
-                    usage_dict = {
-                        'prompt_tokens': usage_obj.prompt_tokens,
-                        'completion_tokens': usage_obj.completion_tokens,
-                        'total_tokens': usage_obj.total_tokens
-                    }
-                    logger.info(f"📊 LLM Token 使用统计:")
-                    logger.info(f"   Prompt tokens: {usage_dict['prompt_tokens']}")
-                    logger.info(f"   Completion tokens: {usage_dict['completion_tokens']}")
-                    logger.info(f"   Total tokens: {usage_dict['total_tokens']}")
+                    usage = TokenUsage.from_openai(usage_obj)
+                    logger.info(
+                        "📊 LLM Token 使用统计:\n   Prompt tokens: %s\n   Completion tokens: %s\n   Total tokens: %s",
+                        usage.prompt_tokens, usage.completion_tokens, usage.total_tokens
+                    )
                 except Exception as e:
                     logger.warning(f"⚠️ 无法解析 token 使用统计: {e}")
             
             # 解析 JSON 响应
-            script_data = json.loads(script_json)
+            script_data = orjson.loads(script_json)
 
             # 构建 PodcastScript 对象
             script = self._parse_script_response(
@@ -280,65 +894,61 @@ class LLMScriptGenerator:
                 dialogue_style=dialogue_style,
                 language=language,
                 num_speakers=num_speakers,
-                template_speaker_ids=template_speaker_ids
+                template_speaker_ids=template_speaker_ids,
+                prepared_segments=prepared_segments
             )
 
-            # 将 usage 信息放入脚本 metadata（以便保存/审计）
-            if usage_dict:
-                script.metadata['usage'] = usage_dict
-            
-            logger.info(f"✅ 脚本初次生成完成")
-            logger.info(f"   段落数: {len(script.segments)}")
-            logger.info(f"   预计时长: {script.estimated_duration_seconds:.1f} 秒")
+            logger.info(
+                "✅ 脚本初次生成完成\n   段落数: %d\n   预计时长: %.1f 秒",
+                len(script.segments), script.estimated_duration_seconds
+            )
             
             # 检查是否达到目标时长，如果不够则进行扩展
             target_duration = duration_minutes * 60
             expansion_attempts = 0
             max_expansions = 3
             
-            while script.estimated_duration_seconds < target_duration * 0.85 and expansion_attempts < max_expansions:
+            while script.estimated_duration_seconds < target_duration * _EXPANSION_THRESHOLD and expansion_attempts < max_expansions:
                 expansion_attempts += 1
-                logger.info(f"\n🔄 内容长度不足，进行第 {expansion_attempts} 次扩展...")
-                logger.info(f"   当前时长: {script.estimated_duration_seconds:.1f}s")
-                logger.info(f"   目标时长: {target_duration}s")
+                logger.debug(
+                    "🔄 内容长度不足，进行第 %d 次扩展 (当前 %.1fs / 目标 %ss)",
+                    expansion_attempts, script.estimated_duration_seconds, target_duration
+                )
                 
                 # 调用扩展方法
-                expanded_script = self._expand_script(
+                script, expansion_usage = self._expand_script(
                     script, target_duration, language, tone, dialogue_style,
                     template_speaker_ids=template_speaker_ids
                 )
                 
                 # 累积token使用统计
-                if hasattr(expanded_script, 'metadata') and 'usage' in expanded_script.metadata:
-                    expansion_usage = expanded_script.metadata['usage']
-                    if usage_dict:
-                        # 累加token统计
-                        usage_dict['prompt_tokens'] += expansion_usage.get('prompt_tokens', 0)
-                        usage_dict['completion_tokens'] += expansion_usage.get('completion_tokens', 0)
-                        usage_dict['total_tokens'] += expansion_usage.get('total_tokens', 0)
-                        script.metadata['usage'] = usage_dict
-                    
-                    logger.info(f"📊 扩展轮次Token统计:")
-                    logger.info(f"   +Prompt tokens: {expansion_usage.get('prompt_tokens', 0)}")
-                    logger.info(f"   +Completion tokens: {expansion_usage.get('completion_tokens', 0)}")
-                    logger.info(f"   累计Total tokens: {usage_dict.get('total_tokens', 0)}")
-                
-                script = expanded_script
-                logger.info(f"✅ 扩展完成，新时长: {script.estimated_duration_seconds:.1f}s")
+                if expansion_usage is not None:
+                    if usage is None:
+                        usage = expansion_usage
+                    else:
+                        usage += expansion_usage
+                    logger.debug(
+                        "📊 扩展轮次Token统计: +Prompt %s / +Completion %s",
+                        expansion_usage.prompt_tokens, expansion_usage.completion_tokens
+                    )
             
-            if expansion_attempts > 0:
-                logger.info(f"\n✅ 经过 {expansion_attempts} 次扩展后生成完成")
-            logger.info(f"   最终段落数: {len(script.segments)}")
-            logger.info(f"   最终预计时长: {script.estimated_duration_seconds:.1f} 秒")
+            logger.info(
+                "✅ 脚本生成完成（扩展 %d 次）\n   最终段落数: %d\n   最终预计时长: %.1f 秒",
+                expansion_attempts, len(script.segments), script.estimated_duration_seconds
+            )
             
-            # 将累积的 token 使用统计设置到脚本对象
-            if usage_dict:
-                script.token_usage = usage_dict
-                logger.info(f"📊 最终累积 Token 统计: {usage_dict['total_tokens']} tokens")
+            # 将累积的 token 使用统计设置到脚本对象和 metadata（以便保存/审计）
+            if usage is not None:
+                script.token_usage = usage.to_dict()
+                script.metadata['usage'] = usage.to_dict()
+                logger.info("📊 最终累积 Token 统计: %s tokens", usage.total_tokens)
+            
+            if cache_key is not None:
+                self.cache.put(cache_key, script)
             
             return script
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"❌ JSON 解析失败: {e}")
             logger.error(f"原始响应: {script_json}")
             raise ValueError("LLM 返回的不是有效的 JSON 格式")
@@ -347,6 +957,45 @@ class LLMScriptGenerator:
             logger.error(f"❌ LLM 调用失败: {e}")
             raise
 
+    async def generate_script_async(self, topic: str, **kwargs) -> PodcastScript:
+        """
+        generate_script 的异步版本
+        
+        在线程池中执行同步生成流程，不阻塞事件循环；多个调用可用
+        asyncio.gather 并发等待。参数与 generate_script 相同。
+        
+        参数完全相同的并发请求只发起一次生成，其余调用等待同一结果，
+        并各自拿到独立的 PodcastScript 副本。
+        """
+        bound = inspect.signature(self.generate_script).bind(topic, **kwargs)
+        bound.apply_defaults()
+        if not bound.arguments.pop('use_cache'):
+            # 强制重新生成：不复用进行中的相同请求
+            return await asyncio.to_thread(self.generate_script, topic, **kwargs)
+        key = ScriptCache.make_key(self.model, **bound.arguments)
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            logger.info("⏳ 相同请求正在生成中，等待其结果")
+            result = await asyncio.shield(inflight)
+            copy = PodcastScript.from_dict(orjson.loads(orjson.dumps(result)))
+            copy.token_usage = None  # token 已计入发起生成的那次调用
+            return copy
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            script = await asyncio.to_thread(self.generate_script, topic, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 没有等待者时避免 "exception was never retrieved" 警告
+            raise
+        else:
+            future.set_result(script)
+            return script
+        finally:
+            self._inflight.pop(key, None)
+
     def _build_system_prompt(
         self,
         tone: PodcastTone,
@@ -354,63 +1003,7 @@ class LLMScriptGenerator:
         language: str
     ) -> str:
         """构建系统提示词"""
-        
-        tone_desc = {
-            PodcastTone.PROFESSIONAL: "保持专业、严肃的语气",
-            PodcastTone.CASUAL: "轻松、随意的对话风格",
-            PodcastTone.EDUCATIONAL: "教育性、讲解性的内容",
-            PodcastTone.ENTERTAINING: "娱乐性强、吸引听众",
-            PodcastTone.INVESTIGATIVE: "深度调查、批判性思维",
-            PodcastTone.STORYTELLING: "故事叙述风格、引人入胜",
-            PodcastTone.HUMOROUS: "幽默、轻松、能逗笑",
-            PodcastTone.DEBATE: "辩论性、观点碰撞",
-        }
-        
-        style_desc = {
-            DialogueStyle.MONOLOGUE: "单人独白、讲者主导",
-            DialogueStyle.INTERVIEW: "采访形式、问答互动",
-            DialogueStyle.DEBATE: "辩论形式、观点对立",
-            DialogueStyle.CONVERSATION: "随意对话、自然流畅",
-            DialogueStyle.NARRATION: "旁白解说、信息传达",
-            DialogueStyle.PANEL: "专家论坛、多人讨论",
-        }
-        
-        lang_indicator = {
-            "en-US": "英文",
-            "en-GB": "英文",
-            "zh-CN": "中文（简体）",
-            "zh-TW": "中文（繁体）",
-            "ko-KR": "韩文",
-            "ja-JP": "日文",
-        }.get(language, "英文")
-        
-        return f"""你是一位资深的播客脚本编剧和内容策划专家，专门创作深入、详细、高质量的长篇播客内容。
-
-你的任务是生成高质量的、内容丰富的播客脚本，满足以下要求：
-
-1. **语言**: {lang_indicator}
-2. **语调**: {tone_desc.get(tone, "自然流畅")}
-3. **风格**: {style_desc.get(dialogue_style, "自然对话")}
-
-**核心原则 - 内容长度和深度**:
-- 你必须生成完整、详细的内容，不要因为担心篇幅而缩短讨论
-- 每个主题都要深入展开，包含具体例子、数据、故事和案例
-- 讲话人之间要有充分的互动和来回对话
-- 宁可内容丰富而略长，也不要内容单薄而过短
-- 用户指定的目标时长是最低要求，你应该努力达到或超过这个时长
-
-生成脚本时，请遵循以下指南：
-- 内容真实、可信，避免虚构事实
-- 每个段落应该有明确的讲话人
-- 对话应该自然、有节奏，适合口头表达，但也要有足够的信息密度
-- 包含自然的停顿、语气变化等指示
-- 返回格式必须是有效的 JSON
-
-关键要求：
-- 必须返回有效的 JSON 格式
-- 每个讲话人的文本应该自然、有个性、信息丰富
-- 内容应该深入、详细、有价值，充分满足用户指定的时长要求
-"""
+        return _system_prompt(tone, dialogue_style, language)
     
     def _build_user_prompt(
         self,
@@ -427,26 +1020,10 @@ class LLMScriptGenerator:
         duration_seconds = duration_minutes * 60
         
         # 根据语言确定内容量单位和估算值
-        if language.startswith("zh") or language.startswith("cmn"):
-            # 中文：使用字符数，约3.5字符/秒
-            content_estimate = duration_seconds * 3.5
-            content_unit = "字符"
-            content_unit_short = "字"
-        elif language.startswith("ja"):
-            # 日文：使用字符数，约4.0字符/秒
-            content_estimate = duration_seconds * 4.0
-            content_unit = "文字"
-            content_unit_short = "文字"
-        elif language.startswith("ko"):
-            # 韩文：使用字符数，约4.5字符/秒
-            content_estimate = duration_seconds * 4.5
-            content_unit = "글자"
-            content_unit_short = "글자"
-        else:
-            # 英文及其他：使用词数，约2.5词/秒
-            content_estimate = duration_seconds * 2.5
-            content_unit = "words"
-            content_unit_short = "词"
+        profile = _language_profile(language)
+        content_estimate = duration_seconds * profile.rate
+        content_unit = profile.unit
+        content_unit_short = profile.unit_short
         
         words_estimate = content_estimate  # 保持变量名兼容
         
@@ -472,17 +1049,6 @@ class LLMScriptGenerator:
 - 避免长篇独白，促进讨论和互动
 """
         
-        # Example speakers used inside the prompt when helpful. If
-        # speaker_names is provided, use those; otherwise provide generic
-        # placeholders in the examples but do not force the model to use
-        # them as the canonical list.
-        example_speakers = []
-        for i in range(min(num_speakers, 4)):
-            if speaker_names and i < len(speaker_names):
-                example_speakers.append(speaker_names[i])
-            else:
-                example_speakers.append(f"Speaker {i+1}")
-        
         # Build the speaker list block only when available
         speaker_list_block = f"\n{speaker_list}\n" if speaker_list else ""
 
@@ -495,118 +1061,28 @@ class LLMScriptGenerator:
         has_source_content = additional_context and "【重要：基于以下真实内容生成播客】" in additional_context
         
         # 根据是否有源内容，调整prompt要求
-        if has_source_content:
-            content_requirement = f"""
-【🔴 严格要求 - 必须遵守】:
-1. **仅使用提供的源内容**: 你必须严格基于"额外背景"中提供的真实内容生成播客
-2. **禁止编造事实**: 不要添加任何源内容中没有提到的数据、事件、人名或引用
-3. **准确引用**: 如果提到具体数字、日期、公司名、人名，必须与源内容完全一致
-4. **可以做的**:
-   - 用自己的话重新表述源内容中的信息
-   - 解释和分析源内容中的数据和事件
-   - 讨论源内容中提到的事件的影响和意义
-   - 在源内容的事实基础上进行合理推理
-5. **不可以做的**:
-   - 编造源内容中不存在的统计数据
-   - 提及源内容中未出现的公司、项目或人物
-   - 添加源内容中没有的"专家观点"或"最新消息"
-   - 夸大或扭曲源内容中的信息
-
-如果源内容信息不足以填满 {duration_minutes} 分钟，你应该:
-- 深入分析已有信息的含义和影响
-- 讨论事件的背景和context
-- 探讨可能的后续影响和趋势
-- 但仍然不要编造新的事实
-"""
-        else:
-            content_requirement = f"""
-【关键要求 - 必须严格遵守】:
-
-1. **长度要求（最重要）**:
-   - 整个脚本必须包含至少 {min_segments} 个对话段落
-   - 总内容量必须达到或超过 {min_words} {content_unit}
-   - 每个段落应该包含 {words_per_segment}-{words_per_segment + 50} {content_unit_short}
-   - 如果你发现内容不够长，必须增加更多讨论、举例、细节和互动
-
-2. **内容深度要求**:
-   - 对主题的每个方面都要深入讨论
-   - 包含具体的例子、数据、故事或案例
-   - 让讲话人之间有充分的互动和来回对话
-   - 不要匆忙结束话题，要充分展开
-
-3. **结构要求**:
-   - Opening (开场): 2-3个段落，介绍主题和讲话人
-   - Main (主体): 至少 {min_segments - 6} 个段落，深入讨论多个子话题
-   - Closing (结尾): 2-3个段落，总结要点
-"""
-        
-        prompt = f"""请为以下播客生成一个完整的、高质量的脚本。
-
-【播客信息】
-- 主题: {topic}
-- 讲话人数: {num_speakers}
-{speaker_list_block}- 目标时长: {duration_minutes} 分钟（{duration_seconds} 秒）
-- 必须达到的总内容量: 至少 {min_words} {content_unit}
-- 必须包含的段落数: 至少 {min_segments} 个段落
-- 语言: {language}
-
-【额外背景】
-{additional_context or "无"}
-
-【自定义要求】
-{custom_instructions or "遵循默认风格"}
-{multi_speaker_instruction}
-
-{content_requirement}
-
-【输出格式要求】
-请返回以下 JSON 结构，不要包含任何代码块标记或其他文本，直接返回 JSON：
-
-{{
-    "title": "播客标题",
-    "description": "播客简述（一句话概括）",
-    "segments": [
-        {{
-            "speaker_id": "speaker_1",
-            "speaker_name": "{example_speakers[0]}",
-            "segment_type": "opening",
-            "text": "开场白，应该热情欢迎听众并介绍今天的主题...(约{words_per_segment}{content_unit_short})",
-            "notes": "语气热情、节奏适中"
-        }},
-        {{
-            "speaker_id": "speaker_2",
-            "speaker_name": "{example_speakers[1] if len(example_speakers) > 1 else example_speakers[0]}",
-            "segment_type": "opening",
-            "text": "第二位讲话人的自我介绍和对主题的初步看法...(约{words_per_segment}{content_unit_short})"
-        }},
-        // ... 继续添加更多段落，确保达到{min_segments}个段落
-        {{
-            "speaker_id": "speaker_1",
-            "speaker_name": "{example_speakers[0]}",
-            "segment_type": "main",
-            "text": "深入讨论第一个子话题，包含具体例子和细节...(约{words_per_segment}{content_unit_short})"
-        }},
-        // ... 主体部分要有大量的back-and-forth对话
-        {{
-            "speaker_id": "speaker_1",
-            "speaker_name": "{example_speakers[0]}",
-            "segment_type": "closing",
-            "text": "总结今天讨论的要点，感谢听众收听...(约{words_per_segment}{content_unit_short})"
-        }}
-    ]
-}}
-
-【质量检查清单】:
-- ✓ 是否有至少 {min_segments} 个段落？
-- ✓ 总内容量是否达到 {min_words} {content_unit}？
-- ✓ 每个讲话人是否都充分参与？
-- ✓ 内容是否深入、有价值、信息丰富？
-- ✓ 是否包含具体的例子和细节？
-
-请确保生成的内容完整、有深度，不要为了速度而牺牲质量和长度。直接返回JSON，不要加任何其他文本。
-"""
+        content_requirement = _content_requirement(
+            bool(has_source_content), duration_minutes, min_segments, min_words,
+            words_per_segment, content_unit, content_unit_short
+        )
         
-        return prompt
+        return _USER_PROMPT_TMPL.substitute(
+            topic=topic,
+            num_speakers=num_speakers,
+            speaker_list_block=speaker_list_block,
+            duration_minutes=duration_minutes,
+            duration_seconds=duration_seconds,
+            min_words=min_words,
+            min_segments=min_segments,
+            language=language,
+            additional_context=additional_context or "无",
+            custom_instructions=custom_instructions or "遵循默认风格",
+            multi_speaker_instruction=multi_speaker_instruction,
+            content_requirement=content_requirement,
+            words_per_segment=words_per_segment,
+            content_unit=content_unit,
+            content_unit_short=content_unit_short,
+        )
     
     def _generate_speaker_names(
         self,
@@ -649,12 +1125,18 @@ class LLMScriptGenerator:
         dialogue_style: DialogueStyle,
         language: str,
         num_speakers: int,
-        template_speaker_ids: Optional[List[str]] = None
+        template_speaker_ids: Optional[List[str]] = None,
+        prepared_segments: Optional[List[tuple]] = None
     ) -> PodcastScript:
-        """解析 LLM 返回的脚本数据"""
+        """
+        解析 LLM 返回的脚本数据
         
-        segments = []
-        total_duration = 0.0
+        prepared_segments 为流式接收时已算好的 (时长, SSML) 列表，
+        与段落数一致时直接复用，否则逐段重新计算。
+        """
+        raw_segments = script_data.get("segments", [])
+        if prepared_segments is None or len(prepared_segments) != len(raw_segments):
+            prepared_segments = [self._prepare_segment(seg["text"], language) for seg in raw_segments]
         
         # 建立 speaker_N 到 template_speaker_id 的映射
         # 例如: speaker_1 -> host_male, speaker_2 -> host_female, ...
@@ -662,34 +1144,23 @@ class LLMScriptGenerator:
         if template_speaker_ids:
             for i in range(min(num_speakers, len(template_speaker_ids))):
                 speaker_id_map[f"speaker_{i+1}"] = template_speaker_ids[i]
+        map_speaker_id = speaker_id_map.get
         
-        for seg_data in script_data.get("segments", []):
-            # 估算时长 - 根据语言使用不同的计算方式
-            text = seg_data["text"]
-            duration = self._estimate_duration(text, language)
-            total_duration += duration
-            
-            # 转换为 SSML 格式
-            ssml_text = self._text_to_ssml(
-                seg_data["text"],
-                language
-            )
-            
-            # 使用 template speaker ID 映射
-            original_speaker_id = seg_data.get("speaker_id", f"speaker_{len(segments)}")
-            final_speaker_id = speaker_id_map.get(original_speaker_id, original_speaker_id)
-            
-            segment = ScriptSegment(
-                speaker_id=final_speaker_id,  # ✅ 使用映射后的 template speaker ID
+        segments = [
+            ScriptSegment(
+                # ✅ 使用映射后的 template speaker ID（缺省为 speaker_<序号>）
+                speaker_id=map_speaker_id(sid := seg_data.get("speaker_id", f"speaker_{i}"), sid),
                 speaker_name=seg_data.get("speaker_name", "Unknown"),
                 text=seg_data["text"],
                 ssml_text=ssml_text,
                 duration_seconds=duration,
                 segment_type=seg_data.get("segment_type", "main"),
-                notes=seg_data.get("notes")
+                notes=seg_data.get("notes"),
+                char_count=ssml_char_count(ssml_text)
             )
-            
-            segments.append(segment)
+            for i, (seg_data, (duration, ssml_text)) in enumerate(zip(raw_segments, prepared_segments))
+        ]
+        total_duration = sum(duration for duration, _ in prepared_segments)
         
         script = PodcastScript(
             topic=topic,
@@ -717,10 +1188,13 @@ class LLMScriptGenerator:
         tone: PodcastTone,
         dialogue_style: DialogueStyle,
         template_speaker_ids: Optional[List[str]] = None
-    ) -> PodcastScript:
+    ) -> Tuple[PodcastScript, Optional[TokenUsage]]:
         """
         扩展现有脚本以达到目标时长
         
+        将所需的补充内容拆成若干部分，每部分负责不同的子话题，
+        并行请求 LLM 后按顺序追加，耗时约等于单次请求。
+        
         Args:
             current_script: 当前的脚本对象
             target_duration: 目标时长（秒）
@@ -730,34 +1204,84 @@ class LLMScriptGenerator:
             template_speaker_ids: 模板speaker ID列表（用于映射）
             
         Returns:
-            扩展后的脚本对象
+            (扩展后的脚本对象, 本轮各部分 token 使用统计之和)
         """
         
-        # 计算需要增加的时长
-        current_duration = current_script.estimated_duration_seconds
-        needed_duration = target_duration - current_duration
-        
-        # 根据语言确定内容量单位和估算值
-        if language.startswith("zh") or language.startswith("cmn"):
-            needed_content = int(needed_duration * 3.5)
-            content_unit = "字符"
-        elif language.startswith("ja"):
-            needed_content = int(needed_duration * 4.0)
-            content_unit = "文字"
-        elif language.startswith("ko"):
-            needed_content = int(needed_duration * 4.5)
-            content_unit = "글자"
-        else:
-            needed_content = int(needed_duration * 2.5)
-            content_unit = "words"
+        # 计算需要增加的时长，每约 1 分钟内容拆一部分，最多 _EXPANSION_PARTS 部分
+        needed_duration = target_duration - current_script.estimated_duration_seconds
+        num_parts = min(_EXPANSION_PARTS, int(needed_duration // 60) + 1)
         
-        needed_words = needed_content  # 保持变量名兼容
+        # 按每部分需要的内容量设置输出上限，避免固定申请 8000 token
+        profile = _language_profile(language)
+        part_tokens = needed_duration / num_parts * profile.rate * profile.tokens_per_unit
+        max_output_tokens = min(
+            _EXPANSION_MAX_TOKENS,
+            max(_EXPANSION_MIN_TOKENS, int(part_tokens * _EXPANSION_TOKEN_HEADROOM))
+        )
+        if self._is_gpt5_model():
+            # gpt-5 的 max_completion_tokens 包含推理 token，不按内容量收紧
+            max_output_tokens = _EXPANSION_MAX_TOKENS
         
-        # 构建speaker ID到名字的映射（从现有段落中提取）
+        # 讲话人列表和上下文在各部分间共享，每轮只构建一次
         speaker_map = {}
         for seg in current_script.segments:
             if seg.speaker_id not in speaker_map:
                 speaker_map[seg.speaker_id] = seg.speaker_name
+        context_summary = _compact_context(current_script.segments)
+        
+        messages_list = [
+            self._build_expansion_messages(
+                current_script, target_duration, needed_duration / num_parts,
+                language, part, num_parts, speaker_map, context_summary
+            )
+            for part in range(1, num_parts + 1)
+        ]
+        
+        with ThreadPoolExecutor(max_workers=num_parts) as executor:
+            results = list(executor.map(
+                lambda messages: self._request_expansion(messages, language, max_output_tokens),
+                messages_list
+            ))
+        
+        round_usage = None
+        for result in results:
+            if result is None:
+                continue
+            segments, part_usage = result
+            current_script.segments.extend(segments)
+            current_script.estimated_duration_seconds += sum(seg.duration_seconds for seg in segments)
+            if part_usage is not None:
+                if round_usage is None:
+                    round_usage = TokenUsage()
+                round_usage += part_usage
+        
+        return current_script, round_usage
+
+    def _build_expansion_messages(
+        self,
+        current_script: PodcastScript,
+        target_duration: float,
+        needed_duration: float,
+        language: str,
+        part: int,
+        num_parts: int,
+        speaker_map: Dict[str, str],
+        context_summary: str
+    ) -> List[Dict[str, str]]:
+        """
+        构建单个扩展部分的请求消息
+        
+        speaker_map 为现有讲话人 ID→名字，context_summary 为 _compact_context 生成的近期对话摘要。
+        """
+        
+        current_duration = current_script.estimated_duration_seconds
+        
+        # 根据语言确定内容量单位和估算值
+        profile = _language_profile(language)
+        needed_content = int(needed_duration * profile.rate)
+        content_unit = profile.unit
+        
+        needed_words = needed_content  # 保持变量名兼容
         
         # 构建扩展提示词中的讲话人列表
         speaker_list_for_prompt = "\n".join([
@@ -765,110 +1289,93 @@ class LLMScriptGenerator:
             for sid, sname in speaker_map.items()
         ])
         
-        # 构建扩展提示词
-        current_segments_summary = []
-        for i, seg in enumerate(current_script.segments[-5:]):  # 只取最后5个段落作为上下文
-            current_segments_summary.append(f"{seg.speaker_name} ({seg.speaker_id}): {seg.text[:100]}...")
+        # 多个部分并行生成，互相看不到对方内容，需各自负责不同的子话题
+        part_instruction = ""
+        if num_parts > 1:
+            part_instruction = f"""
+【分段扩展】
+本次扩展分为 {num_parts} 个部分并行生成，你只负责第 {part} 部分：
+- 选择与其他部分不同的子话题或角度（第 {part} 个角度），避免与其他部分重复
+- 第 {part} 部分的内容将按顺序接在第 {part - 1 if part > 1 else "当前对话"} 之后
+"""
         
-        context_summary = "\n".join(current_segments_summary)
+        expansion_prompt = _EXPANSION_PROMPT_TMPL.substitute(
+            topic=current_script.topic,
+            current_duration=f"{current_duration:.1f}",
+            target_duration=f"{target_duration:.1f}",
+            needed_words=needed_words,
+            content_unit=content_unit,
+            speaker_list_for_prompt=speaker_list_for_prompt,
+            context_summary=context_summary,
+            part_instruction=part_instruction,
+            first_speaker_id=next(iter(speaker_map)),
+        )
         
-        expansion_prompt = f"""当前播客脚本长度不足，需要继续扩展内容。
-
-【当前状态】
-- 主题: {current_script.topic}
-- 当前时长: {current_duration:.1f} 秒
-- 目标时长: {target_duration:.1f} 秒
-- 需要增加: 约 {needed_words} {content_unit}
-
-【讲话人信息（必须严格使用这些ID和名字）】
-{speaker_list_for_prompt}
-
-【最近的对话内容】
-{context_summary}
-
-【扩展要求】
-请继续这个播客的讨论，生成更多段落来达到目标时长：
+        return [
+            {"role": "system", "content": f"你是播客脚本编剧，擅长扩展和丰富内容。语言：{language}"},
+            {"role": "user", "content": expansion_prompt},
+        ]
 
-1. **继续当前话题**: 在现有讨论的基础上继续深入
-2. **新的子话题**: 可以引入相关的新角度或子话题
-3. **必须使用上述精确的speaker_id**: 例如使用 "{list(speaker_map.keys())[0]}" 而不是 "speaker_1" 或其他变体
-4. **必须使用上述精确的speaker_name**: 保持名字完全一致
-5. **自然衔接**: 内容要与前面的对话自然衔接
-6. **生成至少 {needed_words} {content_unit}**: 确保达到所需的长度
-
-请返回扩展的段落数组，格式与之前相同的JSON结构：
-
-{{
-    "segments": [
-        {{
-            "speaker_id": "{list(speaker_map.keys())[0]}",
-            "speaker_name": "{list(speaker_map.values())[0]}",
-            "segment_type": "main",
-            "text": "继续讨论的内容...",
-            "notes": "可选的导演笔记"
-        }},
-        ...更多段落以达到{needed_words}词...
-    ]
-}}
-
-直接返回JSON，不要添加任何其他文本。
-"""
+    def _request_expansion(
+        self,
+        messages: List[Dict[str, str]],
+        language: str,
+        max_output_tokens: int = _EXPANSION_MAX_TOKENS
+    ):
+        """
+        请求一个扩展部分
         
+        Returns:
+            (新段落列表, token 使用统计)；失败时返回 None
+        """
         try:
             response = self._chat_completions_create_by_model(
-                messages=[
-                    {"role": "system", "content": f"你是播客脚本编剧，擅长扩展和丰富内容。语言：{language}"},
-                    {"role": "user", "content": expansion_prompt},
-                ],
-                max_output_tokens=8000,
+                messages=messages,
+                max_output_tokens=max_output_tokens,
                 temperature=0.7,
                 top_p=0.95,
+                response_format=_EXPANSION_RESPONSE_FORMAT,
             )
-            
-            expansion_json = response.choices[0].message.content
-            expansion_data = json.loads(expansion_json)
-            
-            # 提取token使用统计
-            usage_dict = None
-            if hasattr(response, 'usage') and response.usage:
-                usage_obj = response.usage
-                usage_dict = {
-                    'prompt_tokens': usage_obj.prompt_tokens,
-                    'completion_tokens': usage_obj.completion_tokens,
-                    'total_tokens': usage_obj.total_tokens
-                }
-            
-            # 解析新段落并添加到现有脚本
-            for seg_data in expansion_data.get("segments", []):
-                text = seg_data["text"]
-                duration = self._estimate_duration(text, language)
-                
-                ssml_text = self._text_to_ssml(text, language)
-                
-                segment = ScriptSegment(
-                    speaker_id=seg_data.get("speaker_id", "speaker_1"),
-                    speaker_name=seg_data.get("speaker_name", "Unknown"),
-                    text=seg_data["text"],
-                    ssml_text=ssml_text,
-                    duration_seconds=duration,
-                    segment_type=seg_data.get("segment_type", "main"),
-                    notes=seg_data.get("notes")
-                )
-                
-                current_script.segments.append(segment)
-                current_script.estimated_duration_seconds += duration
-            
-            # 更新usage信息
-            if usage_dict:
-                current_script.metadata['usage'] = usage_dict
-            
-            return current_script
+            return self._parse_expansion_response(response, language)
             
         except Exception as e:
             logger.error(f"❌ 脚本扩展失败: {e}")
-            # 扩展失败时返回原脚本
-            return current_script
+            # 扩展失败时跳过该部分
+            return None
+
+    def _parse_expansion_response(self, response, language: str):
+        """解析扩展响应为 (新段落列表, token 使用统计)"""
+        expansion_json = response.choices[0].message.content
+        expansion_data = orjson.loads(expansion_json)
+        
+        # 提取token使用统计
+        usage = TokenUsage.from_openai(response.usage) if getattr(response, 'usage', None) else None
+        
+        # 解析新段落
+        segments = []
+        for seg_data in expansion_data.get("segments", []):
+            text = seg_data["text"]
+            duration = self._estimate_duration(text, language)
+            
+            ssml_text = self._text_to_ssml(text, language)
+            
+            segments.append(ScriptSegment(
+                speaker_id=seg_data.get("speaker_id", "speaker_1"),
+                speaker_name=seg_data.get("speaker_name", "Unknown"),
+                text=seg_data["text"],
+                ssml_text=ssml_text,
+                duration_seconds=duration,
+                segment_type=seg_data.get("segment_type", "main"),
+                notes=seg_data.get("notes"),
+                char_count=ssml_char_count(ssml_text)
+            ))
+        
+        return segments, usage
     
+    def _prepare_segment(self, text: str, language: str) -> tuple:
+        """计算单个段落的 (估算时长, SSML 文本)"""
+        return self._estimate_duration(text, language), self._text_to_ssml(text, language)
+
     def _estimate_duration(self, text: str, language: str) -> float:
         """
         根据语言智能估算文本的播报时长
@@ -883,54 +1390,25 @@ class LLMScriptGenerator:
         Returns:
             估算的秒数
         """
-        # 中文系语言（包括简体中文、繁体中文）
-        if language.startswith("zh") or language.startswith("cmn"):
-            # 中文平均语速约 4-5 字/秒
-            # 播客通常较慢，使用 3.5 字/秒
-            char_count = len([c for c in text if '\u4e00' <= c <= '\u9fff'])  # 只计算汉字
-            return char_count / 3.5
-        
-        # 日文
-        elif language.startswith("ja"):
-            # 日文语速类似中文，约 4 字/秒
-            # 包含平假名、片假名、汉字
-            char_count = len([c for c in text if (
-                ('\u3040' <= c <= '\u309f') or  # 平假名
-                ('\u30a0' <= c <= '\u30ff') or  # 片假名
-                ('\u4e00' <= c <= '\u9fff')     # 汉字
-            )])
-            return char_count / 4.0
-        
-        # 韩文
-        elif language.startswith("ko"):
-            # 韩文语速约 4-5 字/秒
-            char_count = len([c for c in text if '\uac00' <= c <= '\ud7af'])  # 韩文字符
-            return char_count / 4.5
-        
-        # 英文等西方语言（默认）
-        else:
-            # 英文平均语速约 150-160 词/分钟
-            # 即 2.5-2.7 词/秒，播客通常较慢，使用 2.5 词/秒
-            word_count = len(text.split())
-            return word_count / 2.5
+        profile = _language_profile(language)
+        if profile.char_pattern is None:
+            # 英文等西方语言：按空白分词
+            return len(text.split()) / profile.rate
+        return len(profile.char_pattern.findall(text)) / profile.rate
     
     def _text_to_ssml(self, text: str, language: str) -> str:
         """将文本转换为 SSML 格式"""
         
-        # 基础 SSML 包装
-        ssml = f'<speak>{text}</speak>'
-        
         # 添加语言和语音属性
         if language.startswith("zh"):
             # 中文：添加断句和自然停顿
-            ssml = ssml.replace("。", '<break time="500ms"/>')
-            ssml = ssml.replace("，", '<break time="200ms"/>')
+            text = _ZH_SSML_RE.sub(lambda m: _ZH_SSML_MAP[m.group()], text)
         elif language.startswith("en"):
             # 英文：添加重音和停顿
-            ssml = ssml.replace("!", '<emphasis level="strong">!</emphasis><break time="300ms"/>')
-            ssml = ssml.replace("?", '<break time="300ms"/>')
+            text = _EN_SSML_RE.sub(lambda m: _EN_SSML_MAP[m.group()], text)
         
-        return ssml
+        # 基础 SSML 包装
+        return f'<speak>{text}</speak>'
     
     def save_script(
         self,
@@ -942,17 +1420,17 @@ class LLMScriptGenerator:
         output_dir = Path(output_path).parent
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(script.to_dict(), f, indent=2, ensure_ascii=False)
+        with open(output_path, 'wb') as f:
+            f.write(script.to_json_bytes())
         
-        logger.info(f"✅ 脚本已保存: {output_path}")
+        logger.info("✅ 脚本已保存: %s", output_path)
 
 
 # ============================================================================
 # 演示用法
 # ============================================================================
 
-def main():
+async def main():
     """演示脚本生成"""
     
     print("\n" + "="*80)
@@ -962,21 +1440,34 @@ def main():
     # 初始化生成器
     generator = LLMScriptGenerator(model="gpt-4-mini")
     
-    # 示例 1: 加州旅游
-    print("【示例 1】加州旅游播客")
+    # 两个示例互不依赖，并发生成
+    print("【示例 1】加州旅游播客 /【示例 2】GPU 选购指南播客")
     print("-" * 80)
     
-    script1 = generator.generate_script(
-        topic="加州旅游必去的景点和体验，包括旧金山、洛杉矶、圣地亚哥等地的推荐",
-        num_speakers=2,
-        duration_minutes=5,
-        language="zh-CN",
-        tone=PodcastTone.ENTERTAINING,
-        dialogue_style=DialogueStyle.CONVERSATION,
-        speaker_names=["Amy", "Tom"],
-        additional_context="目标听众是计划去加州旅游的年轻人"
+    script1, script2 = await asyncio.gather(
+        generator.generate_script_async(
+            topic="加州旅游必去的景点和体验，包括旧金山、洛杉矶、圣地亚哥等地的推荐",
+            num_speakers=2,
+            duration_minutes=5,
+            language="zh-CN",
+            tone=PodcastTone.ENTERTAINING,
+            dialogue_style=DialogueStyle.CONVERSATION,
+            speaker_names=["Amy", "Tom"],
+            additional_context="目标听众是计划去加州旅游的年轻人"
+        ),
+        generator.generate_script_async(
+            topic="2025年GPU显卡选购指南，对比NVIDIA RTX和AMD的性能和价格，适合游戏和AI应用",
+            num_speakers=2,
+            duration_minutes=5,
+            language="zh-CN",
+            tone=PodcastTone.EDUCATIONAL,
+            dialogue_style=DialogueStyle.INTERVIEW,
+            speaker_names=["主持人小李", "硬件专家王博士"],
+            additional_context="目标听众是想要升级GPU的开发者和游戏玩家"
+        ),
     )
     
+    print("\n【示例 1】加州旅游播客")
     print(f"✅ 生成完成!")
     print(f"   标题: {script1.title}")
     print(f"   描述: {script1.description}")
@@ -984,34 +1475,20 @@ def main():
     print(f"   时长: {script1.estimated_duration_seconds:.1f} 秒")
     print()
     
-    # 保存脚本
-    script1.save_path = "outputs/script_california_tour.json"
-    generator.save_script(script1, script1.save_path)
-    
-    # 示例 2: GPU 选购指南
     print("\n【示例 2】GPU 选购指南播客")
-    print("-" * 80)
-    
-    script2 = generator.generate_script(
-        topic="2025年GPU显卡选购指南，对比NVIDIA RTX和AMD的性能和价格，适合游戏和AI应用",
-        num_speakers=2,
-        duration_minutes=5,
-        language="zh-CN",
-        tone=PodcastTone.EDUCATIONAL,
-        dialogue_style=DialogueStyle.INTERVIEW,
-        speaker_names=["主持人小李", "硬件专家王博士"],
-        additional_context="目标听众是想要升级GPU的开发者和游戏玩家"
-    )
-    
     print(f"✅ 生成完成!")
     print(f"   标题: {script2.title}")
     print(f"   段落: {len(script2.segments)}")
     print(f"   时长: {script2.estimated_duration_seconds:.1f} 秒")
     
-    generator.save_script(script2, "outputs/script_gpu_guide.json")
+    # 保存脚本（在线程中并发写盘）
+    await asyncio.gather(
+        asyncio.to_thread(generator.save_script, script1, "outputs/script_california_tour.json"),
+        asyncio.to_thread(generator.save_script, script2, "outputs/script_gpu_guide.json"),
+    )
     
     print("\n✅ 所有脚本生成完成!")
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
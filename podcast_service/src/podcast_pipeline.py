@@ -13,14 +13,33 @@ AI播客生成Pipeline - 生产级系统
 """
 
 import os
+import re
 import json
+import hashlib
+import asyncio
+import functools
 import logging
+import multiprocessing
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
+from dataclasses import asdict, dataclass, field
+from functools import cached_property
 from enum import Enum
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader  # libyaml C 解析器
+except ImportError:
+    from yaml import SafeLoader
 from datetime import datetime
+from google.api_core import exceptions as gapi_exceptions
+from google.api_core.retry import Retry, if_exception_type
+from google.api_core.retry_async import AsyncRetry
 from google.cloud import texttospeech
 from pydub import AudioSegment
 import io
@@ -35,6 +54,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# SSML 标签（估算朗读时长时剔除）
+_SSML_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _ssml_word_count(text: str) -> int:
+    """统计 SSML 中朗读的词数（标签替换为空格后按空白切分，两步均在 C 层完成）"""
+    return len(_SSML_TAG_RE.sub(' ', text).split())
+
 # ============================================================================
 # 语言代码映射 - 处理TTS和LLM之间的语言代码差异
 # ============================================================================
@@ -52,6 +79,9 @@ LANGUAGE_CODE_MAPPING = {
     "ja-JP": "ja-JP",       # 日语（无需转换）
 }
 
+# 反向映射（LLM语言代码 -> TTS语言代码），模块加载时构建一次
+REVERSE_LANGUAGE_CODE_MAPPING = {v: k for k, v in LANGUAGE_CODE_MAPPING.items()}
+
 def get_llm_language_code(tts_language_code: str) -> str:
     """
     将TTS语言代码转换为LLM语言代码
@@ -74,9 +104,7 @@ def get_tts_language_code(llm_language_code: str) -> str:
     Returns:
         Google TTS使用的语言代码
     """
-    # 创建反向映射
-    reverse_mapping = {v: k for k, v in LANGUAGE_CODE_MAPPING.items()}
-    return reverse_mapping.get(llm_language_code, llm_language_code)
+    return REVERSE_LANGUAGE_CODE_MAPPING.get(llm_language_code, llm_language_code)
 
 # ============================================================================
 # 数据模型
@@ -91,7 +119,7 @@ class SpeakerRole(Enum):
     INVESTOR = "Investor"
     ANALYST = "Analyst"
 
-@dataclass
+@dataclass(slots=True)
 class Speaker:
     """讲话人信息"""
     id: str
@@ -100,8 +128,12 @@ class Speaker:
     voice_name: str
     language_code: str
     gender: str
+    lang_prefix: str = field(init=False, repr=False)  # 如 "en"，构建时从 language_code 拆出
+    
+    def __post_init__(self):
+        self.lang_prefix = self.language_code.split('-')[0]
 
-@dataclass
+@dataclass(slots=True)
 class DialogueSegment:
     """对话段落"""
     speaker_id: str
@@ -109,6 +141,7 @@ class DialogueSegment:
     estimated_duration_seconds: float = 0.0
     audio_bytes: Optional[bytes] = None
     
+# 每期只有一个实例，且 by_id 依赖 cached_property（需要 __dict__），不使用 slots
 @dataclass
 class PodcastConfig:
     """播客配置"""
@@ -118,8 +151,13 @@ class PodcastConfig:
     duration_minutes: int
     speakers: List[Speaker] = field(default_factory=list)
     metadata: Dict[str, Any] = field(default_factory=dict)
+    
+    @cached_property
+    def by_id(self) -> Dict[str, Speaker]:
+        """讲话人 id -> Speaker（首次访问时构建）"""
+        return {s.id: s for s in self.speakers}
 
-@dataclass
+@dataclass(slots=True)
 class NewsData:
     """新闻数据注入"""
     headlines: List[str]
@@ -131,6 +169,13 @@ class NewsData:
 # 模板管理器
 # ============================================================================
 
+@functools.lru_cache(maxsize=8)
+def _load_yaml(path: str, mtime_ns: int) -> Dict:
+    """解析 YAML 文件；按 (路径, 修改时间) 缓存，文件未变时多个实例共用同一结果"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=SafeLoader) or {}
+
+
 class TemplateManager:
     """加载和管理YAML模板"""
     
@@ -144,8 +189,7 @@ class TemplateManager:
             logger.warning(f"模板文件不存在: {self.config_path}")
             return {}
         
-        with open(self.config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+        config = _load_yaml(str(self.config_path), self.config_path.stat().st_mtime_ns)
         
         logger.info(f"✅ 加载模板: {list(config.get('styles', {}).keys())}")
         return config
@@ -162,21 +206,71 @@ class TemplateManager:
 # 内容生成器 (LLM集成点)
 # ============================================================================
 
+# 提示词的静态部分固定为模块常量：每次请求的前缀逐字节相同，
+# 才能命中 OpenAI 自动前缀缓存 / Anthropic cache_control 缓存。
+# 前缀中不能出现时间戳、主题等逐次变化的内容，这些一律放在最后。
+
+# 单段落生成的系统提示词
+_DIALOGUE_SYSTEM_PROMPT = """你是一位资深的播客脚本编剧。请为指定段落写一段自然的播客对话。
+
+输出要求：
+- 只返回一个完整的 <speak>...</speak> SSML 文档，不要附加任何说明
+- 可使用 <break/> 和 <emphasis> 标签控制停顿和重音
+- 内容紧扣主题和上下文，符合讲话人的角色"""
+
+# 整期节目一次生成时的系统提示词（要求以 JSON 对象返回所有段落）
+_EPISODE_SYSTEM_PROMPT = """你是一位资深的播客脚本编剧。请一次性写出整期节目的所有段落。
+
+输出要求：
+- 只返回一个 JSON 对象，格式为 {"segments": [{"name": "段落名", "ssml": "<speak>...</speak>"}]}
+- 按请求中列出的顺序，每个段落恰好一项，name 与请求中的段落名完全一致
+- 每个 ssml 都是完整的 <speak>...</speak> 文档，可使用 <break/> 和 <emphasis> 标签
+- 各段落内容前后衔接，不要重复开场白"""
+
 class ContentGenerator:
     """
     使用LLM生成播客内容
     支持: mock (快速演示) | openai (GPT-4-mini) | anthropic (待实现) | vertex_ai (待实现)
     """
     
-    def __init__(self, model: str = "openai", api_key: Optional[str] = None):
+    # Mock 对话模板，按 (段落类型, 语言前缀) 查找
+    _MOCK_TEMPLATES = {
+        ("opening", "en"): '<speak>Welcome to our show. I\'m {speaker}. Today we discuss {topic}.</speak>',
+        ("analysis", "en"): '<speak>{speaker} explains: {topic} is important because <break time="300ms"/> it affects market dynamics.</speak>',
+        ("reaction", "en"): '<speak><emphasis level="strong">Wow!</emphasis> <break time="300ms"/> That\'s really interesting!</speak>',
+        ("opening", "ko"): '<speak>안녕하세요. 저는 {speaker}입니다. 오늘 {topic}에 대해 얘기하겠습니다.</speak>',
+    }
+    _MOCK_DEFAULT = '<speak>Default content</speak>'
+    
+    def __init__(
+        self,
+        model: str = "openai",
+        api_key: Optional[str] = None,
+        cache_path: Optional[str] = None,
+        cache_ttl_seconds: float = 7 * 24 * 3600
+    ):
         """
         model: "mock" | "openai" | "anthropic" | "vertex_ai"
         api_key: API 密钥 (如果为 None 则从环境变量读取)
+        cache_path: 对话缓存 SQLite 文件 (默认 $CACHE_DIR/dialogue_cache.sqlite3)
+        cache_ttl_seconds: 缓存有效期 (秒)
         """
         self.model = model
         self.api_key = api_key
         self.llm_generator = None
         
+        # 两级缓存：进程内 dict + SQLite 持久化（相同输入直接复用，不再调用 LLM）
+        cache_path = Path(cache_path or Path(os.getenv('CACHE_DIR', 'data/cache')) / 'dialogue_cache.sqlite3')
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._memory_cache: Dict[str, str] = {}
+        self._cache_lock = threading.Lock()
+        self._cache_db = sqlite3.connect(str(cache_path), check_same_thread=False)
+        self._cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, text TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        self._cache_db.commit()
+        
         if model == "openai":
             try:
                 from src.llm_script_generator import LLMScriptGenerator, PodcastTone, DialogueStyle
@@ -187,6 +281,14 @@ class ContentGenerator:
                 self.model = "mock"
         else:
             logger.info(f"初始化内容生成器: {model}")
+        
+        # 生成函数在初始化时确定一次，调用路径上不再逐次判断模型
+        self._dispatch = {
+            "mock": self._generate_mock_dialogue,
+            "openai": self._generate_openai_dialogue,
+            "anthropic": self._generate_anthropic_dialogue,
+        }.get(self.model)
+        self._use_cache = self.model != "mock"
     
     def generate_dialogue(
         self,
@@ -208,14 +310,151 @@ class ContentGenerator:
             生成的对话文本 (SSML格式)
         """
         
-        if self.model == "mock":
-            return self._generate_mock_dialogue(topic, speakers, segment_type, context)
-        elif self.model == "openai":
-            return self._generate_openai_dialogue(topic, speakers, segment_type, context)
-        elif self.model == "anthropic":
-            return self._generate_anthropic_dialogue(topic, speakers, segment_type, context)
-        else:
+        if self._dispatch is None:
             raise ValueError(f"未知模型: {self.model}")
+        if not self._use_cache:
+            return self._dispatch(topic, speakers, segment_type, context)
+        
+        key = self._cache_key(topic, speakers, segment_type, context)
+        cached = self._cache_get(key)
+        if cached is not None:
+            logger.info(f"💾 对话缓存命中: {segment_type}")
+            return cached
+        
+        text = self._dispatch(topic, speakers, segment_type, context)
+        if text:
+            self._cache_put(key, text)
+        return text
+    
+    def generate_episode(
+        self,
+        topic: str,
+        segment_specs: List[Tuple[str, List[Speaker]]],
+        context: Optional[Dict] = None
+    ) -> Dict[str, str]:
+        """
+        一次生成整期节目的所有段落
+        
+        只发出一次 LLM 请求（JSON 输出），系统提示词和上下文只计费一次；
+        已缓存的段落不再请求，模型漏掉的段落逐个补生成。
+        
+        Args:
+            topic: 讨论主题
+            segment_specs: [(段落名, 讲话人列表), ...]，按节目顺序
+            context: 上下文信息 (新闻、数据等)
+        
+        Returns:
+            {段落名: SSML 文本}
+        """
+        
+        if self.model != "openai" or self.llm_generator is None:
+            return {
+                name: self.generate_dialogue(topic, speakers, name, context)
+                for name, speakers in segment_specs
+            }
+        
+        results: Dict[str, str] = {}
+        missing = []
+        for name, speakers in segment_specs:
+            cached = self._cache_get(self._cache_key(topic, speakers, name, context))
+            if cached is not None:
+                results[name] = cached
+            else:
+                missing.append((name, speakers))
+        if missing:
+            logger.info(f"🤖 单次请求生成 {len(missing)} 个段落 (缓存命中 {len(results)})...")
+            generated = self._generate_openai_episode(topic, missing, context)
+            for name, speakers in missing:
+                text = generated.get(name)
+                if not text:
+                    logger.warning(f"⚠️  整期生成缺少段落 {name}，单独补生成")
+                    text = self.generate_dialogue(topic, speakers, name, context)
+                else:
+                    self._cache_put(self._cache_key(topic, speakers, name, context), text)
+                results[name] = text
+        return results
+    
+    def _generate_openai_episode(
+        self,
+        topic: str,
+        segment_specs: List[Tuple[str, List[Speaker]]],
+        context: Optional[Dict]
+    ) -> Dict[str, str]:
+        """单次 OpenAI 请求生成多个段落，返回 {段落名: SSML}"""
+        
+        language = segment_specs[0][1][0].language_code if segment_specs[0][1] else "en-US"
+        segment_lines = "\n".join(
+            f"- {name}: {self._describe_speakers(speakers)}"
+            for name, speakers in segment_specs
+        )
+        # 语言和段落结构只取决于模板，放进稳定前缀；主题和上下文放在最后
+        static_prefix = (
+            f"{_EPISODE_SYSTEM_PROMPT}\n\n"
+            f"语言: {language}\n"
+            f"需要生成的段落（按顺序）:\n{segment_lines}"
+        )
+        
+        response = self.llm_generator._chat_completions_create_by_model(
+            messages=self._build_prompt(static_prefix, self._dynamic_suffix(topic, context)),
+            max_output_tokens=4000,
+            response_format={"type": "json_object"},
+        )
+        try:
+            payload = json.loads(response.choices[0].message.content or "{}")
+        except json.JSONDecodeError as e:
+            logger.warning(f"⚠️  整期生成返回的 JSON 无法解析: {e}")
+            return {}
+        return {
+            item.get("name"): item.get("ssml")
+            for item in payload.get("segments", [])
+            if isinstance(item, dict)
+        }
+    
+    def _cache_key(
+        self,
+        topic: str,
+        speakers: List[Speaker],
+        segment_type: str,
+        context: Optional[Dict]
+    ) -> str:
+        """由规范化的输入计算缓存键"""
+        payload = json.dumps(
+            {
+                "model": self.model,
+                "topic": topic,
+                "seg": segment_type,
+                "speakers": [(s.id, s.role.value, s.language_code) for s in speakers],
+                "ctx": context,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+    
+    def _cache_get(self, key: str) -> Optional[str]:
+        """先查内存再查 SQLite；过期条目视为未命中"""
+        with self._cache_lock:
+            text = self._memory_cache.get(key)
+            if text is not None:
+                return text
+            row = self._cache_db.execute(
+                "SELECT text FROM cache WHERE key = ? AND ts >= ?",
+                (key, time.time() - self.cache_ttl_seconds)
+            ).fetchone()
+            if row is None:
+                return None
+            self._memory_cache[key] = row[0]
+            return row[0]
+    
+    def _cache_put(self, key: str, text: str) -> None:
+        with self._cache_lock:
+            self._memory_cache[key] = text
+            self._cache_db.execute(
+                "INSERT OR REPLACE INTO cache (key, text, ts) VALUES (?, ?, ?)",
+                (key, text, time.time())
+            )
+            self._cache_db.commit()
     
     def _generate_mock_dialogue(
         self,
@@ -226,32 +465,63 @@ class ContentGenerator:
     ) -> str:
         """Mock实现 - 用于演示"""
         
-        mock_templates = {
-            "opening_en": '<speak>Welcome to our show. I\'m {speaker}. Today we discuss {topic}.</speak>',
-            "analysis_en": '<speak>{speaker} explains: {topic} is important because <break time="300ms"/> it affects market dynamics.</speak>',
-            "reaction_en": '<speak><emphasis level="strong">Wow!</emphasis> <break time="300ms"/> That\'s really interesting!</speak>',
-            "opening_ko": '<speak>안녕하세요. 저는 {speaker}입니다. 오늘 {topic}에 대해 얘기하겠습니다.</speak>',
-        }
-        
-        template_key = f"{segment_type}_{speakers[0].language_code.split('-')[0]}"
-        template = mock_templates.get(template_key, '<speak>Default content</speak>')
+        speaker = speakers[0]
+        template = self._MOCK_TEMPLATES.get((segment_type, speaker.lang_prefix), self._MOCK_DEFAULT)
+        return template.format(speaker=speaker.name, topic=topic)
+    
+    @staticmethod
+    def _describe_speakers(speakers: List[Speaker]) -> str:
+        return ", ".join(f"{s.name} ({s.role.value})" for s in speakers) or "任意主持人"
+    
+    @staticmethod
+    def _dynamic_suffix(topic: str, context: Optional[Dict]) -> str:
+        """逐次变化的部分（主题、上下文），始终放在提示词末尾"""
+        context_text = json.dumps(context, ensure_ascii=False, sort_keys=True, default=str) if context else '无'
+        return f"主题: {topic}\n上下文: {context_text}"
+    
+    @staticmethod
+    def _build_prompt(static_prefix: str, dynamic_suffix: str) -> List[Dict[str, str]]:
+        """
+        组装 OpenAI 消息：静态前缀作为 system，动态内容作为 user
         
-        return template.format(speaker=speakers[0].name, topic=topic)
+        OpenAI 对相同的长前缀自动缓存（按前缀逐 token 匹配），
+        因此静态前缀必须逐字节稳定，模型和采样参数也保持固定。
+        """
+        return [
+            {"role": "system", "content": static_prefix},
+            {"role": "user", "content": dynamic_suffix},
+        ]
     
     def _generate_openai_dialogue(self, topic, speakers, segment_type, context):
-        """集成OpenAI GPT API"""
-        # 实现示例
-        # from openai import OpenAI
-        # client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        # response = client.chat.completions.create(...)
-        pass
+        """集成OpenAI GPT API（静态前缀在前，便于命中前缀缓存）"""
+        if self.llm_generator is None:
+            return None
+        
+        language = speakers[0].language_code if speakers else "en-US"
+        static_prefix = (
+            f"{_DIALOGUE_SYSTEM_PROMPT}\n\n"
+            f"语言: {language}\n"
+            f"段落: {segment_type}\n"
+            f"讲话人: {self._describe_speakers(speakers)}"
+        )
+        response = self.llm_generator._chat_completions_create_by_model(
+            messages=self._build_prompt(static_prefix, self._dynamic_suffix(topic, context)),
+            max_output_tokens=1500,
+        )
+        return (response.choices[0].message.content or "").strip() or None
     
     def _generate_anthropic_dialogue(self, topic, speakers, segment_type, context):
         """集成Anthropic Claude API"""
-        # 实现示例
+        # 实现示例（静态前缀标记 cache_control，动态内容放在其后）
         # from anthropic import Anthropic
         # client = Anthropic()
-        # response = client.messages.create(...)
+        # response = client.messages.create(
+        #     system=[
+        #         {"type": "text", "text": _DIALOGUE_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}},
+        #     ],
+        #     messages=[{"role": "user", "content": self._dynamic_suffix(topic, context)}],
+        #     ...
+        # )
         pass
 
 # ============================================================================
@@ -286,59 +556,162 @@ class DialogueBuilder:
         self.segments = []
         
         structure = template.get('structure', {})
+        context = asdict(data) if data else None
         
-        for segment_name, segment_config in structure.items():
-            logger.info(f"  构建 {segment_name}...")
-            
-            # 获取此段落的讲话人
-            speaker_ids = segment_config.get('speakers', [])
-            speakers = [s for s in self.config.speakers if s.id in speaker_ids]
-            
-            # 生成对话内容
-            text = self.content_gen.generate_dialogue(
-                topic=self.config.metadata.get('topic', 'General Discussion'),
-                speakers=speakers,
-                segment_type=segment_name,
-                context=data.__dict__ if data else None
-            )
-            
-            # 估算时长
-            word_count = len(text.split())
-            estimated_duration = word_count / 2.5  # 约2.5字/秒
-            
-            # 创建段落
-            segment = DialogueSegment(
-                speaker_id=speakers[0].id if speakers else "unknown",
-                text=text,
-                estimated_duration_seconds=estimated_duration
-            )
-            
-            self.segments.append(segment)
+        # 整期节目一次请求生成，再按模板结构顺序映射回段落
+        segment_specs = [
+            (segment_name, self._segment_speakers(segment_config))
+            for segment_name, segment_config in structure.items()
+        ]
+        texts = self.content_gen.generate_episode(
+            topic=self.config.metadata.get('topic', 'General Discussion'),
+            segment_specs=segment_specs,
+            context=context
+        )
+        
+        self.segments = [
+            self._make_segment(speakers, texts.get(segment_name) or "")
+            for segment_name, speakers in segment_specs
+        ]
         
         logger.info(f"✅ 构建完成: {len(self.segments)} 个段落")
         return self.segments
+    
+    async def build_from_template_async(
+        self,
+        template: Dict,
+        data: Optional[NewsData] = None
+    ) -> List[DialogueSegment]:
+        """build_from_template 的异步版本：LLM 请求是阻塞的，放到线程中执行"""
+        return await asyncio.to_thread(self.build_from_template, template, data)
+    
+    def _segment_speakers(self, segment_config: Dict) -> List[Speaker]:
+        """获取段落配置中的讲话人"""
+        by_id = self.config.by_id
+        return [by_id[i] for i in segment_config.get('speakers', []) if i in by_id]
+    
+    @staticmethod
+    def _make_segment(speakers: List[Speaker], text: str) -> DialogueSegment:
+        """根据生成的文本创建段落"""
+        
+        # 估算时长（只统计朗读的词，不计 SSML 标签）
+        word_count = _ssml_word_count(text)
+        estimated_duration = word_count / 2.5  # 约2.5字/秒
+        
+        return DialogueSegment(
+            speaker_id=speakers[0].id if speakers else "unknown",
+            text=text,
+            estimated_duration_seconds=estimated_duration
+        )
 
 # ============================================================================
 # TTS合成引擎
 # ============================================================================
 
+# 配额耗尽 (429) 和服务端临时错误按指数退避（带抖动）重试，而不是让整期节目失败
+_TTS_RETRYABLE = if_exception_type(
+    gapi_exceptions.ResourceExhausted,
+    gapi_exceptions.ServiceUnavailable,
+    gapi_exceptions.DeadlineExceeded,
+    gapi_exceptions.InternalServerError,
+)
+_TTS_RETRY = Retry(predicate=_TTS_RETRYABLE, initial=1.0, maximum=32.0, multiplier=2.0, timeout=180.0)
+_TTS_RETRY_ASYNC = AsyncRetry(predicate=_TTS_RETRYABLE, initial=1.0, maximum=32.0, multiplier=2.0, timeout=180.0)
+
+
+class _AsyncRateLimiter:
+    """令牌桶限速：每分钟最多 rpm 个请求，允许一次性突发 rpm 个"""
+    
+    def __init__(self, rpm: int):
+        self._rate = rpm / 60.0
+        self._capacity = float(rpm)
+        self._tokens = float(rpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
 class TTSSynthesizer:
     """Google Cloud TTS合成"""
     
-    def __init__(self, project_id: str = None):
+    # 音频参数不可变，所有实例共用
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding.MP3,
+        sample_rate_hertz=22050,
+        speaking_rate=1.0,
+        pitch=0.0,
+    )
+    
+    # gRPC 客户端（通道、TLS、凭据）首次使用时创建，之后所有实例复用
+    _client: Optional[texttospeech.TextToSpeechClient] = None
+    _client_lock = threading.Lock()
+    
+    def __init__(self, project_id: str = None, cache_dir: str = "data/tts_cache"):
         self.project_id = project_id or os.getenv('GOOGLE_CLOUD_PROJECT')
-        self.client = texttospeech.TextToSpeechClient()
-        self.audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            sample_rate_hertz=22050,
-            speaking_rate=1.0,
-            pitch=0.0,
-        )
+        # 合成结果磁盘缓存：相同 SSML + 声音 + 音频参数直接复用，不再调用 TTS
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # 每分钟请求上限（按项目 TTS 配额设置）
+        self.rpm = int(os.getenv('TTS_RPM', '1000'))
     
-    def synthesize_segment(self, segment: DialogueSegment, speaker: Speaker) -> bytes:
-        """合成单个段落"""
-        
-        request = texttospeech.SynthesizeSpeechRequest(
+    @classmethod
+    def _get_client(cls) -> texttospeech.TextToSpeechClient:
+        if cls._client is None:
+            with cls._client_lock:
+                if cls._client is None:
+                    cls._client = texttospeech.TextToSpeechClient()
+        return cls._client
+    
+    @property
+    def client(self) -> texttospeech.TextToSpeechClient:
+        return self._get_client()
+    
+    def _cache_path(self, segment: DialogueSegment, speaker: Speaker) -> Path:
+        """按合成输入计算缓存文件路径（内容寻址）"""
+        cfg = self.audio_config
+        key = hashlib.sha256(
+            f"{segment.text}|{speaker.voice_name}|{speaker.language_code}|"
+            f"{cfg.sample_rate_hertz}|{cfg.speaking_rate}|{cfg.pitch}".encode('utf-8')
+        ).hexdigest()
+        return self.cache_dir / f"{key}.mp3"
+    
+    def _read_cache(self, path: Path) -> Optional[bytes]:
+        """读取缓存音频，未命中返回 None"""
+        try:
+            audio_bytes = path.read_bytes()
+        except FileNotFoundError:
+            self.cache_misses += 1
+            return None
+        self.cache_hits += 1
+        return audio_bytes
+    
+    @staticmethod
+    def _write_cache(path: Path, audio_bytes: bytes) -> None:
+        """写入缓存（先写临时文件再原子替换，避免并发时读到半个文件）"""
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(audio_bytes)
+        os.replace(tmp_path, path)
+    
+    def _log_cache_stats(self) -> None:
+        total = self.cache_hits + self.cache_misses
+        if total:
+            logger.info(f"💾 TTS 缓存命中 {self.cache_hits}/{total}")
+    
+    def _build_request(self, segment: DialogueSegment, speaker: Speaker) -> texttospeech.SynthesizeSpeechRequest:
+        """构建单个段落的合成请求"""
+        return texttospeech.SynthesizeSpeechRequest(
             input=texttospeech.SynthesisInput(ssml=segment.text),
             voice=texttospeech.VoiceSelectionParams(
                 language_code=speaker.language_code,
@@ -346,8 +719,19 @@ class TTSSynthesizer:
             ),
             audio_config=self.audio_config,
         )
+    
+    def synthesize_segment(self, segment: DialogueSegment, speaker: Speaker) -> bytes:
+        """合成单个段落（优先读取磁盘缓存）"""
         
-        response = self.client.synthesize_speech(request=request)
+        cache_path = self._cache_path(segment, speaker)
+        cached = self._read_cache(cache_path)
+        if cached is not None:
+            return cached
+        
+        response = self.client.synthesize_speech(
+            request=self._build_request(segment, speaker), retry=_TTS_RETRY
+        )
+        self._write_cache(cache_path, response.audio_content)
         return response.audio_content
     
     def synthesize_all(
@@ -375,12 +759,122 @@ class TTSSynthesizer:
                 logger.error(f"    ❌ 失败: {str(e)}")
                 raise
         
+        self._log_cache_stats()
         return segments
+    
+    async def iter_synthesized_async(
+        self,
+        segments: List[DialogueSegment],
+        speaker_map: Dict[str, Speaker],
+        max_concurrency: int = 8
+    ) -> AsyncIterator[bytes]:
+        """
+        并发合成，并按段落顺序逐个产出音频
+        
+        所有请求同时发出；第 N 段一完成（且前面各段已产出）就立即交给下游，
+        混音可以在后面的段落仍在合成时开始。任一段失败时取消其余请求并抛出异常。
+        """
+        
+        total = len(segments)
+        logger.info(f"🔊 流水线合成 {total} 个段落 (并发上限 {max_concurrency})...")
+        
+        # 异步 gRPC 通道绑定到当前事件循环（generate 每次 asyncio.run 都是新循环），
+        # 本次所有段落共用一个客户端，结束时关闭通道
+        client = texttospeech.TextToSpeechAsyncClient()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        limiter = _AsyncRateLimiter(self.rpm)
+        
+        jobs = self._resolve_speakers(segments, speaker_map)
+        tasks = [
+            asyncio.create_task(self._synthesize_one_async(client, semaphore, limiter, idx, total, segment, speaker))
+            for idx, segment, speaker in jobs
+        ]
+        try:
+            for task, (_, segment, _) in zip(tasks, jobs):
+                await task
+                yield segment.audio_bytes
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await client.transport.close()
+        
+        self._log_cache_stats()
+    
+    @staticmethod
+    def _resolve_speakers(
+        segments: List[DialogueSegment],
+        speaker_map: Dict[str, Speaker]
+    ) -> List[Tuple[int, DialogueSegment, Speaker]]:
+        """匹配每个段落的讲话人，跳过找不到讲话人的段落"""
+        jobs = []
+        for idx, segment in enumerate(segments, 1):
+            speaker = speaker_map.get(segment.speaker_id)
+            if not speaker:
+                logger.warning(f"未找到讲话人: {segment.speaker_id}")
+                continue
+            jobs.append((idx, segment, speaker))
+        return jobs
+    
+    async def _synthesize_one_async(
+        self,
+        client: texttospeech.TextToSpeechAsyncClient,
+        semaphore: asyncio.Semaphore,
+        limiter: _AsyncRateLimiter,
+        idx: int,
+        total: int,
+        segment: DialogueSegment,
+        speaker: Speaker
+    ) -> None:
+        """异步合成单个段落（优先读取磁盘缓存），结果写入 segment.audio_bytes"""
+        cache_path = self._cache_path(segment, speaker)
+        cached = self._read_cache(cache_path)
+        if cached is not None:
+            segment.audio_bytes = cached
+            logger.info(f"  [{idx}/{total}] 💾 缓存命中 {speaker.name}")
+            return
+        async with semaphore:
+            await limiter.acquire()
+            response = await client.synthesize_speech(
+                request=self._build_request(segment, speaker), retry=_TTS_RETRY_ASYNC
+            )
+        segment.audio_bytes = response.audio_content
+        await asyncio.to_thread(self._write_cache, cache_path, response.audio_content)
+        logger.info(f"  [{idx}/{total}] ✅ 合成 {speaker.name}")
 
 # ============================================================================
 # 音频混音器
 # ============================================================================
 
+# MPEG 版本位 -> 采样率索引对应的采样率
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+# 渲染静音/转码时不写 ID3 和 Xing 头，使片段可以直接与 TTS 输出首尾相接
+_MP3_RAW_PARAMS = ["-id3v2_version", "0", "-write_xing", "0"]
+
+
+@functools.lru_cache(maxsize=8)
+def _silent_segment(pause_ms: int, frame_rate: int) -> AudioSegment:
+    """静音片段（AudioSegment 不可变，按时长和采样率缓存复用）"""
+    return AudioSegment.silent(duration=pause_ms, frame_rate=frame_rate)
+
+
+def _mp3_stream_params(data: bytes) -> Optional[Tuple[int, int]]:
+    """读取 MP3 首帧头，返回 (采样率, 声道数)；无法识别时返回 None"""
+    offset = 0
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        offset = 10 + size + (10 if data[5] & 0x10 else 0)
+    header = data[offset:offset + 4]
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    rates = _MP3_SAMPLE_RATES.get((header[1] >> 3) & 0x3)
+    sr_index = (header[2] >> 2) & 0x3
+    if rates is None or sr_index == 3:
+        return None
+    return rates[sr_index], 1 if (header[3] >> 6) == 3 else 2
+
+
 class AudioMixer:
     """混合和输出音频"""
     
@@ -391,52 +885,153 @@ class AudioMixer:
     def merge_segments(
         self,
         segments: List[DialogueSegment],
-        pause_ms: int = 200
-    ) -> AudioSegment:
-        """合并所有段落"""
+        pause_ms: int = 200,
+        bitrate: str = "192k"
+    ) -> Path:
+        """
+        合并已合成好的段落（同步入口，内部复用 merge_stream_async）
+        
+        Returns:
+            合并后的 MP3 临时文件路径（位于输出目录，交给 export 重命名）
+        """
         
         logger.info(f"📦 混音 {len(segments)} 个段落...")
         
-        silence = AudioSegment.silent(duration=pause_ms)
-        merged = None
+        audio_parts = [s.audio_bytes for s in segments if s.audio_bytes is not None]
+        if len(audio_parts) < len(segments):
+            logger.warning(f"跳过 {len(segments) - len(audio_parts)} 个空段落")
         
-        for segment in segments:
-            if segment.audio_bytes is None:
-                logger.warning(f"跳过空段落")
-                continue
-            
-            audio = AudioSegment.from_mp3(io.BytesIO(segment.audio_bytes))
-            
-            if merged is None:
-                merged = audio
-            else:
-                merged += silence + audio
+        async def stream() -> AsyncIterator[bytes]:
+            for audio_bytes in audio_parts:
+                yield audio_bytes
+        
+        return asyncio.run(self.merge_stream_async(stream(), pause_ms=pause_ms, bitrate=bitrate))
+    
+    async def merge_stream_async(
+        self,
+        audio_stream: AsyncIterator[bytes],
+        pause_ms: int = 200,
+        bitrate: str = "192k"
+    ) -> Path:
+        """
+        边接收边合并：按顺序到达的 MP3 段落直接写入 ffmpeg 的 stdin，
+        段落之间插入静音，合成与编码重叠进行
+        
+        Returns:
+            合并后的 MP3 临时文件路径（交给 export 重命名）
+        """
+        
+        fd, merged_path = tempfile.mkstemp(suffix=".mp3", prefix=".merge_", dir=self.output_dir)
+        os.close(fd)
+        merged_path = Path(merged_path)
         
-        if merged is None:
+        # ffmpeg 在第一段到达时启动：能识别其 MP3 参数则整条流直接拷贝（不重新编码），
+        # 参数不同的后续段落先转成相同参数
+        proc = None
+        params = None
+        silence = b""
+        count = 0
+        try:
+            async for audio_bytes in audio_stream:
+                if audio_bytes is None:
+                    continue
+                if proc is None:
+                    params = _mp3_stream_params(audio_bytes)
+                    silence = self._render_silence(pause_ms, params or (22050, 1))
+                    proc = await asyncio.create_subprocess_exec(
+                        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+                        '-f', 'mp3', '-i', 'pipe:0',
+                        *self._codec_args(params, bitrate), str(merged_path),
+                        stdin=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE
+                    )
+                elif params:
+                    audio_bytes = self._conform_mp3(audio_bytes, params)
+                if count:
+                    proc.stdin.write(silence)
+                proc.stdin.write(audio_bytes)
+                await proc.stdin.drain()
+                count += 1
+        except BaseException:
+            if proc is not None:
+                proc.kill()
+                await proc.wait()
+            merged_path.unlink(missing_ok=True)
+            raise
+        
+        if proc is None:
+            merged_path.unlink(missing_ok=True)
             raise ValueError("没有有效的音频段落")
         
-        logger.info(f"✅ 混音完成: {len(merged)/1000:.1f} 秒")
-        return merged
+        proc.stdin.close()
+        stderr = await proc.stderr.read()
+        if await proc.wait() != 0:
+            merged_path.unlink(missing_ok=True)
+            raise RuntimeError(f"ffmpeg 合并音频失败: {stderr.decode('utf-8', errors='replace').strip()}")
+        
+        logger.info(f"✅ 流式混音完成: {count} 个段落{'（直接拷贝，未重新编码）' if params else ''}")
+        return merged_path
+    
+    @staticmethod
+    def _codec_args(params: Optional[Tuple[int, int]], bitrate: str) -> List[str]:
+        """所有段落参数一致时直接拷贝 MP3 帧，否则用 libmp3lame 编码一次"""
+        if params:
+            return ['-c', 'copy']
+        return ['-c:a', 'libmp3lame', '-b:a', bitrate]
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def _render_silence(pause_ms: int, params: Tuple[int, int]) -> bytes:
+        """按给定 (采样率, 声道数) 渲染一段 MP3 静音（结果缓存，每种参数只编码一次）"""
+        frame_rate, channels = params
+        buffer = io.BytesIO()
+        _silent_segment(pause_ms, frame_rate).set_channels(channels).export(
+            buffer, format="mp3", parameters=_MP3_RAW_PARAMS
+        )
+        return buffer.getvalue()
+    
+    @staticmethod
+    def _conform_mp3(audio_bytes: bytes, params: Tuple[int, int]) -> bytes:
+        """参数与目标一致时原样返回，否则转码为目标采样率/声道"""
+        if _mp3_stream_params(audio_bytes) == params:
+            return audio_bytes
+        frame_rate, channels = params
+        buffer = io.BytesIO()
+        AudioSegment.from_mp3(io.BytesIO(audio_bytes)).set_frame_rate(frame_rate).set_channels(channels).export(
+            buffer, format="mp3", parameters=_MP3_RAW_PARAMS
+        )
+        return buffer.getvalue()
+    
+    @staticmethod
+    def _probe_duration(filepath: Path) -> float:
+        """用 ffprobe 读取音频时长（秒），失败时返回 0"""
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', str(filepath)],
+            capture_output=True, text=True
+        )
+        try:
+            return float(result.stdout.strip())
+        except ValueError:
+            return 0.0
     
     def export(
         self,
-        audio: AudioSegment,
-        podcast_name: str,
-        format: str = "mp3",
-        bitrate: str = "192k"
+        merged_path: Path,
+        podcast_name: str
     ) -> Path:
-        """导出音频"""
+        """导出音频（merge_stream_async 已完成编码，这里只做重命名，不再重新编码）"""
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{podcast_name}_{timestamp}.{format}"
+        filename = f"{podcast_name}_{timestamp}{merged_path.suffix}"
         filepath = self.output_dir / filename
         
         logger.info(f"💾 导出到: {filepath}")
         
-        audio.export(str(filepath), format=format, bitrate=bitrate)
+        os.replace(merged_path, filepath)
         
         file_size_mb = filepath.stat().st_size / (1024 * 1024)
-        duration_seconds = len(audio) / 1000
+        duration_seconds = self._probe_duration(filepath)
         
         logger.info(f"   文件大小: {file_size_mb:.2f} MB")
         logger.info(f"   时长: {int(duration_seconds/60)}分{int(duration_seconds%60)}秒")
@@ -455,11 +1050,44 @@ class PodcastPipeline:
         template_config: str = "config/podcast_style_templates.yaml",
         content_model: str = "openai"
     ):
+        self.template_config = template_config
+        self.content_model = content_model
         self.template_manager = TemplateManager(template_config)
         self.content_generator = ContentGenerator(model=content_model)
         self.synthesizer = TTSSynthesizer()
         self.mixer = AudioMixer()
     
+    def generate_batch(self, jobs: List[Dict], max_workers: Optional[int] = None) -> List[Path]:
+        """
+        多进程并行生成多期播客
+        
+        每个工作进程各自构建一个 Pipeline（各自的 gRPC 通道和缓存连接），
+        按 jobs 顺序返回输出路径。实际的扩展上限通常是 LLM/TTS 配额而非 CPU，
+        max_workers 应按配额设置。
+        
+        Args:
+            jobs: 每项为 generate() 的关键字参数
+                  (template_name, podcast_name, topic, data, custom_metadata)
+            max_workers: 进程数（默认 min(任务数, CPU 数)）
+        
+        Returns:
+            生成的音频文件路径列表
+        """
+        
+        if not jobs:
+            return []
+        max_workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+        logger.info(f"🏭 批量生成 {len(jobs)} 期播客 ({max_workers} 个进程)...")
+        
+        # gRPC 不支持 fork 后继续使用父进程的通道，使用 spawn 启动工作进程
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_batch_worker,
+            initargs=(self.template_config, self.content_model)
+        ) as pool:
+            return list(pool.map(_run_one_job, jobs))
+    
     def generate(
         self,
         template_name: str,
@@ -499,15 +1127,14 @@ class PodcastPipeline:
         dialogue_builder = DialogueBuilder(config, self.content_generator)
         segments = dialogue_builder.build_from_template(template, data)
         
-        # 4. 合成音频
-        speaker_map = {s.id: s for s in config.speakers}
-        segments = self.synthesizer.synthesize_all(segments, speaker_map)
-        
-        # 5. 混音
-        audio = self.mixer.merge_segments(segments)
+        # 4-5. 合成音频并混音（段落按顺序完成即送入 ffmpeg，合成与编码重叠）
+        speaker_map = config.by_id
+        merged_path = asyncio.run(self.mixer.merge_stream_async(
+            self.synthesizer.iter_synthesized_async(segments, speaker_map)
+        ))
         
         # 6. 导出
-        output_path = self.mixer.export(audio, podcast_name)
+        output_path = self.mixer.export(merged_path, podcast_name)
         
         logger.info('✅ 播客生成成功!\n')
         
@@ -555,6 +1182,20 @@ class PodcastPipeline:
             metadata=metadata
         )
 
+# 批量生成时每个工作进程持有的 Pipeline
+_worker_pipeline: Optional[PodcastPipeline] = None
+
+
+def _init_batch_worker(template_config: str, content_model: str) -> None:
+    """工作进程初始化：每个进程只构建一次 Pipeline"""
+    global _worker_pipeline
+    _worker_pipeline = PodcastPipeline(template_config=template_config, content_model=content_model)
+
+
+def _run_one_job(job: Dict) -> Path:
+    """在工作进程中生成一期播客（顶层函数，可被 pickle）"""
+    return _worker_pipeline.generate(**job)
+
 # ============================================================================
 # 使用示例
 # ============================================================================
@@ -73,6 +73,7 @@ gcloud run deploy "${SERVICE_NAME}" \
   --port 8080 \
   --cpu 1 \
   --memory 512Mi \
+  --concurrency 80 \
   --min-instances 0 \
   --max-instances 1 \
   --timeout 300s \
@@ -1,22 +1,36 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import gzip
+import hashlib
+import math
 import os
 import logging
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
 from threading import Event, Lock
 from typing import Dict, List, Optional, Any
+from zoneinfo import ZoneInfo
 
 import yfinance as yf
 import pandas as pd
 import numpy as np
 from fastapi import FastAPI, HTTPException, Query, Body # Added Body for batch_refresh
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 import pytz
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import fs as pafs
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage
-from google.api_core.exceptions import PreconditionFailed
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from modules._json import dumps_bytes, loads
+from modules._njit import NUMBA_AVAILABLE, njit
 from modules.options_summary import OptionsSummaryDeps, OptionsSummaryService, build_options_router
 
 # --- Logging Configuration ---
@@ -52,6 +66,46 @@ if not GCS_BUCKET_NAME:
     os.makedirs(LOCAL_FALLBACK_ANALYSIS_INDEX_DIR, exist_ok=True)
     os.makedirs(LOCAL_FALLBACK_EARNINGS_DIR, exist_ok=True)
 
+_GCS_CLIENT: Optional[storage.Client] = None
+_GCS_BUCKET: Optional[storage.Bucket] = None
+_GCS_CLIENT_LOCK = Lock()
+# requests 默认每个 host 只保留 10 个连接；批量线程池并发访问 GCS 时需要更大的连接池
+_GCS_HTTP_POOL_SIZE = max(10, int(os.environ.get("GCS_HTTP_POOL_SIZE", "32")))
+
+
+def _build_gcs_client() -> storage.Client:
+    """
+    构造带调优连接池的 storage.Client：连接池大小覆盖批量并发数，
+    并对 5xx 瞬时错误在传输层做有限次数的退避重试（urllib3 默认只重试幂等方法）。
+    """
+    credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(
+        pool_connections=_GCS_HTTP_POOL_SIZE,
+        pool_maxsize=_GCS_HTTP_POOL_SIZE,
+        max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=(500, 502, 503, 504), raise_on_status=False),
+    )
+    session.mount("https://", adapter)
+    return storage.Client(project=project, credentials=credentials, _http=session)
+
+
+def _gcs_bucket() -> storage.Bucket:
+    """进程内复用同一个 storage.Client / Bucket（HTTP 连接池与凭证只初始化一次，Client 线程安全）。"""
+    global _GCS_CLIENT, _GCS_BUCKET
+    if _GCS_BUCKET is None:
+        with _GCS_CLIENT_LOCK:
+            if _GCS_BUCKET is None:
+                _GCS_CLIENT = _build_gcs_client()
+                _GCS_BUCKET = _GCS_CLIENT.bucket(GCS_BUCKET_NAME)
+    return _GCS_BUCKET
+
+
+def _upload_json_gzip(blob: storage.Blob, payload: bytes, **kwargs: Any) -> None:
+    """以 gzip Content-Encoding 上传 JSON；读取端 (download_as_bytes / HTTP) 会自动解压。"""
+    blob.content_encoding = "gzip"
+    blob.upload_from_string(gzip.compress(payload, compresslevel=6), content_type="application/json", **kwargs)
+
+
 # GCS path for the dynamic ticker list file
 GCS_TICKER_LIST_BLOB_NAME = os.environ.get("GCS_TICKER_LIST_BLOB", "config/default_tickers.json")
 GENERATE_ANALYSIS_IN_BATCH = str(os.environ.get("GENERATE_ANALYSIS_IN_BATCH", "1")).strip().lower() not in {"0", "false", "no"}
@@ -60,16 +114,43 @@ GENERATE_ANALYSIS_IN_BATCH = str(os.environ.get("GENERATE_ANALYSIS_IN_BATCH", "1
 # --- FastAPI App Initialization ---
 app = FastAPI(title="Trading Data Service",
               description="提供股票行情、历史 K 线及特征工程数据的服务。",
-              version="1.0.0")
+              version="1.0.0",
+              default_response_class=ORJSONResponse)
 
 # --- In-process de-dup / throttling (best-effort; per Cloud Run instance) ---
 _REFRESH_LOCK = Lock()
 _REFRESH_INFLIGHT: Dict[str, Event] = {}
 _REFRESH_LAST_OK_AT: Dict[str, float] = {}
 _REFRESH_LAST_FAIL_AT: Dict[str, float] = {}
+# 请求路径上的后台刷新（stale-while-revalidate）；同一 ticker 由 _REFRESH_INFLIGHT 合并
+_REFRESH_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="historical-refresh")
+
+_QUOTE_LOCK = Lock()
+_QUOTE_CACHE: Dict[str, Dict[str, Any]] = {}
+_QUOTE_CACHE_TTL_SECONDS = float(os.environ.get("QUOTE_CACHE_TTL_SECONDS", "5"))
+
+_PRICE_SNAPSHOT_LOCK = Lock()
+_PRICE_SNAPSHOT_CACHE: Dict[str, Dict[str, Any]] = {}
+_PRICE_SNAPSHOT_CACHE_TTL_SECONDS = float(os.environ.get("PRICE_SNAPSHOT_CACHE_TTL_SECONDS", "30"))
+# 存储中找不到行情的 ticker（退市/拼写错误）也缓存一小段时间，避免每次请求都打到存储
+_PRICE_SNAPSHOT_NEGATIVE_TTL_SECONDS = float(os.environ.get("PRICE_SNAPSHOT_NEGATIVE_TTL_SECONDS", "120"))
+_PRICE_SNAPSHOT_WORKERS = 8
 
 _ANALYSIS_LOCK = Lock()
 _ANALYSIS_INFLIGHT: Dict[str, Event] = {}
+# 已落盘 analysis 的进程内缓存 ((ticker, date) -> 原始 JSON bytes)，TTL 与 blob 的 cache-control 一致
+_ANALYSIS_STORE_LOCK = Lock()
+_ANALYSIS_STORE_CACHE: Dict[tuple, Dict[str, Any]] = {}
+_ANALYSIS_STORE_CACHE_TTL_SECONDS = float(os.environ.get("ANALYSIS_STORE_CACHE_TTL_SECONDS", "600"))
+_ANALYSIS_STORE_CACHE_MAX_ENTRIES = 4096
+
+# 每日 AI Context 索引的进程内缓存 (index_date -> 条目列表)：当日索引在批量运行期间会变化，
+# 用短 TTL；历史日期的索引基本不再变化，用长 TTL。本实例写入索引后立即失效
+_DAILY_INDEX_CACHE_LOCK = Lock()
+_DAILY_INDEX_CACHE: Dict[date, Dict[str, Any]] = {}
+_DAILY_INDEX_CACHE_TODAY_TTL_SECONDS = float(os.environ.get("DAILY_INDEX_CACHE_TODAY_TTL_SECONDS", "30"))
+_DAILY_INDEX_CACHE_PAST_TTL_SECONDS = float(os.environ.get("DAILY_INDEX_CACHE_PAST_TTL_SECONDS", "3600"))
+_DAILY_INDEX_CACHE_MAX_ENTRIES = 64
 
 _EARNINGS_LOCK = Lock()
 _EARNINGS_INFLIGHT: Dict[str, Event] = {}
@@ -88,9 +169,10 @@ HISTORICAL_REFRESH_MAX_AGE_SECONDS = int(os.environ.get("HISTORICAL_REFRESH_MAX_
 
 # --- Global Constants ---
 # Timezone for scheduling/log timestamps.
-TIMEZONE = pytz.timezone(os.environ.get("ENGINE_TZ", 'America/Los_Angeles')) # 从环境变量获取时区
+# zoneinfo: datetime.now(tz) 比 pytz 快约一倍，且 replace(tzinfo=...) 不会落到 LMT 偏移
+TIMEZONE = ZoneInfo(os.environ.get("ENGINE_TZ", 'America/Los_Angeles')) # 从环境变量获取时区
 # US market clock for deciding whether a daily candle should be treated as finalized.
-MARKET_TIMEZONE = pytz.timezone(os.environ.get("MARKET_TZ", "America/New_York"))
+MARKET_TIMEZONE = ZoneInfo(os.environ.get("MARKET_TZ", "America/New_York"))
 MARKET_OPEN_HOUR = int(os.environ.get("MARKET_OPEN_HOUR", "9"))
 MARKET_OPEN_MINUTE = int(os.environ.get("MARKET_OPEN_MINUTE", "30"))
 MARKET_CLOSE_HOUR = int(os.environ.get("MARKET_CLOSE_HOUR", "16"))
@@ -156,7 +238,9 @@ _DEFAULT_HARDCODED_TICKERS = [
     "SHY",       # 1-3年短期美国国债ETF (iShares 1-3 Year Treasury Bond ETF)
 
 ] # 硬编码的默认股票列表，作为fallback
-_CURRENT_ACTIVE_TICKERS: List[str] = [] # 全局变量，用于存储动态加载或更新的股票列表
+# 全局变量，用于存储动态加载或更新的股票列表。只整体替换、从不原地修改：
+# 批量任务拿到的是调用时的快照，管理接口同时替换列表不会影响正在执行的任务
+_CURRENT_ACTIVE_TICKERS: tuple[str, ...] = ()
 
 # 财富自由图卡：前端请求的 Ticker 与批量数据/ yfinance 使用的符号映射
 _PORTFOLIO_TICKER_ALIASES = {
@@ -240,12 +324,16 @@ def _historical_storage_updated_at_utc(ticker: str) -> Optional[datetime]:
     t = ticker.upper()
     if GCS_BUCKET_NAME:
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
+            bucket = _gcs_bucket()
             blob = bucket.blob(_get_gcs_blob_name(t))
-            if not blob.exists():
-                return None
-            blob.reload()
+            try:
+                blob.reload()
+            except NotFound:
+                blob = bucket.blob(_get_legacy_gcs_blob_name(t))
+                try:
+                    blob.reload()
+                except NotFound:
+                    return None
             updated = blob.updated
             if updated is None:
                 return None
@@ -257,7 +345,9 @@ def _historical_storage_updated_at_utc(ticker: str) -> Optional[datetime]:
     try:
         filepath = _get_local_fallback_filepath(t)
         if not os.path.exists(filepath):
-            return None
+            filepath = _get_legacy_local_fallback_filepath(t)
+            if not os.path.exists(filepath):
+                return None
         return datetime.fromtimestamp(float(os.path.getmtime(filepath)), tz=pytz.UTC)
     except Exception as exc:
         logger.warning("读取 %s 本地历史数据更新时间失败: %s", t, exc)
@@ -284,8 +374,7 @@ def _needs_post_close_finalize_refresh(ticker: str, df: pd.DataFrame) -> bool:
     if not is_trading_day(today_market) or not _is_after_market_close(now_market):
         return False
 
-    sorted_df = df.sort_index()
-    last_date = sorted_df.index.max().date()
+    last_date = df.index.max().date()
     if last_date != today_market:
         return False
 
@@ -307,14 +396,13 @@ def _should_refresh_stored_daily(ticker: str, df: pd.DataFrame) -> bool:
     if df.empty or not isinstance(df.index, pd.DatetimeIndex):
         return False
 
-    sorted_df = df.sort_index()
-    last_date = sorted_df.index.max().date()
+    last_date = df.index.max().date()
     now_market = _now_in_market_timezone()
     latest_completed = _latest_completed_trading_day(now_market)
     if last_date < latest_completed:
         return True
 
-    if _needs_post_close_finalize_refresh(ticker, sorted_df):
+    if _needs_post_close_finalize_refresh(ticker, df):
         return True
 
     return False
@@ -339,10 +427,16 @@ def _should_refresh_on_request(ticker: str, df: pd.DataFrame) -> bool:
     return age >= float(max(60, HISTORICAL_REFRESH_MAX_AGE_SECONDS))
 
 
-def _maybe_refresh_daily_once(ticker: str, min_interval_seconds: int = 600, fail_backoff_seconds: int = 60) -> None:
+def _maybe_refresh_daily_once(
+    ticker: str,
+    min_interval_seconds: int = 600,
+    fail_backoff_seconds: int = 60,
+    wait_for_inflight: bool = True,
+) -> None:
     """
     Best-effort: ensure only one request per instance refreshes a ticker within a short time window.
     This is NOT a distributed lock; use it to reduce duplicate yfinance calls under burst traffic.
+    wait_for_inflight=False returns immediately when another refresh is already running.
     """
     t = ticker.upper()
     now = time.time()
@@ -365,7 +459,8 @@ def _maybe_refresh_daily_once(ticker: str, min_interval_seconds: int = 600, fail
 
     if wait_ev is not None:
         # Wait a bit so the next request can reuse fresh storage.
-        wait_ev.wait(timeout=12.0)
+        if wait_for_inflight:
+            wait_ev.wait(timeout=12.0)
         return
 
     ok = False
@@ -382,10 +477,47 @@ def _maybe_refresh_daily_once(ticker: str, min_interval_seconds: int = 600, fail
             if done is not None:
                 done.set()
 
+def _refresh_in_background(ticker: str) -> None:
+    try:
+        _maybe_refresh_daily_once(
+            ticker,
+            min_interval_seconds=HISTORICAL_REFRESH_MAX_AGE_SECONDS,
+            wait_for_inflight=False,
+        )
+    except Exception as exc:
+        logger.warning("后台刷新 %s 历史数据失败: %s", ticker, exc)
+
+
+def _load_historical_with_refresh(ticker: str, background: bool = False) -> pd.DataFrame:
+    """读取存储中的历史数据；过期时（按实例限流）先刷新再强制重新加载。
+    background=True 时（stale-while-revalidate）：已有数据则立即返回，刷新交给后台线程，
+    下一次请求读到新数据；没有任何数据时仍同步刷新。
+    """
+    df = _load_historical_data_from_storage(ticker)
+    try:
+        if _should_refresh_on_request(ticker, df):
+            if background and not df.empty:
+                _REFRESH_EXECUTOR.submit(_refresh_in_background, ticker)
+                return df
+            _maybe_refresh_daily_once(ticker, min_interval_seconds=HISTORICAL_REFRESH_MAX_AGE_SECONDS)
+            df = _load_historical_data_from_storage(ticker, force_reload=True)
+    except Exception:
+        pass
+    return df
+
+
 def _fetch_quote(ticker: str) -> Dict:
     """
     使用 `yfinance` 获取指定股票的实时行情信息。
+    成功结果在进程内缓存 QUOTE_CACHE_TTL_SECONDS 秒，突发请求复用同一次 `.info` 调用。
     """
+    t = ticker.upper()
+    now = time.time()
+    with _QUOTE_LOCK:
+        entry = _QUOTE_CACHE.get(t)
+        if entry and now - float(entry["cached_at"]) < _QUOTE_CACHE_TTL_SECONDS:
+            return dict(entry["result"])
+
     stock = yf.Ticker(ticker)
     info: Dict = {}
     try:
@@ -403,6 +535,13 @@ def _fetch_quote(ticker: str) -> Dict:
         "currency": info.get("currency"),
         "last_updated": datetime.now(TIMEZONE).isoformat(),
     }
+    if result["price"] is not None:
+        with _QUOTE_LOCK:
+            _QUOTE_CACHE[t] = {"result": dict(result), "cached_at": time.time()}
+            if len(_QUOTE_CACHE) > 1024:
+                cutoff = time.time() - _QUOTE_CACHE_TTL_SECONDS
+                for key in [k for k, v in _QUOTE_CACHE.items() if float(v["cached_at"]) < cutoff]:
+                    _QUOTE_CACHE.pop(key, None)
     return result
 
 
@@ -422,13 +561,53 @@ def _resolve_portfolio_ticker(raw_ticker: str) -> Optional[str]:
 
 
 def _load_latest_price_snapshot(ticker: str) -> Optional[Dict[str, float]]:
-    """从批量存储的历史数据中提取最新收盘价和日涨跌幅。"""
-    df = _load_historical_data_from_storage(ticker)
+    """从批量存储的历史数据中提取最新收盘价和日涨跌幅。
+    成功结果在进程内缓存 PRICE_SNAPSHOT_CACHE_TTL_SECONDS 秒（底层数据每日批量更新）；
+    缺数据的结果缓存 PRICE_SNAPSHOT_NEGATIVE_TTL_SECONDS 秒，保存历史数据时失效。
+    """
+    t = ticker.upper()
+    now = time.time()
+    with _PRICE_SNAPSHOT_LOCK:
+        entry = _PRICE_SNAPSHOT_CACHE.get(t)
+        if entry:
+            snapshot = entry["snapshot"]
+            ttl = _PRICE_SNAPSHOT_CACHE_TTL_SECONDS if snapshot is not None else _PRICE_SNAPSHOT_NEGATIVE_TTL_SECONDS
+            if now - float(entry["cached_at"]) < ttl:
+                return dict(snapshot) if snapshot is not None else None
+
+    snapshot = _read_latest_price_snapshot(ticker)
+    with _PRICE_SNAPSHOT_LOCK:
+        _PRICE_SNAPSHOT_CACHE[t] = {
+            "snapshot": dict(snapshot) if snapshot is not None else None,
+            "cached_at": time.time(),
+        }
+        if len(_PRICE_SNAPSHOT_CACHE) > 512:
+            cutoff = time.time() - max(_PRICE_SNAPSHOT_CACHE_TTL_SECONDS, _PRICE_SNAPSHOT_NEGATIVE_TTL_SECONDS)
+            for key in [k for k, v in _PRICE_SNAPSHOT_CACHE.items() if float(v["cached_at"]) < cutoff]:
+                _PRICE_SNAPSHOT_CACHE.pop(key, None)
+    return snapshot
+
+
+def _price_snapshot_cache_invalidate(ticker: str) -> None:
+    with _PRICE_SNAPSHOT_LOCK:
+        _PRICE_SNAPSHOT_CACHE.pop(ticker.upper(), None)
+
+
+def _load_latest_price_snapshots(tickers: List[str]) -> Dict[str, Optional[Dict[str, float]]]:
+    """并发加载多只股票的最新行情快照（每只一次存储读取，线程池重叠 I/O 延迟）。"""
+    unique = list(dict.fromkeys(tickers))
+    if len(unique) <= 1:
+        return {t: _load_latest_price_snapshot(t) for t in unique}
+    with ThreadPoolExecutor(max_workers=min(_PRICE_SNAPSHOT_WORKERS, len(unique))) as pool:
+        return dict(zip(unique, pool.map(_load_latest_price_snapshot, unique)))
+
+
+def _read_latest_price_snapshot(ticker: str) -> Optional[Dict[str, float]]:
+    df = _load_historical_tail_from_storage(ticker, 2, ["Close"])
     if df.empty:
         logger.warning("未在存储中找到 %s 的历史数据，无法生成财富图卡行情。", ticker)
         return None
 
-    df = df.sort_index()
     latest = df.iloc[-1]
     close = latest.get("Close")
 
@@ -555,6 +734,74 @@ def _fetch_historical_df(
         return pd.DataFrame()
 
 
+# Yahoo chart 接口单次多 symbol 请求的建议上限
+_BULK_FETCH_CHUNK_SIZE = 20
+# 批量预取的回看天数：覆盖增量更新 7 天回看窗口 + 周末/假期余量
+_BULK_FETCH_LOOKBACK_DAYS = 14
+
+
+def _fetch_historical_df_bulk(tickers: List[str], start: date, end: date) -> Dict[str, pd.DataFrame]:
+    """
+    用 `yf.download` 按每批 20 个 symbol 一次请求获取日 K 线，拆分为 ticker -> DataFrame。
+    列与 `Ticker.history` 一致（auto_adjust + actions），索引为 timezone-naive DatetimeIndex；
+    每个 DataFrame 的 attrs["fetch_start"] 记录请求起始日期。
+    某只股票获取失败时不出现在结果中，调用方应回退到逐只获取。
+    """
+    results: Dict[str, pd.DataFrame] = {}
+    symbols = list(dict.fromkeys(t.upper() for t in tickers))
+    for i in range(0, len(symbols), _BULK_FETCH_CHUNK_SIZE):
+        chunk = symbols[i:i + _BULK_FETCH_CHUNK_SIZE]
+        try:
+            raw = yf.download(
+                chunk,
+                start=start.strftime('%Y-%m-%d'),
+                end=end.strftime('%Y-%m-%d'),
+                interval="1d",
+                group_by="ticker",
+                auto_adjust=True,
+                actions=True,
+                threads=True,
+                progress=False,
+                # 日线默认 ignore_tz=True 会直接去掉时区、保留交易所本地零点；关闭后与
+                # _fetch_historical_df 一样先转 UTC 再去时区，东半球交易所的日期才与存储一致
+                ignore_tz=False,
+            )
+        except Exception as exc:
+            logger.warning("批量获取 %d 只股票历史数据失败，将逐只获取: %s", len(chunk), exc)
+            continue
+        if raw is None or raw.empty:
+            continue
+        for sym in chunk:
+            try:
+                if isinstance(raw.columns, pd.MultiIndex):
+                    if sym not in raw.columns.get_level_values(0):
+                        continue
+                    sub = raw[sym]
+                else:
+                    sub = raw
+                price_cols = [c for c in ("Open", "High", "Low", "Close") if c in sub.columns]
+                sub = sub.dropna(how="all", subset=price_cols or None)
+                if sub.empty:
+                    continue
+                sub = sub.copy()
+                sub.columns.name = None
+                if isinstance(sub.index, pd.DatetimeIndex) and sub.index.tz is not None:
+                    sub.index = sub.index.tz_convert('UTC').tz_localize(None)
+                sub.attrs["fetch_start"] = start
+                results[sym] = sub
+            except Exception as exc:
+                logger.warning("拆分 %s 的批量历史数据失败，将逐只获取: %s", sym, exc)
+    logger.info("批量获取历史数据: 请求 %d 只，成功 %d 只。", len(symbols), len(results))
+    return results
+
+
+def _bulk_prefetch_recent(tickers: List[str]) -> Dict[str, pd.DataFrame]:
+    """为批量增量更新预取最近 _BULK_FETCH_LOOKBACK_DAYS 天的日 K 线。"""
+    today = _now_in_market_timezone().date()
+    start = today - timedelta(days=_BULK_FETCH_LOOKBACK_DAYS)
+    return _fetch_historical_df_bulk(tickers, start=start, end=today + timedelta(days=1))
+
+
 # --- API Contract Helpers (compatible with vercel-nextjs /us-stocks) ---
 
 def _normalize_symbol(raw: Any) -> str:
@@ -585,7 +832,10 @@ def _years_to_range(years: int) -> str:
 
 def _sigmoid(x: float) -> float:
     try:
-        return float(1.0 / (1.0 + np.exp(-x)))
+        return 1.0 / (1.0 + math.exp(-x))
+    except OverflowError:
+        # 仅在 x 为极大负数时发生
+        return 0.0
     except Exception:
         return 0.5
 
@@ -597,38 +847,40 @@ def _to_ms(dt: datetime) -> int:
 def _df_to_market_candles(df: pd.DataFrame, limit: int) -> List[Dict[str, Any]]:
     if df.empty:
         return []
-    df2 = df.copy()
     # df index is Date; keep last N rows.
-    df2 = df2.sort_index()
+    df2 = df if df.index.is_monotonic_increasing else df.sort_index()
     if limit > 0:
         df2 = df2.tail(limit)
 
-    out: List[Dict[str, Any]] = []
-    for idx, row in df2.iterrows():
-        # idx is naive datetime at 00:00:00 UTC-ish; treat as UTC.
-        try:
-            t = _to_ms(datetime(idx.year, idx.month, idx.day, tzinfo=pytz.UTC))
-        except Exception:
-            continue
-        def _n(v: Any) -> Optional[float]:
-            try:
-                fv = float(v)
-                return fv if np.isfinite(fv) else None
-            except Exception:
-                return None
-
-        out.append(
-            {
-                "t": t,
-                "o": _n(row.get("Open")),
-                "h": _n(row.get("High")),
-                "l": _n(row.get("Low")),
-                "c": _n(row.get("Close")),
-                "v": _n(row.get("Volume")),
-            }
-        )
-    # filter incomplete rows
-    return [c for c in out if c.get("c") is not None]
+    # idx is naive datetime at 00:00:00 UTC-ish; treat the calendar date as UTC midnight.
+    idx = pd.to_datetime(df2.index, errors="coerce")
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    days = idx.normalize()
+    valid_t = ~days.isna()
+    ts_ms = days.values.astype("datetime64[ms]").astype(np.int64).tolist()
+
+    finite: Dict[str, np.ndarray] = {}
+
+    def _col(name: str) -> List[Optional[float]]:
+        # Whole-column conversion; non-numeric / non-finite values become None.
+        if name not in df2.columns:
+            finite[name] = np.zeros(len(df2), dtype=bool)
+            return [None] * len(df2)
+        arr = pd.to_numeric(df2[name], errors="coerce").to_numpy(dtype=np.float64)
+        mask = np.isfinite(arr)
+        finite[name] = mask
+        obj = arr.astype(object)
+        obj[~mask] = None
+        return obj.tolist()
+
+    o, h, l, c, v = (_col(name) for name in ("Open", "High", "Low", "Close", "Volume"))
+    # filter incomplete rows (bad date or missing close) with one mask instead of per-row checks
+    keep = np.flatnonzero(valid_t & finite["Close"]).tolist()
+    return [
+        {"t": ts_ms[i], "o": o[i], "h": h[i], "l": l[i], "c": c[i], "v": v[i]}
+        for i in keep
+    ]
 
 
 def _parse_iso_datetime(value: Any) -> Optional[datetime]:
@@ -672,14 +924,14 @@ def _load_next_earnings_from_storage(ticker: str) -> Optional[Dict[str, Any]]:
     t = ticker.upper()
     if GCS_BUCKET_NAME:
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
+            bucket = _gcs_bucket()
             blob_name = _get_gcs_earnings_blob_name(t)
             blob = bucket.blob(blob_name)
-            if not blob.exists():
+            try:
+                raw = blob.download_as_bytes()
+            except NotFound:
                 return None
-            raw = blob.download_as_text(encoding="utf-8")
-            payload = json.loads(raw)
+            payload = loads(raw)
             return payload if isinstance(payload, dict) else None
         except Exception as exc:
             logger.error("从 GCS 加载 %s 的 next earnings 失败: %s", t, exc)
@@ -689,8 +941,8 @@ def _load_next_earnings_from_storage(ticker: str) -> Optional[Dict[str, Any]]:
     if not os.path.exists(filepath):
         return None
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            payload = json.load(f)
+        with open(filepath, "rb") as f:
+            payload = loads(f.read())
         return payload if isinstance(payload, dict) else None
     except Exception as exc:
         logger.error("从本地 fallback 文件 %s 加载 %s 的 next earnings 失败: %s", filepath, t, exc)
@@ -699,12 +951,11 @@ def _load_next_earnings_from_storage(ticker: str) -> Optional[Dict[str, Any]]:
 
 def _save_next_earnings_to_storage(ticker: str, payload: Dict[str, Any]) -> str:
     t = ticker.upper()
-    content = json.dumps(payload, indent=2, ensure_ascii=False)
+    content = dumps_bytes(payload)
 
     if GCS_BUCKET_NAME:
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
+            bucket = _gcs_bucket()
             blob_name = _get_gcs_earnings_blob_name(t)
             blob = bucket.blob(blob_name)
             blob.cache_control = "public, max-age=300, stale-while-revalidate=86400"
@@ -717,7 +968,7 @@ def _save_next_earnings_to_storage(ticker: str, payload: Dict[str, Any]) -> str:
 
     filepath = _get_local_fallback_earnings_filepath(t)
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
+        with open(filepath, "wb") as f:
             f.write(content)
         logger.warning("GCS_BUCKET_NAME 未设置。已保存 %s 的 next earnings 到本地 fallback: %s", t, filepath)
         return filepath
@@ -956,20 +1207,28 @@ _options_service = OptionsSummaryService(
         is_after_market_close=_is_after_market_close,
         normalize_symbol=_normalize_symbol,
         request_logger=request_logger,
+        gcs_bucket=_gcs_bucket,
     )
 )
 app.include_router(build_options_router(_options_service))
 
 
-def _default_factor_weights() -> Dict[str, float]:
-    return {
-        "rsi14": 0.22,
-        "macdHist": 0.30,
-        "ema200Trend": 0.22,
-        "momentum20": 0.16,
-        "volumeTrend": 0.10,
-        "user": 0.0,
-    }
+# 因子顺序固定，与 _compute_analysis_from_df 中 factors 的追加顺序一致
+_FACTOR_IDS = ("rsi14", "macdHist", "ema200Trend", "momentum20", "volumeTrend", "user")
+_DEFAULT_FACTOR_WEIGHTS: tuple[float, ...] = (0.22, 0.30, 0.22, 0.16, 0.10, 0.0)
+
+
+def _resolve_factor_weights(weights_override: Optional[Dict[str, Any]]) -> tuple[float, ...]:
+    """按 _FACTOR_IDS 顺序返回权重；无覆盖时直接复用默认元组。"""
+    if not isinstance(weights_override, dict) or not weights_override:
+        return _DEFAULT_FACTOR_WEIGHTS
+    weights = dict(zip(_FACTOR_IDS, _DEFAULT_FACTOR_WEIGHTS))
+    for k, v in weights_override.items():
+        try:
+            weights[str(k)] = float(v)
+        except Exception:
+            continue
+    return tuple(weights[fid] for fid in _FACTOR_IDS)
 
 
 def _factor_stance(score: float, deadband: float = 0.12) -> str:
@@ -989,11 +1248,11 @@ def _compute_analysis_from_df(
     horizon_days: int = 1,
     backtest_window: int = 252,
 ) -> Dict[str, Any]:
-    df2 = df.copy()
-    if df2.empty or "Close" not in df2.columns:
+    if df.empty or "Close" not in df.columns:
         raise ValueError("Not enough candles for analysis.")
 
-    df2 = df2.sort_index()
+    # 只读使用，无需复制；存储层返回的数据通常已按日期升序
+    df2 = df if df.index.is_monotonic_increasing else df.sort_index()
     close = pd.to_numeric(df2["Close"], errors="coerce")
     volume = pd.to_numeric(df2.get("Volume"), errors="coerce") if "Volume" in df2.columns else pd.Series(dtype=float)
     if close.notna().sum() < 30:
@@ -1014,7 +1273,7 @@ def _compute_analysis_from_df(
     vol_avg = volume.rolling(window=vol_window).mean() if not volume.empty else pd.Series(index=df2.index, dtype=float)
     vol_ratio = volume / vol_avg if not volume.empty else pd.Series(index=df2.index, dtype=float)
 
-    latest_close = float(close.iloc[-1]) if np.isfinite(close.iloc[-1]) else None
+    latest_close = float(close.iloc[-1]) if math.isfinite(close.iloc[-1]) else None
     if latest_close is None:
         raise ValueError("Not enough candles for analysis.")
 
@@ -1025,7 +1284,7 @@ def _compute_analysis_from_df(
             r = float(val)
         except Exception:
             return 0.0
-        if not np.isfinite(r):
+        if not math.isfinite(r):
             return 0.0
         if r <= 30:
             s = 0.5 + 0.5 * (30 - r) / 30
@@ -1034,13 +1293,13 @@ def _compute_analysis_from_df(
         else:
             # Keep existing GCP mapping behavior for backward compatibility.
             s = (r - 50) / 40
-        return float(np.clip(s, -1, 1))
+        return max(-1.0, min(1.0, s))
 
     # Factors
     factors: List[Dict[str, Any]] = []
 
     # RSI(14)
-    rsi_val = float(rsi_series.iloc[-1]) if len(rsi_series) and np.isfinite(rsi_series.iloc[-1]) else None
+    rsi_val = float(rsi_series.iloc[-1]) if len(rsi_series) and math.isfinite(rsi_series.iloc[-1]) else None
     rsi_score = _rsi_score(rsi_val)
 
     factors.append(
@@ -1059,13 +1318,13 @@ def _compute_analysis_from_df(
     macd_score = 0.0
     if not hist_series.empty:
         hist_val_raw = hist_series.iloc[-1] if len(hist_series) else np.nan
-        if np.isfinite(hist_val_raw):
+        if math.isfinite(hist_val_raw):
             hist_val = float(hist_val_raw)
             # normalize by recent stdev to keep stable across symbols
             recent = hist_series.tail(120).dropna()
-            denom = float(recent.std()) if len(recent) >= 30 and np.isfinite(recent.std()) else 1.0
+            denom = float(recent.std()) if len(recent) >= 30 and math.isfinite(recent.std()) else 1.0
             denom = max(1e-9, denom)
-            macd_score = float(np.tanh(hist_val / (denom * 2.0)))
+            macd_score = math.tanh(hist_val / (denom * 2.0))
 
     factors.append(
         {
@@ -1082,9 +1341,9 @@ def _compute_analysis_from_df(
     ema_val = ema200.iloc[-1] if len(ema200) else np.nan
     ema_score = 0.0
     ema_dist = None
-    if np.isfinite(ema_val) and latest_close:
+    if math.isfinite(ema_val) and latest_close:
         ema_dist = float(latest_close / float(ema_val) - 1.0)
-        ema_score = float(np.tanh(ema_dist * 8.0))
+        ema_score = math.tanh(ema_dist * 8.0)
 
     factors.append(
         {
@@ -1101,9 +1360,9 @@ def _compute_analysis_from_df(
     mom_score = 0.0
     mom_val = None
     mom_raw = momentum_series.iloc[-1] if len(momentum_series) else np.nan
-    if np.isfinite(mom_raw):
+    if math.isfinite(mom_raw):
         mom_val = float(mom_raw)
-        mom_score = float(np.tanh(mom_val * 10.0))
+        mom_score = math.tanh(mom_val * 10.0)
 
     factors.append(
         {
@@ -1120,10 +1379,10 @@ def _compute_analysis_from_df(
     vol_score = 0.0
     vol_val = None
     vol_raw = vol_ratio.iloc[-1] if len(vol_ratio) else np.nan
-    if np.isfinite(vol_raw):
+    if math.isfinite(vol_raw):
         vol_val = float(vol_raw)
         # > 1 means higher-than-usual participation
-        vol_score = float(np.tanh((vol_val - 1.0) * 1.5))
+        vol_score = math.tanh((vol_val - 1.0) * 1.5)
 
     factors.append(
         {
@@ -1146,7 +1405,7 @@ def _compute_analysis_from_df(
             stance_n = int(stance)
         except Exception:
             stance_n = 0
-        stance_n = int(np.clip(stance_n, -1, 1))
+        stance_n = max(-1, min(1, stance_n))
         user_value = stance_n
         user_score = float(stance_n)
         note = str(user_factor.get("note") or "").strip()
@@ -1163,18 +1422,12 @@ def _compute_analysis_from_df(
         }
     )
 
-    weights = _default_factor_weights()
-    if isinstance(weights_override, dict):
-        for k, v in weights_override.items():
-            try:
-                weights[str(k)] = float(v)
-            except Exception:
-                continue
+    weights = _resolve_factor_weights(weights_override)
+    w_rsi, w_macd, w_ema, w_mom, w_vol, w_user = weights
 
     # Compute contributions
     agg_score = 0.0
-    for f in factors:
-        w = float(weights.get(f["id"], 0.0))
+    for f, w in zip(factors, weights):
         f["weight"] = w
         f["contribution"] = float(w) * float(f["score"] or 0.0)
         agg_score += f["contribution"]
@@ -1215,7 +1468,7 @@ def _compute_analysis_from_df(
         for i in range(start_idx, last_eval_idx + 1):
             c = close.iloc[i]
             nxt = close.iloc[i + horizon_days]
-            if not (np.isfinite(c) and np.isfinite(nxt)):
+            if not (math.isfinite(c) and math.isfinite(nxt)):
                 continue
 
             # Per-index factor scores
@@ -1223,36 +1476,36 @@ def _compute_analysis_from_df(
 
             s_macd = 0.0
             hist_i = hist_series.iloc[i] if i < len(hist_series) else np.nan
-            if np.isfinite(hist_i):
+            if math.isfinite(hist_i):
                 recent_i = hist_series.iloc[max(0, i - 119): i + 1].dropna()
-                denom_i = float(recent_i.std()) if len(recent_i) >= 30 and np.isfinite(recent_i.std()) else 1.0
+                denom_i = float(recent_i.std()) if len(recent_i) >= 30 and math.isfinite(recent_i.std()) else 1.0
                 denom_i = max(1e-9, denom_i * 2.0)
-                s_macd = float(np.tanh(float(hist_i) / denom_i))
+                s_macd = math.tanh(float(hist_i) / denom_i)
 
             s_ema = 0.0
             ema_i = ema200.iloc[i] if i < len(ema200) else np.nan
-            if np.isfinite(ema_i) and float(ema_i) != 0.0:
-                s_ema = float(np.tanh((float(c) / float(ema_i) - 1.0) * 8.0))
+            if math.isfinite(ema_i) and float(ema_i) != 0.0:
+                s_ema = math.tanh((float(c) / float(ema_i) - 1.0) * 8.0)
 
             s_mom = 0.0
             mom_i = momentum_series.iloc[i] if i < len(momentum_series) else np.nan
-            if np.isfinite(mom_i):
-                s_mom = float(np.tanh(float(mom_i) * 10.0))
+            if math.isfinite(mom_i):
+                s_mom = math.tanh(float(mom_i) * 10.0)
 
             s_vol = 0.0
             vol_i = vol_ratio.iloc[i] if i < len(vol_ratio) else np.nan
-            if np.isfinite(vol_i):
-                s_vol = float(np.tanh((float(vol_i) - 1.0) * 1.5))
+            if math.isfinite(vol_i):
+                s_vol = math.tanh((float(vol_i) - 1.0) * 1.5)
 
             s_user = float(user_score)
 
             agg_i = (
-                float(weights.get("rsi14", 0.0)) * s_rsi
-                + float(weights.get("macdHist", 0.0)) * s_macd
-                + float(weights.get("ema200Trend", 0.0)) * s_ema
-                + float(weights.get("momentum20", 0.0)) * s_mom
-                + float(weights.get("volumeTrend", 0.0)) * s_vol
-                + float(weights.get("user", 0.0)) * s_user
+                w_rsi * s_rsi
+                + w_macd * s_macd
+                + w_ema * s_ema
+                + w_mom * s_mom
+                + w_vol * s_vol
+                + w_user * s_user
             )
             p_i = float(_sigmoid(float(agg_i) * 1.6))
             outcome_up = 1 if float(nxt) > float(c) else 0
@@ -1315,8 +1568,58 @@ def _compute_analysis_from_df(
 
 # --- Feature Engineering Functions ---
 
+@njit(cache=True, nogil=True)
+def _rsi_kernel(close: np.ndarray, period: int) -> np.ndarray:
+    """单次遍历计算 RSI：窗口内涨跌幅的简单均值（与 rolling(period).mean() 语义一致）。
+
+    维护窗口内涨幅/跌幅的滑动和（移入新差分、移出最旧差分），每根 K 线 O(1)；
+    另记窗口内上涨/下跌/NaN 差分的个数，无下跌时跌幅精确为 0，不受浮点残差影响。
+    窗口内任一差分为 NaN 时结果为 NaN；窗口内无下跌时 RSI=100，无涨跌时为 NaN。
+    """
+    n = close.shape[0]
+    out = np.full(n, np.nan)
+    gain_sum = 0.0
+    loss_sum = 0.0
+    n_gain = 0
+    n_loss = 0
+    n_nan = 0
+    for i in range(1, n):
+        d = close[i] - close[i - 1]
+        if d != d:  # NaN
+            n_nan += 1
+        elif d > 0.0:
+            gain_sum += d
+            n_gain += 1
+        elif d < 0.0:
+            loss_sum -= d
+            n_loss += 1
+        if i > period:
+            d = close[i - period] - close[i - period - 1]
+            if d != d:
+                n_nan -= 1
+            elif d > 0.0:
+                gain_sum -= d
+                n_gain -= 1
+            elif d < 0.0:
+                loss_sum += d
+                n_loss -= 1
+        if i < period or n_nan > 0:
+            continue
+        gain = gain_sum if n_gain > 0 else 0.0
+        loss = loss_sum if n_loss > 0 else 0.0
+        if loss == 0.0:
+            if gain > 0.0:
+                out[i] = 100.0
+            continue
+        out[i] = 100.0 - 100.0 / (1.0 + gain / loss)
+    return out
+
+
 def _compute_rsi(series: pd.Series, period: int = 14) -> pd.Series:
     """计算相对强弱指数 (RSI)。"""
+    if NUMBA_AVAILABLE:
+        values = _rsi_kernel(series.to_numpy(dtype=np.float64), period)
+        return pd.Series(values, index=series.index)
     delta = series.diff()
     gain = delta.clip(lower=0)
     loss = -delta.clip(upper=0)
@@ -1327,8 +1630,56 @@ def _compute_rsi(series: pd.Series, period: int = 14) -> pd.Series:
     return rsi
 
 
+@njit(cache=True, nogil=True)
+def _ewm_step(prev: float, old_wt: float, x: float, alpha: float):
+    """adjust=False 的 EWM 单步更新（与 pandas 一致：NaN 处沿用上一值，但权重照常衰减）。"""
+    if prev == prev:
+        old_wt *= 1.0 - alpha
+        if x == x:
+            prev = (old_wt * prev + alpha * x) / (old_wt + alpha)
+            old_wt = 1.0
+    elif x == x:
+        prev = x
+    return prev, old_wt
+
+
+@njit(cache=True, nogil=True)
+def _macd_kernel(close: np.ndarray):
+    """单次遍历同时更新 EMA12 / EMA26 / 信号线，输出 MACD、信号线与柱状图。"""
+    n = close.shape[0]
+    macd = np.empty(n)
+    signal = np.empty(n)
+    hist = np.empty(n)
+    a12 = 2.0 / 13.0
+    a26 = 2.0 / 27.0
+    a9 = 2.0 / 10.0
+    e12 = np.nan
+    e26 = np.nan
+    sig = np.nan
+    w12 = 1.0
+    w26 = 1.0
+    w9 = 1.0
+    for i in range(n):
+        x = close[i]
+        e12, w12 = _ewm_step(e12, w12, x, a12)
+        e26, w26 = _ewm_step(e26, w26, x, a26)
+        m = e12 - e26
+        sig, w9 = _ewm_step(sig, w9, m, a9)
+        macd[i] = m
+        signal[i] = sig
+        hist[i] = m - sig
+    return macd, signal, hist
+
+
 def _compute_macd(series: pd.Series) -> pd.DataFrame:
     """计算移动平均线收敛散度 (MACD) 指标。"""
+    if NUMBA_AVAILABLE:
+        macd_line, signal_line, histogram = _macd_kernel(series.to_numpy(dtype=np.float64))
+        return pd.DataFrame({
+            "macd": macd_line,
+            "signal": signal_line,
+            "hist": histogram
+        }, index=series.index)
     ema12 = series.ewm(span=12, adjust=False).mean()
     ema26 = series.ewm(span=26, adjust=False).mean()
     macd_line = ema12 - ema26
@@ -1347,76 +1698,62 @@ def _compute_features(df: pd.DataFrame) -> Dict:
     if df.empty:
         return features
     try:
-        df_copy = df.copy() # 确保不修改原始DataFrame
-        
         # 确保 'Close' 是数值类型，并且可以被索引或作为列访问
-        if 'Close' not in df_copy.columns:
+        if 'Close' not in df.columns:
             logger.error("DataFrame中未找到 'Close' 列，无法计算特征。")
             return {}
 
-        df_copy['Close'] = pd.to_numeric(df_copy['Close'], errors='coerce')
-        close = df_copy['Close'].dropna() # 删除Close价格中的NaN以便计算
+        close = pd.to_numeric(df['Close'], errors='coerce').dropna() # 删除Close价格中的NaN以便计算
         
         if close.empty or len(close) < 200: # 至少需要200个数据点来计算200日均线等
             logger.warning("没有足够的有效收盘价数据 (%d) 来计算全面的特征。", len(close))
             return {}
 
-        # 计算收益率和均线（将日收益率转换为百分比形式以便直接展示）
-        df_copy['return_1d'] = close.pct_change() * 100
-        df_copy['ma_20'] = close.rolling(window=20).mean()
-        df_copy['ma_50'] = close.rolling(window=50).mean()
-        df_copy['ma_200'] = close.rolling(window=200).mean()
+        # 只需要最新（及前一日）的指标值：直接在 numpy 数组末端计算，
+        # 不再把整列均线/MACD 写回 DataFrame 再 concat 后取最后一行
+        close_arr = close.to_numpy(dtype=np.float64)
+        latest_close = close_arr[-1]
+        # 日收益率转换为百分比形式以便直接展示
+        return_1d_val = float((close_arr[-1] / close_arr[-2] - 1.0) * 100)
+        ma_20 = float(close_arr[-20:].mean())
+        ma_50 = float(close_arr[-50:].mean())
+        ma_200 = float(close_arr[-200:].mean())
         # RSI
-        df_copy['rsi'] = _compute_rsi(close)
+        rsi_val = _compute_rsi(close).iloc[-1]
         # MACD
-        macd_df = _compute_macd(close)
-        df_copy = pd.concat([df_copy, macd_df], axis=1) # 按列合并MACD结果
-        
-        # 确保我们使用最新的可用数据，处理因滚动窗口可能导致的末尾 NaN
-        latest = df_copy.iloc[-1] 
+        macd_latest = _compute_macd(close).iloc[-1]
 
         # 趋势判定：最近 10 天收盘价线性回归斜率
         trend = "unknown"
-        if len(close) >= 10:
-            recent = close.tail(10)
-            x = np.arange(len(recent)) # 使用 numpy arange 生成 x 值
-            # 确保有足够的数据点进行线性回归，避免 LinAlgError: Singular matrix
-            if len(x) > 1 and not (recent == recent.iloc[0]).all(): # 确保数据不全部相同
-                try:
-                    # np.polyfit 返回系数，[0] 是斜率
-                    slope = np.polyfit(x, recent, 1)[0]
-                    if slope > 0.001: # 设置一个小的阈值以避免噪音
-                        trend = "up"
-                    elif slope < -0.001:
-                        trend = "down"
-                    else:
-                        trend = "flat"
-                except np.linalg.LinAlgError:
-                    trend = "flat" # 理论上上面已检查，但作为兜底
-            else: # 数据点不足或数据全部相同
+        if len(close_arr) >= 10:
+            recent = close_arr[-10:]
+            n = recent.size
+            # x = 0..n-1 时的最小二乘斜率闭式解：cov(x, y) / var(x)，var(x) 之和为 n(n²-1)/12
+            x_centered = np.arange(n) - (n - 1) / 2.0
+            slope = float((x_centered * (recent - recent.mean())).sum() / (n * (n * n - 1) / 12.0))
+            if slope > 0.001: # 设置一个小的阈值以避免噪音
+                trend = "up"
+            elif slope < -0.001:
+                trend = "down"
+            else: # 包括数据全部相同（斜率为 0）
                 trend = "flat"
         
         # 信号：黄金交叉 / 死亡交叉
         signal = "neutral"
-        # 检查前一天和当天的数据是否可用以检测交叉
-        if len(df_copy) >= 2 and pd.notnull(df_copy.iloc[-2].get('ma_50')) and pd.notnull(df_copy.iloc[-2].get('ma_200')):
-            prev_ma50 = df_copy.iloc[-2]['ma_50']
-            prev_ma200 = df_copy.iloc[-2]['ma_200']
-            curr_ma50 = latest.get('ma_50')
-            curr_ma200 = latest.get('ma_200')
-
-            if pd.notnull(curr_ma50) and pd.notnull(curr_ma200):
-                if prev_ma50 < prev_ma200 and curr_ma50 > curr_ma200:
-                    signal = "golden_cross"  # 看多信号
-                elif prev_ma50 > prev_ma200 and curr_ma50 < curr_ma200:
-                    signal = "death_cross"  # 看空信号
-                elif curr_ma50 > curr_ma200: # 如果已经处于黄金交叉状态
-                    signal = "golden_cross_state"
-                elif curr_ma50 < curr_ma200: # 如果已经处于死亡交叉状态
-                    signal = "death_cross_state"
+        # 前一天的 200 日均线需要至少 201 个数据点
+        if len(close_arr) > 200:
+            prev_ma50 = close_arr[-51:-1].mean()
+            prev_ma200 = close_arr[-201:-1].mean()
+            if prev_ma50 < prev_ma200 and ma_50 > ma_200:
+                signal = "golden_cross"  # 看多信号
+            elif prev_ma50 > prev_ma200 and ma_50 < ma_200:
+                signal = "death_cross"  # 看空信号
+            elif ma_50 > ma_200: # 如果已经处于黄金交叉状态
+                signal = "golden_cross_state"
+            elif ma_50 < ma_200: # 如果已经处于死亡交叉状态
+                signal = "death_cross_state"
         
         # RSI 信号
-        rsi_val = latest.get('rsi')
         rsi_signal = None
         if pd.notnull(rsi_val):
             if rsi_val > 70:
@@ -1427,20 +1764,19 @@ def _compute_features(df: pd.DataFrame) -> Dict:
                 rsi_signal = "neutral"
         
         # 确保所有值都可 JSON 序列化 (浮点数, 整数, 字符串, 布尔值, None)
-        return_1d_val = float(latest['return_1d']) if pd.notnull(latest['return_1d']) else None
-        return_1d_percent = f"{round(return_1d_val, 2)}%" if return_1d_val is not None else None
+        return_1d_percent = f"{round(return_1d_val, 2)}%"
 
         features = {
-            "latest_close": float(latest['Close']) if pd.notnull(latest['Close']) else None,
+            "latest_close": float(latest_close),
             "return_1d": return_1d_val,
             "return_1d_percent": return_1d_percent,
-            "ma_20": float(latest['ma_20']) if pd.notnull(latest['ma_20']) else None,
-            "ma_50": float(latest['ma_50']) if pd.notnull(latest['ma_50']) else None,
-            "ma_200": float(latest['ma_200']) if pd.notnull(latest['ma_200']) else None,
+            "ma_20": ma_20,
+            "ma_50": ma_50,
+            "ma_200": ma_200,
             "rsi": float(rsi_val) if pd.notnull(rsi_val) else None,
-            "macd": float(latest['macd']) if pd.notnull(latest['macd']) else None,
-            "macd_signal": float(latest['signal']) if pd.notnull(latest['signal']) else None,
-            "macd_hist": float(latest['hist']) if pd.notnull(latest['hist']) else None,
+            "macd": float(macd_latest['macd']) if pd.notnull(macd_latest['macd']) else None,
+            "macd_signal": float(macd_latest['signal']) if pd.notnull(macd_latest['signal']) else None,
+            "macd_hist": float(macd_latest['hist']) if pd.notnull(macd_latest['hist']) else None,
             "trend": trend,
             "ma_signal": signal,
             "rsi_signal": rsi_signal,
@@ -1462,21 +1798,21 @@ def _resample_to_monthly(df: pd.DataFrame) -> pd.DataFrame:
         logger.error("DataFrame 的索引不是 DatetimeIndex，无法进行月度重采样。")
         return pd.DataFrame()
 
-    # 重采样到每月最后一个交易日
-    # Pandas 2.2+ 中 'M' 已弃用/移除，需使用 'ME'（month end）
-    monthly_df = df.resample('ME').agg(
-        Open=('Open', 'first'),
-        High=('High', 'max'),
-        Low=('Low', 'min'),
-        Close=('Close', 'last'),
-        Volume=('Volume', 'sum')
+    # 按月份键 (datetime64[M]) 分组聚合，标签为月末日期（与 resample('ME') 一致）。
+    # 相比 resample 不会展开完整的日期区间，没有交易数据的月份也不会产生空行。
+    idx = df.index
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    month_key = idx.values.astype("datetime64[M]")
+    monthly_df = df.groupby(month_key).agg(
+        {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
     )
+    monthly_df.index = (pd.DatetimeIndex(monthly_df.index) + pd.offsets.MonthEnd(0)).as_unit(idx.unit)
+    monthly_df.index.name = df.index.name
 
     # 删除所有 OHLCV 都是 NaN 的行（例如没有交易数据的月份）
     monthly_df = monthly_df.dropna(how='all', subset=['Open', 'High', 'Low', 'Close', 'Volume'])
-    
-    # 将 NaN 替换为 None，以便后续 JSON 兼容
-    monthly_df = monthly_df.replace({np.nan: None})
+    # NaN -> None 的 JSON 兼容转换由调用方在 to_dict 之前统一处理，这里保持数值列 dtype
     return monthly_df
 
 
@@ -1491,7 +1827,9 @@ def _historical_l1_get(ticker: str) -> Optional[pd.DataFrame]:
             return None
         ttl = _HISTORICAL_L1_MISS_TTL_SECONDS if bool(entry.get("is_empty")) else _HISTORICAL_L1_HIT_TTL_SECONDS
         if now - float(entry.get("cached_at", 0.0)) > float(ttl):
-            _HISTORICAL_L1_CACHE.pop(t, None)
+            # 带版本号的条目过期后保留，供 _historical_l1_revalidate 按版本复用
+            if entry.get("version") is None:
+                _HISTORICAL_L1_CACHE.pop(t, None)
             return None
         entry["last_access_at"] = now
         df = entry.get("df")
@@ -1501,18 +1839,37 @@ def _historical_l1_get(ticker: str) -> Optional[pd.DataFrame]:
         return df.copy(deep=True)
 
 
-def _historical_l1_set(ticker: str, df: pd.DataFrame) -> None:
+def _historical_l1_revalidate(ticker: str, version: Optional[tuple]) -> Optional[pd.DataFrame]:
+    """存储对象版本未变时复用 L1 中（可能已过期的）DataFrame，并重置 TTL。"""
+    if version is None:
+        return None
+    t = ticker.upper()
+    now = time.time()
+    with _HISTORICAL_L1_LOCK:
+        entry = _HISTORICAL_L1_CACHE.get(t)
+        if not entry or entry.get("version") != version:
+            return None
+        df = entry.get("df")
+        if not isinstance(df, pd.DataFrame):
+            return None
+        entry["cached_at"] = now
+        entry["last_access_at"] = now
+        return df.copy(deep=True)
+
+
+def _historical_l1_set(ticker: str, df: pd.DataFrame, version: Optional[tuple] = None) -> None:
     if not isinstance(df, pd.DataFrame):
         return
     t = ticker.upper()
     now = time.time()
     df_to_cache = df.copy(deep=True)
-    if isinstance(df_to_cache.index, pd.DatetimeIndex):
+    if isinstance(df_to_cache.index, pd.DatetimeIndex) and not df_to_cache.index.is_monotonic_increasing:
         df_to_cache = df_to_cache.sort_index()
     with _HISTORICAL_L1_LOCK:
         _HISTORICAL_L1_CACHE[t] = {
             "df": df_to_cache,
             "is_empty": bool(df_to_cache.empty),
+            "version": version,
             "cached_at": now,
             "last_access_at": now,
         }
@@ -1533,144 +1890,283 @@ def _historical_l1_invalidate(ticker: str) -> None:
     with _HISTORICAL_L1_LOCK:
         _HISTORICAL_L1_CACHE.pop(ticker.upper(), None)
 
+_HISTORICAL_CACHE_CONTROL = "public, max-age=600, stale-while-revalidate=86400"
+_HISTORICAL_PARQUET_COMPRESSION = "zstd"
+# 小 row group：读取最新行情时只需拉取 footer + 最后一个 row group
+_HISTORICAL_PARQUET_ROW_GROUP_SIZE = 64
+# 批量处理并发数；yfinance 对同一出口 IP 有限流，默认不宜过高
+BATCH_WORKERS = max(1, int(os.environ.get("BATCH_WORKERS", "8")))
+# 本地 fallback 模式下每日索引 read-modify-write 的进程内锁（GCS 模式用 generation 乐观并发）
+_BATCH_INDEX_LOCK = Lock()
+_GCS_PARQUET_FS: Optional[pafs.GcsFileSystem] = None
+_GCS_PARQUET_FS_LOCK = Lock()
+
+
 def _get_gcs_blob_name(ticker: str) -> str:
-    """辅助函数，获取股票历史 JSON 文件的 GCS Blob 名称。"""
-    return f"historical_data/{ticker.upper()}_historical.json"
+    """辅助函数，获取股票历史 Parquet 文件的 GCS Blob 名称。"""
+    return f"historical_data/{ticker.upper()}_historical.parquet"
 
 def _get_local_fallback_filepath(ticker: str) -> str:
     """本地测试 fallback 路径辅助函数，用于历史数据。"""
+    return os.path.join(LOCAL_FALLBACK_DATA_DIR, f"{ticker.upper()}_historical.parquet")
+
+def _get_legacy_gcs_blob_name(ticker: str) -> str:
+    """旧版 JSON 历史数据的 GCS Blob 名称（仅用于读取迁移前的数据）。"""
+    return f"historical_data/{ticker.upper()}_historical.json"
+
+def _get_legacy_local_fallback_filepath(ticker: str) -> str:
+    """旧版 JSON 历史数据的本地 fallback 路径（仅用于读取迁移前的数据）。"""
     return os.path.join(LOCAL_FALLBACK_DATA_DIR, f"{ticker.upper()}_historical.json")
 
 
-def _save_historical_data_to_storage(ticker: str, df: pd.DataFrame) -> str:
-    """将历史数据 DataFrame 保存到 GCS 或本地 fallback。"""
-    
-    df_copy = df.copy()
-    # 确保索引被重置，并且 'Date' 列被转换为字符串以便 JSON 序列化
-    if isinstance(df_copy.index, pd.DatetimeIndex):
-        df_copy = df_copy.reset_index()
-        # 日期字符串保持为 naive 格式 (YYYY-MM-DD)，与加载时一致
-        df_copy['Date'] = df_copy['Date'].dt.strftime("%Y-%m-%d")
-    
-    # 将任何 numpy.NaN 替换为 None 以便 JSON 兼容
-    data_to_save = df_copy.replace({np.nan: None}).to_dict(orient="records")
-    json_content = json.dumps(data_to_save, indent=2, ensure_ascii=False)
+def _gcs_parquet_fs() -> pafs.GcsFileSystem:
+    """进程内复用同一个 GcsFileSystem（凭证与连接池只初始化一次）。"""
+    global _GCS_PARQUET_FS
+    if _GCS_PARQUET_FS is None:
+        with _GCS_PARQUET_FS_LOCK:
+            if _GCS_PARQUET_FS is None:
+                _GCS_PARQUET_FS = pafs.GcsFileSystem()
+    return _GCS_PARQUET_FS
 
+
+def _historical_parquet_location(ticker: str) -> tuple[pafs.FileSystem, str]:
+    """返回历史 Parquet 文件所在的 (filesystem, path)。"""
+    if GCS_BUCKET_NAME:
+        return _gcs_parquet_fs(), f"{GCS_BUCKET_NAME}/{_get_gcs_blob_name(ticker)}"
+    return pafs.LocalFileSystem(), _get_local_fallback_filepath(ticker)
+
+
+def _historical_file_version(info: pafs.FileInfo) -> Optional[tuple]:
+    """对象版本标识：(mtime_ns, size)。GCS 上 mtime 即对象的 updated 时间，每次覆盖写都会变化。"""
+    if info.type == pafs.FileType.NotFound or info.mtime_ns is None:
+        return None
+    return (info.mtime_ns, info.size)
+
+
+def _historical_df_to_table(df: pd.DataFrame) -> pa.Table:
+    """DataFrame -> Arrow Table；DatetimeIndex 写成 naive 日期列 'Date'（与旧 JSON 的 YYYY-MM-DD 语义一致）。"""
+    out = df
+    if isinstance(out.index, pd.DatetimeIndex):
+        out = out.reset_index()
+        dates = out['Date']
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        out['Date'] = dates.dt.normalize()
+        # 文件按日期升序写入，尾部读取 (_load_historical_tail_from_storage) 依赖这一点
+        if not out['Date'].is_monotonic_increasing:
+            out = out.sort_values('Date', kind='stable')
+    return pa.Table.from_pandas(out, preserve_index=False)
+
+
+def _historical_df_from_table(table: pa.Table) -> pd.DataFrame:
+    df = table.to_pandas()
+    if 'Date' in df.columns:
+        df = df.set_index('Date')
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+    return df
+
+
+def _historical_df_from_records(data: List[Dict[str, Any]]) -> pd.DataFrame:
+    """旧版 JSON records -> DataFrame。"""
+    df = pd.DataFrame(data)
+    if 'Date' in df.columns:
+        # 确保加载后，索引也是 timezone-naive DatetimeIndex
+        df['Date'] = pd.to_datetime(df['Date']) # This naturally creates naive datetimes from YYYY-MM-DD
+        df = df.set_index('Date') # 设置索引以便后续合并/比较
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+    return df
+
+
+def _load_legacy_historical_json(ticker: str) -> Optional[pd.DataFrame]:
+    """读取迁移前的 JSON 历史数据；不存在时返回 None。下一次保存会写成 Parquet。"""
     if GCS_BUCKET_NAME:
+        bucket = _gcs_bucket()
+        blob = bucket.blob(_get_legacy_gcs_blob_name(ticker))
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
-            blob_name = _get_gcs_blob_name(ticker)
-            blob = bucket.blob(blob_name)
-            blob.cache_control = "public, max-age=600, stale-while-revalidate=86400"
-            
-            blob.upload_from_string(json_content, content_type="application/json")
-            _historical_l1_set(ticker, df)
-            logger.info("成功保存 %s 历史数据到 GCS: gs://%s/%s", ticker, GCS_BUCKET_NAME, blob_name)
-            return f"gs://{GCS_BUCKET_NAME}/{blob_name}"
-        except Exception as exc:
-            _historical_l1_invalidate(ticker)
-            logger.error("保存 %s 历史数据到 GCS 失败: %s", ticker, exc)
-            return ""
+            raw = blob.download_as_bytes()
+        except NotFound:
+            return None
+        data = loads(raw)
     else:
-        filepath = _get_local_fallback_filepath(ticker)
-        try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(json_content)
-            _historical_l1_set(ticker, df)
-            logger.warning("GCS_BUCKET_NAME 未设置。已保存 %s 历史数据到本地 fallback: %s (在 Cloud Run 中不持久化)", ticker, filepath)
-            return filepath
-        except Exception as exc:
-            _historical_l1_invalidate(ticker)
-            logger.error("保存 %s 历史数据到本地 fallback 文件 %s 失败: %s", ticker, filepath, exc)
-            return ""
+        filepath = _get_legacy_local_fallback_filepath(ticker)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, "rb") as f:
+            data = loads(f.read())
+    logger.info("已读取 %s 的旧版 JSON 历史数据，下次保存时将转换为 Parquet。", ticker)
+    return _historical_df_from_records(data)
+
+
+def _save_historical_data_to_storage(ticker: str, df: pd.DataFrame) -> str:
+    """将历史数据 DataFrame 以 Parquet (zstd) 保存到 GCS 或本地 fallback。"""
+    fs, path = _historical_parquet_location(ticker)
+    try:
+        table = _historical_df_to_table(df)
+        # GCS 上 metadata 会写成对象的 Cache-Control / Content-Type；本地文件系统忽略
+        metadata = (
+            {"Cache-Control": _HISTORICAL_CACHE_CONTROL, "Content-Type": "application/vnd.apache.parquet"}
+            if GCS_BUCKET_NAME
+            else None
+        )
+        with fs.open_output_stream(path, metadata=metadata) as sink:
+            pq.write_table(
+                table,
+                sink,
+                compression=_HISTORICAL_PARQUET_COMPRESSION,
+                row_group_size=_HISTORICAL_PARQUET_ROW_GROUP_SIZE,
+            )
+    except Exception as exc:
+        _historical_l1_invalidate(ticker)
+        if GCS_BUCKET_NAME:
+            logger.error("保存 %s 历史数据到 GCS 失败: %s", ticker, exc)
+        else:
+            logger.error("保存 %s 历史数据到本地 fallback 文件 %s 失败: %s", ticker, path, exc)
+        return ""
+
+    try:
+        version = _historical_file_version(fs.get_file_info(path))
+    except Exception:
+        version = None
+    _historical_l1_set(ticker, df, version=version)
+    _price_snapshot_cache_invalidate(ticker)
+    if GCS_BUCKET_NAME:
+        logger.info("成功保存 %s 历史数据到 GCS: gs://%s", ticker, path)
+        return f"gs://{path}"
+    logger.warning("GCS_BUCKET_NAME 未设置。已保存 %s 历史数据到本地 fallback: %s (在 Cloud Run 中不持久化)", ticker, path)
+    return path
 
 
 def _load_historical_data_from_storage(ticker: str, force_reload: bool = False) -> pd.DataFrame:
     """从 GCS 或本地 fallback 加载历史数据到 DataFrame。
     返回带有 **timezone-naive DatetimeIndex** 的 DataFrame。
+    优先读取 Parquet；不存在时回退读取旧版 JSON。
+    L1 过期或 force_reload 时先比对对象版本（一次 HEAD），未变化则复用内存中的 DataFrame。
     """
     if not force_reload:
         cached = _historical_l1_get(ticker)
         if isinstance(cached, pd.DataFrame):
             return cached
 
-    if GCS_BUCKET_NAME:
-        try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
-            blob_name = _get_gcs_blob_name(ticker)
-            blob = bucket.blob(blob_name)
-            
-            if not blob.exists():
-                logger.info("在 GCS 中未找到 %s 的现有 Blob 文件: gs://%s/%s。", ticker, GCS_BUCKET_NAME, blob_name)
+    fs, path = _historical_parquet_location(ticker)
+    where = "GCS" if GCS_BUCKET_NAME else "本地 fallback"
+    version: Optional[tuple] = None
+    try:
+        info = fs.get_file_info(path)
+        if info.type != pafs.FileType.NotFound:
+            version = _historical_file_version(info)
+            cached = _historical_l1_revalidate(ticker, version)
+            if isinstance(cached, pd.DataFrame):
+                return cached
+            df = _historical_df_from_table(pq.read_table(path, filesystem=fs))
+        else:
+            df = _load_legacy_historical_json(ticker)
+            if df is None:
+                logger.info("在 %s 中未找到 %s 的历史数据文件: %s。", where, ticker, path)
                 empty = pd.DataFrame()
                 _historical_l1_set(ticker, empty)
                 return empty
-            
-            json_content = blob.download_as_text(encoding="utf-8")
-            data = json.loads(json_content)
-            df = pd.DataFrame(data)
-            
-            if 'Date' in df.columns:
-                # 确保加载后，索引也是 timezone-naive DatetimeIndex
-                df['Date'] = pd.to_datetime(df['Date']) # This naturally creates naive datetimes from YYYY-MM-DD
-                df = df.set_index('Date') # 设置索引以便后续合并/比较
-                df = df.sort_index()
-            _historical_l1_set(ticker, df)
-            logger.info("成功从 GCS 加载 %s 历史数据。", ticker)
-            return df
-        except Exception as exc:
-            logger.error("从 GCS 加载 %s 历史数据失败: %s", ticker, exc)
-            return pd.DataFrame()
-    else:
-        filepath = _get_local_fallback_filepath(ticker)
-        if not os.path.exists(filepath):
-            logger.info("GCS_BUCKET_NAME 未设置。在本地未找到 %s 的现有 fallback 文件: %s。", ticker, filepath)
-            empty = pd.DataFrame()
-            _historical_l1_set(ticker, empty)
-            return empty
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            df = pd.DataFrame(data)
-            if 'Date' in df.columns:
-                df['Date'] = pd.to_datetime(df['Date'])
-                df = df.set_index('Date')
-                df = df.sort_index()
-            _historical_l1_set(ticker, df)
-            logger.warning("GCS_BUCKET_NAME 未设置。已从本地 fallback 加载 %s 历史数据: %s", ticker, filepath)
+    except Exception as exc:
+        logger.error("从 %s 加载 %s 历史数据失败: %s", where, ticker, exc)
+        return pd.DataFrame()
+
+    _historical_l1_set(ticker, df, version=version)
+    logger.info("成功从 %s 加载 %s 历史数据。", where, ticker)
+    return df
+
+
+def _load_historical_tail_from_storage(ticker: str, rows: int, columns: List[str]) -> pd.DataFrame:
+    """只读取历史数据末尾 `rows` 行的指定列。
+    Parquet 文件按日期升序、小 row group 写入，这里只拉 footer 和最后几个 row group；
+    L1 命中或只有旧版 JSON 时退回完整加载。
+    """
+    def _tail(df: pd.DataFrame) -> pd.DataFrame:
+        if df.empty:
             return df
-        except Exception as exc:
-            logger.error("从本地 fallback 文件 %s 加载 %s 历史数据失败: %s", filepath, ticker, exc)
-            return pd.DataFrame()
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        return df[columns].tail(rows)
+
+    cached = _historical_l1_get(ticker)
+    if isinstance(cached, pd.DataFrame):
+        return _tail(cached)
+
+    fs, path = _historical_parquet_location(ticker)
+    try:
+        info = fs.get_file_info(path)
+        if info.type == pafs.FileType.NotFound:
+            return _tail(_load_historical_data_from_storage(ticker))
+        cached = _historical_l1_revalidate(ticker, _historical_file_version(info))
+        if isinstance(cached, pd.DataFrame):
+            return _tail(cached)
+        with fs.open_input_file(path) as source:
+            pf = pq.ParquetFile(source)
+            read_cols = ['Date', *[c for c in columns if c != 'Date']]
+            groups: List[int] = []
+            n = 0
+            for i in range(pf.num_row_groups - 1, -1, -1):
+                groups.append(i)
+                n += pf.metadata.row_group(i).num_rows
+                if n >= rows:
+                    break
+            table = pf.read_row_groups(groups[::-1], columns=read_cols)
+        return _tail(_historical_df_from_table(table))
+    except Exception as exc:
+        logger.error("读取 %s 历史数据尾部失败: %s", ticker, exc)
+        return pd.DataFrame()
 
 
 # --- AI Context Data Storage and Logic (TXT format, matching Financial Engine) ---
 # AI Context file path: ai_context/{TICKER}/{YYYY-MM-DD}.txt
 def _get_gcs_ai_context_blob_name(ticker: str, context_date: date) -> str:
     """辅助函数，获取股票 AI Context JSON 文件的 GCS Blob 名称。"""
-    return f"ai_context/{ticker.upper()}/{context_date.strftime('%Y-%m-%d')}.json"
+    return f"ai_context/{ticker.upper()}/{context_date.isoformat()}.json"
 
 def _get_local_fallback_ai_context_filepath(ticker: str, context_date: date) -> str:
     """本地测试 fallback 路径辅助函数，用于 AI Context JSON 文件。"""
     ticker_dir = os.path.join(LOCAL_FALLBACK_AI_CONTEXT_DIR, ticker.upper())
     os.makedirs(ticker_dir, exist_ok=True)
-    return os.path.join(ticker_dir, f"{context_date.strftime('%Y-%m-%d')}.json")
+    return os.path.join(ticker_dir, f"{context_date.isoformat()}.json")
+
+def _historical_src_hash(df: pd.DataFrame) -> str:
+    """历史数据内容指纹（索引 + 全部列），用于判断 AI Context 的输入是否变化。"""
+    row_hashes = pd.util.hash_pandas_object(df, index=True).values
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=8).hexdigest()
 
-def _save_ai_context_to_storage(ticker: str, context_date: date, ai_context_data: Dict) -> str:
-    """将 AI Context 数据 (dict) 保存为 JSON 文件到 GCS 或本地 fallback。"""
-    # 将 dict 转换为可读的 JSON 字符串以便写入 .txt 文件
-    json_content_str = json.dumps(ai_context_data, indent=2, ensure_ascii=False)
 
+def _ai_context_stored_src_hash(ticker: str, context_date: date) -> Optional[str]:
+    """读取 GCS 中当日 AI Context 的 src_hash 元数据；不存在或读取失败返回 None。"""
+    try:
+        blob = _gcs_bucket().blob(_get_gcs_ai_context_blob_name(ticker, context_date))
+        blob.reload()
+    except NotFound:
+        return None
+    except Exception as exc:
+        logger.warning("读取 %s AI Context 元数据失败: %s", ticker, exc)
+        return None
+    return (blob.metadata or {}).get("src_hash")
+
+
+def _save_ai_context_to_storage(
+    ticker: str,
+    context_date: date,
+    ai_context_data: Dict,
+    src_hash: Optional[str] = None,
+) -> str:
+    """将 AI Context 数据 (dict) 保存为 JSON 文件到 GCS 或本地 fallback。
+    src_hash 写入 GCS 对象元数据，供下次批量处理判断输入是否变化。
+    """
+    # GCS 上传紧凑 JSON（机器读取）；本地 fallback 写缩进格式便于调试
     if GCS_BUCKET_NAME:
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
+            bucket = _gcs_bucket()
             blob_name = _get_gcs_ai_context_blob_name(ticker, context_date)
             blob = bucket.blob(blob_name)
-            
-            blob.upload_from_string(json_content_str, content_type="application/json")
+            if src_hash:
+                blob.metadata = {"src_hash": src_hash}
+
+            _upload_json_gzip(blob, dumps_bytes(ai_context_data))
             logger.info("成功保存 %s AI Context 到 GCS: gs://%s/%s", ticker, GCS_BUCKET_NAME, blob_name)
             return f"gs://{GCS_BUCKET_NAME}/{blob_name}"
         except Exception as exc:
@@ -1679,8 +2175,8 @@ def _save_ai_context_to_storage(ticker: str, context_date: date, ai_context_data
     else:
         filepath = _get_local_fallback_ai_context_filepath(ticker, context_date)
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(json_content_str)
+            with open(filepath, "wb") as f:
+                f.write(dumps_bytes(ai_context_data, pretty=True))
             logger.warning("GCS_BUCKET_NAME 未设置。已保存 %s AI Context 到本地 fallback: %s (在 Cloud Run 中不持久化)", ticker, filepath)
             return filepath
         except Exception as exc:
@@ -1690,28 +2186,28 @@ def _save_ai_context_to_storage(ticker: str, context_date: date, ai_context_data
 # --- Daily Index for AI Context (Matching Financial Engine) ---
 def _get_gcs_daily_index_blob_name(index_date: date) -> str:
     """辅助函数，获取每日 AI Context 索引 JSON 文件的 GCS Blob 名称。"""
-    return f"ai_context/daily_index/{index_date.strftime('%Y-%m-%d')}.json"
+    return f"ai_context/daily_index/{index_date.isoformat()}.json"
 
 def _get_local_daily_index_filepath(index_date: date) -> str:
     """本地测试 fallback 路径辅助函数，用于每日 AI Context 索引 JSON 文件。"""
     os.makedirs(LOCAL_FALLBACK_DAILY_INDEX_DIR, exist_ok=True) # 确保目录存在
-    return os.path.join(LOCAL_FALLBACK_DAILY_INDEX_DIR, f"{index_date.strftime('%Y-%m-%d')}.json")
+    return os.path.join(LOCAL_FALLBACK_DAILY_INDEX_DIR, f"{index_date.isoformat()}.json")
 
 def _load_daily_index_from_storage(index_date: date) -> List[Dict]:
     """从 GCS 或本地 fallback 加载每日 AI Context 索引。"""
     if GCS_BUCKET_NAME:
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
+            bucket = _gcs_bucket()
             blob_name = _get_gcs_daily_index_blob_name(index_date)
             blob = bucket.blob(blob_name)
-            
-            if not blob.exists():
+
+            try:
+                raw = blob.download_as_bytes()
+            except NotFound:
                 logger.info("在 GCS 中未找到 %s 的现有每日索引 Blob 文件: gs://%s/%s。", index_date, GCS_BUCKET_NAME, blob_name)
                 return []
-            
-            json_content = blob.download_as_text(encoding="utf-8")
-            data = json.loads(json_content)
+
+            data = loads(raw)
             logger.info("成功从 GCS 加载 %s 的每日索引。", index_date)
             return data
         except Exception as exc:
@@ -1723,26 +2219,49 @@ def _load_daily_index_from_storage(index_date: date) -> List[Dict]:
             logger.info("GCS_BUCKET_NAME 未设置。在本地未找到 %s 的现有每日索引文件: %s。", index_date, filepath)
             return []
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            with open(filepath, "rb") as f:
+                data = loads(f.read())
             logger.warning("GCS_BUCKET_NAME 未设置。已从本地 fallback 加载 %s 的每日索引: %s", index_date, filepath)
             return data
         except Exception as exc:
             logger.error("从本地 fallback 文件 %s 加载 %s 的每日索引失败: %s", filepath, index_date, exc)
             return []
 
+def _load_daily_index_cached(index_date: date) -> List[Dict]:
+    """带进程内 TTL 缓存的 _load_daily_index_from_storage，供只读接口使用。
+    空结果（可能是读取失败）一律按当日的短 TTL 缓存，避免长时间缓存错误结果。
+    """
+    now = time.time()
+    with _DAILY_INDEX_CACHE_LOCK:
+        entry = _DAILY_INDEX_CACHE.get(index_date)
+        if entry and now - float(entry["cached_at"]) < float(entry["ttl"]):
+            return list(entry["items"])
+
+    items = _load_daily_index_from_storage(index_date)
+    is_past = index_date < datetime.now(TIMEZONE).date()
+    ttl = _DAILY_INDEX_CACHE_PAST_TTL_SECONDS if is_past and items else _DAILY_INDEX_CACHE_TODAY_TTL_SECONDS
+    with _DAILY_INDEX_CACHE_LOCK:
+        _DAILY_INDEX_CACHE[index_date] = {"items": list(items), "cached_at": time.time(), "ttl": ttl}
+        if len(_DAILY_INDEX_CACHE) > _DAILY_INDEX_CACHE_MAX_ENTRIES:
+            oldest = min(_DAILY_INDEX_CACHE, key=lambda k: float(_DAILY_INDEX_CACHE[k]["cached_at"]))
+            _DAILY_INDEX_CACHE.pop(oldest, None)
+    return items
+
+
+def _daily_index_cache_invalidate(index_date: date) -> None:
+    with _DAILY_INDEX_CACHE_LOCK:
+        _DAILY_INDEX_CACHE.pop(index_date, None)
+
+
 def _save_daily_index_to_storage(index_date: date, index_list: List[Dict]) -> str:
     """将每日 AI Context 索引保存到 GCS 或本地 fallback。"""
-    json_content = json.dumps(index_list, indent=2, ensure_ascii=False)
-
     if GCS_BUCKET_NAME:
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
+            bucket = _gcs_bucket()
             blob_name = _get_gcs_daily_index_blob_name(index_date)
             blob = bucket.blob(blob_name)
             
-            blob.upload_from_string(json_content, content_type="application/json")
+            _upload_json_gzip(blob, dumps_bytes(index_list))
             logger.info("成功保存 %s 的每日索引到 GCS: gs://%s/%s", index_date, GCS_BUCKET_NAME, blob_name)
             return f"gs://{GCS_BUCKET_NAME}/{blob_name}"
         except Exception as exc:
@@ -1751,8 +2270,8 @@ def _save_daily_index_to_storage(index_date: date, index_list: List[Dict]) -> st
     else:
         filepath = _get_local_daily_index_filepath(index_date)
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(json_content)
+            with open(filepath, "wb") as f:
+                f.write(dumps_bytes(index_list, pretty=True))
             logger.warning("GCS_BUCKET_NAME 未设置。已保存 %s 的每日索引到本地 fallback: %s", index_date, filepath)
             return filepath
         except Exception as exc:
@@ -1763,34 +2282,33 @@ def _save_daily_index_to_storage(index_date: date, index_list: List[Dict]) -> st
 # --- Daily Analysis Storage (for Stockmap / probability graph) ---
 
 def _get_gcs_analysis_blob_name(ticker: str, analysis_date: date) -> str:
-    return f"analysis/{ticker.upper()}/{analysis_date.strftime('%Y-%m-%d')}.json"
+    return f"analysis/{ticker.upper()}/{analysis_date.isoformat()}.json"
 
 
 def _get_gcs_analysis_daily_index_blob_name(index_date: date) -> str:
-    return f"analysis/daily_index/{index_date.strftime('%Y-%m-%d')}.json"
+    return f"analysis/daily_index/{index_date.isoformat()}.json"
 
 
 def _get_local_fallback_analysis_filepath(ticker: str, analysis_date: date) -> str:
     ticker_dir = os.path.join(LOCAL_FALLBACK_ANALYSIS_DIR, ticker.upper())
     os.makedirs(ticker_dir, exist_ok=True)
-    return os.path.join(ticker_dir, f"{analysis_date.strftime('%Y-%m-%d')}.json")
+    return os.path.join(ticker_dir, f"{analysis_date.isoformat()}.json")
 
 
 def _get_local_fallback_analysis_index_filepath(index_date: date) -> str:
     os.makedirs(LOCAL_FALLBACK_ANALYSIS_INDEX_DIR, exist_ok=True)
-    return os.path.join(LOCAL_FALLBACK_ANALYSIS_INDEX_DIR, f"{index_date.strftime('%Y-%m-%d')}.json")
+    return os.path.join(LOCAL_FALLBACK_ANALYSIS_INDEX_DIR, f"{index_date.isoformat()}.json")
 
 
 def _save_analysis_to_storage(ticker: str, analysis_date: date, analysis_data: Dict[str, Any]) -> str:
-    json_content_str = json.dumps(analysis_data, indent=2, ensure_ascii=False)
     if GCS_BUCKET_NAME:
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
+            bucket = _gcs_bucket()
             blob_name = _get_gcs_analysis_blob_name(ticker, analysis_date)
             blob = bucket.blob(blob_name)
             blob.cache_control = "public, max-age=600, stale-while-revalidate=86400"
-            blob.upload_from_string(json_content_str, content_type="application/json")
+            _upload_json_gzip(blob, dumps_bytes(analysis_data))
+            _analysis_store_cache_invalidate(ticker, analysis_date)
             logger.info("成功保存 %s analysis 到 GCS: gs://%s/%s", ticker, GCS_BUCKET_NAME, blob_name)
             return f"gs://{GCS_BUCKET_NAME}/{blob_name}"
         except Exception as exc:
@@ -1798,8 +2316,8 @@ def _save_analysis_to_storage(ticker: str, analysis_date: date, analysis_data: D
             return ""
     filepath = _get_local_fallback_analysis_filepath(ticker, analysis_date)
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(json_content_str)
+        with open(filepath, "wb") as f:
+            f.write(dumps_bytes(analysis_data, pretty=True))
         logger.warning("GCS_BUCKET_NAME 未设置。已保存 %s analysis 到本地 fallback: %s", ticker, filepath)
         return filepath
     except Exception as exc:
@@ -1807,20 +2325,40 @@ def _save_analysis_to_storage(ticker: str, analysis_date: date, analysis_data: D
         return ""
 
 
+def _analysis_store_cache_invalidate(ticker: str, analysis_date: date) -> None:
+    with _ANALYSIS_STORE_LOCK:
+        _ANALYSIS_STORE_CACHE.pop((ticker.upper(), analysis_date.isoformat()), None)
+
+
 def _load_analysis_from_storage(ticker: str, analysis_date: date) -> Optional[Dict[str, Any]]:
-    """Load analysis JSON from storage if present; return None when missing/unreadable."""
+    """Load analysis JSON from storage if present; return None when missing/unreadable.
+    GCS 命中结果以原始 bytes 在进程内缓存，每次返回新解析的 dict，调用方可自由修改。
+    """
     t = ticker.upper()
     if GCS_BUCKET_NAME:
+        key = (t, analysis_date.isoformat())
+        now = time.time()
+        with _ANALYSIS_STORE_LOCK:
+            entry = _ANALYSIS_STORE_CACHE.get(key)
+            if entry and now - float(entry["cached_at"]) < _ANALYSIS_STORE_CACHE_TTL_SECONDS:
+                return loads(entry["raw"])
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
+            bucket = _gcs_bucket()
             blob_name = _get_gcs_analysis_blob_name(t, analysis_date)
             blob = bucket.blob(blob_name)
-            if not blob.exists():
+            try:
+                raw = blob.download_as_bytes()
+            except NotFound:
                 return None
-            raw = blob.download_as_text(encoding="utf-8")
-            obj = json.loads(raw)
-            return obj if isinstance(obj, dict) else None
+            obj = loads(raw)
+            if not isinstance(obj, dict):
+                return None
+            with _ANALYSIS_STORE_LOCK:
+                _ANALYSIS_STORE_CACHE[key] = {"raw": raw, "cached_at": time.time()}
+                if len(_ANALYSIS_STORE_CACHE) > _ANALYSIS_STORE_CACHE_MAX_ENTRIES:
+                    oldest = min(_ANALYSIS_STORE_CACHE, key=lambda k: float(_ANALYSIS_STORE_CACHE[k]["cached_at"]))
+                    _ANALYSIS_STORE_CACHE.pop(oldest, None)
+            return obj
         except Exception as exc:
             logger.error("从 GCS 加载 %s analysis 失败: %s", t, exc)
             return None
@@ -1829,8 +2367,8 @@ def _load_analysis_from_storage(ticker: str, analysis_date: date) -> Optional[Di
     if not os.path.exists(filepath):
         return None
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            obj = json.load(f)
+        with open(filepath, "rb") as f:
+            obj = loads(f.read())
         return obj if isinstance(obj, dict) else None
     except Exception as exc:
         logger.error("从本地 fallback 文件 %s 加载 %s analysis 失败: %s", filepath, t, exc)
@@ -1890,13 +2428,13 @@ def _try_save_analysis_if_absent(ticker: str, analysis_date: date, analysis_data
         return _save_analysis_to_storage(t, analysis_date, analysis_data)
 
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
+        bucket = _gcs_bucket()
         blob = bucket.blob(blob_name)
         blob.cache_control = "public, max-age=600, stale-while-revalidate=86400"
-        payload = json.dumps(analysis_data, indent=2, ensure_ascii=False)
+        payload = dumps_bytes(analysis_data)
         try:
-            blob.upload_from_string(payload, content_type="application/json", if_generation_match=0)
+            _upload_json_gzip(blob, payload, if_generation_match=0)
+            _analysis_store_cache_invalidate(t, analysis_date)
             logger.info("成功创建 %s analysis 到 GCS: gs://%s/%s", t, GCS_BUCKET_NAME, blob_name)
         except PreconditionFailed:
             # Someone else already created it.
@@ -1910,14 +2448,14 @@ def _try_save_analysis_if_absent(ticker: str, analysis_date: date, analysis_data
 def _load_analysis_daily_index_from_storage(index_date: date) -> List[Dict[str, Any]]:
     if GCS_BUCKET_NAME:
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
+            bucket = _gcs_bucket()
             blob_name = _get_gcs_analysis_daily_index_blob_name(index_date)
             blob = bucket.blob(blob_name)
-            if not blob.exists():
+            try:
+                raw = blob.download_as_bytes()
+            except NotFound:
                 return []
-            json_content = blob.download_as_text(encoding="utf-8")
-            data = json.loads(json_content)
+            data = loads(raw)
             return data if isinstance(data, list) else []
         except Exception as exc:
             logger.error("从 GCS 加载 %s 的 analysis daily index 失败: %s", index_date, exc)
@@ -1927,8 +2465,8 @@ def _load_analysis_daily_index_from_storage(index_date: date) -> List[Dict[str,
     if not os.path.exists(filepath):
         return []
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        with open(filepath, "rb") as f:
+            data = loads(f.read())
         return data if isinstance(data, list) else []
     except Exception as exc:
         logger.error("从本地 fallback 文件 %s 加载 %s 的 analysis daily index 失败: %s", filepath, index_date, exc)
@@ -1936,14 +2474,12 @@ def _load_analysis_daily_index_from_storage(index_date: date) -> List[Dict[str,
 
 
 def _save_analysis_daily_index_to_storage(index_date: date, index_list: List[Dict[str, Any]]) -> str:
-    json_content = json.dumps(index_list, indent=2, ensure_ascii=False)
     if GCS_BUCKET_NAME:
         try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
+            bucket = _gcs_bucket()
             blob_name = _get_gcs_analysis_daily_index_blob_name(index_date)
             blob = bucket.blob(blob_name)
-            blob.upload_from_string(json_content, content_type="application/json")
+            _upload_json_gzip(blob, dumps_bytes(index_list))
             logger.info("成功保存 %s 的 analysis daily index 到 GCS: gs://%s/%s", index_date, GCS_BUCKET_NAME, blob_name)
             return f"gs://{GCS_BUCKET_NAME}/{blob_name}"
         except Exception as exc:
@@ -1952,14 +2488,70 @@ def _save_analysis_daily_index_to_storage(index_date: date, index_list: List[Dic
 
     filepath = _get_local_fallback_analysis_index_filepath(index_date)
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(json_content)
+        with open(filepath, "wb") as f:
+            f.write(dumps_bytes(index_list, pretty=True))
         return filepath
     except Exception as exc:
         logger.error("保存 %s 的 analysis daily index 到本地 fallback 文件 %s 失败: %s", index_date, filepath, exc)
         return ""
 
 
+_INDEX_UPDATE_MAX_ATTEMPTS = 5
+
+
+def _merge_index_entries(existing: List[Dict[str, Any]], updates: Dict[str, str]) -> List[Dict[str, Any]]:
+    """按 ticker 合并索引条目：updates 中的 ticker 覆盖旧条目（幂等）。"""
+    merged = [item for item in existing if item.get("ticker") not in updates]
+    merged.extend({"ticker": t, "path": p} for t, p in updates.items())
+    return merged
+
+
+def _update_daily_index(index_date: date, updates: Dict[str, str], analysis: bool = False) -> str:
+    """
+    将 ticker -> path 条目合并进每日索引（AI Context 或 analysis）。
+    GCS 模式下以对象 generation 做乐观并发控制：读取时记录 generation，写入时带
+    if_generation_match，被其他实例抢先写入 (PreconditionFailed) 则重新读取合并并退避重试，
+    避免并发 read-modify-write 丢失更新。
+    """
+    if not updates:
+        return ""
+    if not GCS_BUCKET_NAME:
+        with _BATCH_INDEX_LOCK:
+            if analysis:
+                index_list = _load_analysis_daily_index_from_storage(index_date)
+                return _save_analysis_daily_index_to_storage(index_date, _merge_index_entries(index_list, updates))
+            index_list = _load_daily_index_from_storage(index_date)
+            saved = _save_daily_index_to_storage(index_date, _merge_index_entries(index_list, updates))
+            _daily_index_cache_invalidate(index_date)
+            return saved
+
+    blob_name = _get_gcs_analysis_daily_index_blob_name(index_date) if analysis else _get_gcs_daily_index_blob_name(index_date)
+    for attempt in range(_INDEX_UPDATE_MAX_ATTEMPTS):
+        try:
+            blob = _gcs_bucket().blob(blob_name)
+            try:
+                blob.reload()
+                generation = blob.generation
+                existing = loads(blob.download_as_bytes(if_generation_match=generation))
+            except NotFound:
+                # generation=0 表示仅在对象不存在时创建
+                generation, existing = 0, []
+            if not isinstance(existing, list):
+                existing = []
+            _upload_json_gzip(blob, dumps_bytes(_merge_index_entries(existing, updates)), if_generation_match=generation)
+            if not analysis:
+                _daily_index_cache_invalidate(index_date)
+            logger.info("成功更新 %s 的每日索引 (%d 条): gs://%s/%s", index_date, len(updates), GCS_BUCKET_NAME, blob_name)
+            return f"gs://{GCS_BUCKET_NAME}/{blob_name}"
+        except PreconditionFailed:
+            time.sleep(min(2.0, 0.1 * (2 ** attempt)))
+        except Exception as exc:
+            logger.error("更新 %s 的每日索引 gs://%s/%s 失败: %s", index_date, GCS_BUCKET_NAME, blob_name, exc)
+            return ""
+    logger.error("更新 %s 的每日索引 gs://%s/%s 失败：并发冲突重试 %d 次仍未成功。", index_date, GCS_BUCKET_NAME, blob_name, _INDEX_UPDATE_MAX_ATTEMPTS)
+    return ""
+
+
 def backfill_5_year_data_job(ticker: str) -> str:
     """
     获取指定股票 5 年的历史数据，并保存到 GCS (或本地 fallback)。
@@ -1981,10 +2573,27 @@ def backfill_5_year_data_job(ticker: str) -> str:
     return _save_historical_data_to_storage(ticker, df_5y)
 
 
-def daily_incremental_update_job(ticker: str) -> None:
+def _prefetch_dates_match_storage(existing_df: pd.DataFrame, latest_df: pd.DataFrame, start: date) -> bool:
+    """
+    检查批量预取的日 K 线与存储中的数据在重叠区间 [start, 存储最新日期] 内日期完全一致。
+    两条获取路径的时区处理一旦不一致（如港股被错开一天），合并后每根 K 线会以相邻两天重复保存。
+    """
+    if existing_df.empty or latest_df.empty:
+        return True
+    lo, hi = pd.Timestamp(start), existing_df.index.max().normalize()
+    stored = existing_df.index.normalize()
+    fetched = latest_df.index.normalize()
+    stored = stored[(stored >= lo) & (stored <= hi)]
+    fetched = fetched[(fetched >= lo) & (fetched <= hi)]
+    return set(stored) == set(fetched)
+
+
+def daily_incremental_update_job(ticker: str, prefetched: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     对单个股票的历史数据执行每日增量更新，补齐到最新交易日期。
     如果现有数据存在断档，将尝试补全。
+    prefetched 为批量预取的最近日 K 线（见 _fetch_historical_df_bulk）；覆盖所需区间时不再单独请求 yfinance。
+    返回更新后的完整历史数据，调用方可直接复用而无需再次加载。
     """
     logger.info("处理 %s 的每日增量更新...", ticker)
     existing_df = _load_historical_data_from_storage(ticker)
@@ -2020,62 +2629,88 @@ def daily_incremental_update_job(ticker: str) -> None:
     # 如果开始获取日期已经大于今天，则无需更新
     if fetch_start_date > today_date_naive:
         logger.info("%s 的历史数据已是最新，无需增量更新。", ticker)
-        return
+        return existing_df
 
     # 获取从 fetch_start_date 到今天的所有数据
     # yfinance.history 的 end 参数是排他性的，所以这里需要 +1 天以包含今天
     fetch_end_date = today_date_naive + timedelta(days=1) 
     # _fetch_historical_df 现在返回 timezone-naive DatetimeIndex，与 existing_df 兼容
-    latest_df = _fetch_historical_df(ticker, start=fetch_start_date, end=fetch_end_date, interval='1d') 
+    prefetch_start = prefetched.attrs.get("fetch_start") if prefetched is not None else None
+    latest_df = None
+    if prefetch_start is not None and prefetch_start <= fetch_start_date:
+        latest_df = prefetched.loc[pd.Timestamp(fetch_start_date):].copy()
+        if not _prefetch_dates_match_storage(existing_df, latest_df, fetch_start_date):
+            logger.warning("%s 的批量预取日期与存储中的日期不一致，改为逐只获取。", ticker)
+            latest_df = None
+    if latest_df is None:
+        latest_df = _fetch_historical_df(ticker, start=fetch_start_date, end=fetch_end_date, interval='1d')
 
     if latest_df.empty:
         logger.warning("无法获取 %s 的最新日数据 (从 %s 到 %s)，跳过增量更新。", ticker, fetch_start_date, today_date_naive)
-        return
+        return existing_df
     # --- 关键修改点优化：确保所有索引都只保留日期部分（截断时间） ---
     # 这会强制将所有 DatetimeIndex 的时间部分设为 00:00:00，确保在合并和去重时完全一致
-    if not existing_df.empty:
+    # 存储中的数据在上次保存前已经 normalize 过，通常无需重建索引
+    if not existing_df.empty and not existing_df.index.is_normalized:
         existing_df.index = existing_df.index.normalize() # normalize() 会将时间部分设为 00:00:00
-    
-    latest_df.index = latest_df.index.normalize() # 对新获取的数据也进行同样处理
+
+    if not latest_df.index.is_normalized:
+        latest_df.index = latest_df.index.normalize() # 对新获取的数据也进行同样处理
 
     # Before market close, today's daily bar can be an intraday snapshot.
     # Drop it so persisted history only contains finalized daily candles.
     if is_trading_day(today_date_naive) and not _is_after_market_close(now_market):
-        intraday_mask = latest_df.index.date == today_date_naive
+        intraday_mask = latest_df.index == pd.Timestamp(today_date_naive)  # 索引已 normalize
         if bool(np.any(intraday_mask)):
             latest_df = latest_df.loc[~intraday_mask].copy()
             logger.info("市场未收盘，忽略 %s 的当日未收盘日线快照 (%s)。", ticker, today_date_naive)
             if latest_df.empty:
                 logger.info("%s 本次仅返回未收盘日线，跳过持久化写入。", ticker)
-                return
+                return existing_df
     # --- 关键修改点 ---
-    # 合并现有数据和新获取的数据
-    combined_df = pd.concat([existing_df, latest_df])
-    
-    # 按日期（索引）排序，确保后续去重时 'last' 总是指最新获取的数据
-    # 这一点很重要，以处理同一天数据可能被多次更新的情况
-    combined_df = combined_df.sort_index()
-    
-    # 根据索引（日期）进行去重，保留每个日期的最后一条记录
-    # 这里 ~combined_df.index.duplicated(keep='last') 意味着筛选出索引不重复的行，
-    # 或者对于重复的索引，保留最后出现的那个
-    merged_df = combined_df[~combined_df.index.duplicated(keep='last')]
+    # 合并现有数据和新获取的数据：重叠日期以新获取的数据为准（整行覆盖）。
+    # latest_df 只覆盖最近几天，只对这 k 行去重，再从已排序的 existing_df 中剔除被覆盖的日期。
+    if not latest_df.index.is_monotonic_increasing:
+        latest_df = latest_df.sort_index()
+    latest_df = latest_df[~latest_df.index.duplicated(keep='last')]
+    kept_df = existing_df[~existing_df.index.isin(latest_df.index)]
+    merged_df = pd.concat([kept_df, latest_df])
+    # 新数据通常整体位于尾部，此时拼接结果已经有序，无需重新排序
+    if not kept_df.empty and kept_df.index[-1] >= latest_df.index[0]:
+        merged_df = merged_df.sort_index()
 
     _save_historical_data_to_storage(ticker, merged_df)
     logger.info("完成 %s 的每日增量更新。总记录数: %d", ticker, len(merged_df))
+    return merged_df
+
+
+_AI_CONTEXT_PRICE_COLS = ['Open', 'High', 'Low', 'Close']
 
 
-def _generate_ticker_ai_context(ticker: str) -> Dict:
+def _ai_context_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    将带 Date 列的 K 线 DataFrame 转换为 JSON 友好的 dict 列表：
+    价格列一次性保留两位小数，日期格式化为 YYYY-MM-DD，NaN 转为 None。
+    """
+    df = df.copy()
+    cols = [c for c in _AI_CONTEXT_PRICE_COLS if c in df.columns]
+    if cols:
+        df[cols] = df[cols].astype("float64").round(2)
+    df['Date'] = df['Date'].dt.strftime("%Y-%m-%d")
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def _generate_ticker_ai_context(ticker: str, df: Optional[pd.DataFrame] = None) -> Dict:
     """
     生成指定股票的 AI Context，包括特征、最近一个月的每日数据和最近一年的每月 K 线数据。
-    假定 GCS 中有 5 年的历史数据。
+    假定 GCS 中有 5 年的历史数据；传入 df 时直接使用，不再从存储加载。
     """
     ticker = ticker.upper()
     logger.info("为 %s 生成 AI Context...", ticker)
 
     # 1. 加载完整的历史数据（5 年）
     # _load_historical_data_from_storage 确保返回 timezone-naive DatetimeIndex
-    df_full = _load_historical_data_from_storage(ticker)
+    df_full = df if df is not None else _load_historical_data_from_storage(ticker)
     if df_full.empty:
         logger.warning("未找到 %s 的历史数据以生成 AI Context。", ticker)
         return {"ticker": ticker, "status": "failed", "reason": "No historical data available."}
@@ -2084,8 +2719,9 @@ def _generate_ticker_ai_context(ticker: str) -> Dict:
         logger.error("df_full 的索引不是 DatetimeIndex，无法为 %s 生成 AI Context。", ticker)
         return {"ticker": ticker, "status": "failed", "reason": "Historical data index format error."}
     
-    # 确保索引是排好序的
-    df_full = df_full.sort_index()
+    # 确保索引是排好序的（存储写入时已按日期升序，通常无需再排）
+    if not df_full.index.is_monotonic_increasing:
+        df_full = df_full.sort_index()
 
     # 2. 计算特征（使用完整数据进行稳健计算，如 200 日均线）
     features = _compute_features(df_full) # _compute_features现在内部处理索引
@@ -2103,19 +2739,10 @@ def _generate_ticker_ai_context(ticker: str) -> Dict:
     end_date_for_slice = datetime.now(TIMEZONE).date()
     start_date_month_ago = end_date_for_slice - timedelta(days=30)
     
-    # 筛选数据，索引已经是 naive DatetimeIndex，直接比较 date 属性即可
-    last_month_daily_df = df_full[df_full.index.date >= start_date_month_ago].copy()
-
-    # --- 修改：格式化每日数据中的价格列，保留两位小数 ---
-    price_cols_to_round = ['Open', 'High', 'Low', 'Close']
-    for col in price_cols_to_round:
-        if col in last_month_daily_df.columns:
-            last_month_daily_df[col] = pd.to_numeric(last_month_daily_df[col], errors='coerce').round(2)
-
-    # 转换为 dict 列表以进行 JSON 序列化，处理日期格式和 NaNs
-    last_month_daily_data = last_month_daily_df.reset_index()
-    last_month_daily_data['Date'] = last_month_daily_data['Date'].dt.strftime("%Y-%m-%d")
-    last_month_daily_data = last_month_daily_data.replace({np.nan: None}).to_dict(orient="records")
+    # 索引是排好序的 naive DatetimeIndex，按 Timestamp 切片走 searchsorted，避免构造 date 对象数组
+    last_month_daily_df = df_full.loc[pd.Timestamp(start_date_month_ago):]
+
+    last_month_daily_data = _ai_context_records(last_month_daily_df.reset_index())
     
     # 4. 生成最近一年的月 K 线数据
     # _resample_to_monthly 返回带有 DatetimeIndex (naive) 的 DataFrame
@@ -2123,17 +2750,8 @@ def _generate_ticker_ai_context(ticker: str) -> Dict:
     
     # 过滤最近 12 个月（大约 365 天）
     start_date_year_ago = end_date_for_slice - timedelta(days=365)
-    last_year_monthly_df = monthly_df_full[monthly_df_full.index.date >= start_date_year_ago].reset_index()
-
-    # --- 修改：格式化每月数据中的价格列，保留两位小数 ---
-    for col in price_cols_to_round:
-        if col in last_year_monthly_df.columns:
-            last_year_monthly_df[col] = pd.to_numeric(last_year_monthly_df[col], errors='coerce').round(2)
-    
-    # 转换为 dict 列表以进行 JSON 序列化，处理日期格式和 NaNs
-    last_year_monthly_data = last_year_monthly_df.copy()
-    last_year_monthly_data['Date'] = last_year_monthly_data['Date'].dt.strftime("%Y-%m-%d")
-    last_year_monthly_data = last_year_monthly_data.replace({np.nan: None}).to_dict(orient="records")
+    last_year_monthly_df = monthly_df_full.loc[pd.Timestamp(start_date_year_ago):].reset_index()
+    last_year_monthly_data = _ai_context_records(last_year_monthly_df)
 
     ai_context = {
         "ticker": ticker,
@@ -2147,38 +2765,77 @@ def _generate_ticker_ai_context(ticker: str) -> Dict:
     return ai_context
 
 
-def _process_ticker_for_batch(ticker: str, current_date: date) -> Dict[str, str]:
+class _IndexAccumulator:
+    """
+    批量处理期间在内存中汇总每日索引条目（ticker -> path），结束后一次性合并写回，
+    避免每只股票各自对同一索引文件做 read-modify-write。
+    """
+
+    def __init__(self, index_date: date):
+        self.date = index_date
+        self.ai: Dict[str, str] = {}
+        self.analysis: Dict[str, str] = {}
+        self._lock = Lock()
+
+    def add_ai(self, ticker: str, path: str) -> None:
+        with self._lock:
+            self.ai[ticker.upper()] = path
+
+    def add_analysis(self, ticker: str, path: str) -> None:
+        with self._lock:
+            self.analysis[ticker.upper()] = path
+
+    def flush(self) -> None:
+        """每个索引只读取、合并、写回一次。"""
+        _update_daily_index(self.date, self.ai)
+        _update_daily_index(self.date, self.analysis, analysis=True)
+
+
+def _process_ticker_for_batch(
+    ticker: str,
+    current_date: date,
+    accumulator: Optional[_IndexAccumulator] = None,
+    prefetched: Optional[pd.DataFrame] = None,
+) -> Dict[str, str]:
     """
     辅助函数，处理单个股票的批量操作：
     每日历史数据更新（包括自动铺底或补全），AI Context 生成和保存，以及每日索引更新。
+    传入 accumulator 时索引条目只在内存中登记，由调用方在批量结束后统一写回；
+    prefetched 透传给 daily_incremental_update_job。
     """
     ticker = ticker.upper()
     try:
         # 1. 每日增量更新历史数据（包含自动铺底或补全逻辑）
         # 此函数内部会处理：如果没有历史数据则铺底，如果存在断档则补全
-        daily_incremental_update_job(ticker) 
-
-        # 2. 生成 AI Context
-        ai_context_data = _generate_ticker_ai_context(ticker)
-        if ai_context_data.get("status") == "failed":
-            return {"status": "failed", "message": ai_context_data.get("reason", "AI Context 生成失败。")}
+        # 返回更新后的完整历史数据，供下面的 AI Context 与 analysis 复用
+        df_full = daily_incremental_update_job(ticker, prefetched=prefetched)
+
+        # 当天已有基于相同历史数据生成的 AI Context（例如同日重跑批量），跳过重新生成与上传
+        src_hash = _historical_src_hash(df_full) if GCS_BUCKET_NAME and not df_full.empty else None
+        if src_hash and _ai_context_stored_src_hash(ticker, current_date) == src_hash:
+            gcs_ai_context_path = f"gs://{GCS_BUCKET_NAME}/{_get_gcs_ai_context_blob_name(ticker, current_date)}"
+            logger.info("%s 的历史数据未变化，复用已有 AI Context: %s", ticker, gcs_ai_context_path)
+        else:
+            # 2. 生成 AI Context
+            ai_context_data = _generate_ticker_ai_context(ticker, df=df_full)
+            if ai_context_data.get("status") == "failed":
+                return {"status": "failed", "message": ai_context_data.get("reason", "AI Context 生成失败。")}
 
-        # 3. 保存 AI Context 作为 .txt 文件
-        gcs_ai_context_path = _save_ai_context_to_storage(ticker, current_date, ai_context_data)
-        if not gcs_ai_context_path:
-            return {"status": "failed", "message": "保存 AI Context 到存储失败。"}
+            # 3. 保存 AI Context 作为 .txt 文件
+            gcs_ai_context_path = _save_ai_context_to_storage(ticker, current_date, ai_context_data, src_hash=src_hash)
+            if not gcs_ai_context_path:
+                return {"status": "failed", "message": "保存 AI Context 到存储失败。"}
 
         # 4. 更新每日 AI Context 索引
-        daily_index = _load_daily_index_from_storage(current_date)
-        # 移除该股票的现有条目（用于幂等性）
-        daily_index = [item for item in daily_index if item.get("ticker") != ticker]
-        daily_index.append({"ticker": ticker, "path": gcs_ai_context_path})
-        _save_daily_index_to_storage(current_date, daily_index)
+        if accumulator is not None:
+            accumulator.add_ai(ticker, gcs_ai_context_path)
+        else:
+            _update_daily_index(current_date, {ticker: gcs_ai_context_path})
         
         analysis_path = ""
         if GENERATE_ANALYSIS_IN_BATCH:
             try:
-                df_for_analysis = _load_historical_data_from_storage(ticker)
+                df_for_analysis = df_full
                 if not df_for_analysis.empty:
                     # Years is mostly meta for now; keep it stable for MVP.
                     analysis_payload = _compute_analysis_from_df(
@@ -2189,11 +2846,10 @@ def _process_ticker_for_batch(ticker: str, current_date: date) -> Dict[str, str]
                         user_factor=None,
                     )
                     analysis_path = _save_analysis_to_storage(ticker, current_date, analysis_payload)
-                    if analysis_path:
-                        analysis_index = _load_analysis_daily_index_from_storage(current_date)
-                        analysis_index = [item for item in analysis_index if item.get("ticker") != ticker]
-                        analysis_index.append({"ticker": ticker, "path": analysis_path})
-                        _save_analysis_daily_index_to_storage(current_date, analysis_index)
+                    if analysis_path and accumulator is not None:
+                        accumulator.add_analysis(ticker, analysis_path)
+                    elif analysis_path:
+                        _update_daily_index(current_date, {ticker: analysis_path}, analysis=True)
             except Exception as exc:
                 # Analysis precompute should not fail the whole batch; it can be computed on-demand later.
                 logger.warning("为 %s 预计算 analysis 失败（将跳过）: %s", ticker, exc)
@@ -2209,8 +2865,60 @@ def _process_ticker_for_batch(ticker: str, current_date: date) -> Dict[str, str]
         return {"status": "failed", "message": f"批量处理时异常: {str(exc)}"}
 
 
+def run_batch(tickers: List[str], current_date: date) -> Dict[str, Dict[str, str]]:
+    """
+    并发执行多只股票的批量处理。每只股票的 yfinance / GCS 调用以网络 I/O 为主（释放 GIL），
+    线程池可以重叠这些延迟；_process_ticker_for_batch 自身捕获异常，单只失败不影响其他股票。
+    """
+    unique = list(dict.fromkeys(t.upper() for t in tickers))
+    if not unique:
+        return {}
+    workers = max(1, min(BATCH_WORKERS, len(unique)))
+    accumulator = _IndexAccumulator(current_date)
+    started = time.perf_counter()
+    prefetched = _bulk_prefetch_recent(unique)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(pool.map(
+            lambda t: _process_ticker_for_batch(t, current_date, accumulator, prefetched.get(t)),
+            unique,
+        ))
+    accumulator.flush()
+    logger.info("批量处理 %d 只股票完成（并发 %d），耗时 %.2fs。", len(unique), workers, time.perf_counter() - started)
+    by_ticker = dict(zip(unique, outcomes))
+    return {t: by_ticker[t.upper()] for t in tickers}
+
+
+def run_daily_updates(tickers: List[str]) -> Dict[str, str]:
+    """并发执行多只股票的每日增量历史数据更新，返回 ticker -> "success" / "failed: ..."。"""
+    unique = list(dict.fromkeys(t.upper() for t in tickers))
+    if not unique:
+        return {}
+
+    def _update_one(ticker: str) -> str:
+        try:
+            daily_incremental_update_job(ticker, prefetched=prefetched.get(ticker))
+            return "success"
+        except Exception as exc:
+            logger.error("为 %s 执行每日更新时出错: %s", ticker, exc)
+            return f"failed: {str(exc)}"
+
+    workers = max(1, min(BATCH_WORKERS, len(unique)))
+    started = time.perf_counter()
+    prefetched = _bulk_prefetch_recent(unique)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(pool.map(_update_one, unique))
+    logger.info("每日历史数据更新 %d 只股票完成（并发 %d），耗时 %.2fs。", len(unique), workers, time.perf_counter() - started)
+    by_ticker = dict(zip(unique, outcomes))
+    return {t: by_ticker[t.upper()] for t in tickers}
+
+
 # --- Dynamic Ticker List Management ---
 
+def _normalize_active_tickers(tickers: List[str]) -> tuple[str, ...]:
+    """统一大写、去除空白和非字符串项，返回不可变的股票列表快照。"""
+    return tuple(t.strip().upper() for t in tickers if isinstance(t, str) and t.strip())
+
+
 def _load_dynamic_ticker_list() -> List[str]:
     """
     从 GCS 加载动态股票列表。如果失败或不存在，则回退到硬编码的默认列表。
@@ -2220,18 +2928,18 @@ def _load_dynamic_ticker_list() -> List[str]:
         return _DEFAULT_HARDCODED_TICKERS
 
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
+        bucket = _gcs_bucket()
         blob = bucket.blob(GCS_TICKER_LIST_BLOB_NAME)
 
-        if not blob.exists():
+        try:
+            raw = blob.download_as_bytes()
+        except NotFound:
             logger.warning("在 GCS 中未找到股票列表文件: gs://%s/%s。将使用硬编码的默认列表。", GCS_BUCKET_NAME, GCS_TICKER_LIST_BLOB_NAME)
             # 如果文件不存在，自动创建并上传硬编码的默认列表
             _save_dynamic_ticker_list(_DEFAULT_HARDCODED_TICKERS)
             return _DEFAULT_HARDCODED_TICKERS
-        
-        json_content = blob.download_as_text(encoding="utf-8")
-        ticker_list = json.loads(json_content)
+
+        ticker_list = loads(raw)
         if not isinstance(ticker_list, list) or not all(isinstance(t, str) for t in ticker_list):
             logger.error("GCS 中的股票列表文件格式无效，应为字符串列表。将使用硬编码的默认列表。")
             return _DEFAULT_HARDCODED_TICKERS
@@ -2252,11 +2960,10 @@ def _save_dynamic_ticker_list(ticker_list: List[str]) -> str:
         return ""
 
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
+        bucket = _gcs_bucket()
         blob = bucket.blob(GCS_TICKER_LIST_BLOB_NAME)
         
-        json_content = json.dumps(ticker_list, indent=2, ensure_ascii=False)
+        json_content = dumps_bytes(ticker_list)
         blob.upload_from_string(json_content, content_type="application/json")
         logger.info("成功保存动态股票列表到 GCS: gs://%s/%s", GCS_BUCKET_NAME, GCS_TICKER_LIST_BLOB_NAME)
         return f"gs://{GCS_BUCKET_NAME}/{GCS_TICKER_LIST_BLOB_NAME}"
@@ -2273,7 +2980,7 @@ async def startup_event():
     logger.info("交易数据服务启动事件触发。")
     
     # 1. 加载动态股票列表
-    _CURRENT_ACTIVE_TICKERS = _load_dynamic_ticker_list()
+    _CURRENT_ACTIVE_TICKERS = _normalize_active_tickers(_load_dynamic_ticker_list())
     if not _CURRENT_ACTIVE_TICKERS:
         logger.warning("动态股票列表为空或加载失败，请通过 /admin/update_default_tickers 接口配置或检查 GCS_BUCKET_NAME。")
         # 即使列表为空，也让服务启动，但数据处理部分可能不会执行
@@ -2325,14 +3032,41 @@ async def get_trading_data_endpoint(ticker: str) -> Dict:
     """
     ticker = ticker.upper()
     request_logger.info(f"API Request: /trading_data/{ticker} - Real-time quote")
-    quote_data = _fetch_quote(ticker)
+    quote_data = await asyncio.to_thread(_fetch_quote, ticker)
     if not quote_data or not quote_data.get("price"):
         raise HTTPException(status_code=404, detail=f"实时数据 {ticker} 未找到或无法获取。")
     return quote_data
 
 
+_HISTORY_STREAM_CHUNK_ROWS = 256
+
+
+def _iter_json_records(df: pd.DataFrame, chunk_rows: int = _HISTORY_STREAM_CHUNK_ROWS):
+    """把 DataFrame 按块编码为 JSON 记录数组的字节流。
+    每块按列转换为 Python 原生值再 zip 成记录（避免 to_dict 的逐单元格分派），
+    浮点列中的 NaN 显式转为 None，不依赖具体 JSON 后端对 NaN 的处理；
+    整块一次 dumps 后去掉方括号拼接，不在内存中构造完整的记录列表。
+    """
+    cols = [str(c) for c in df.columns]
+    arrays = [df[c].to_numpy() for c in df.columns]
+    yield b"["
+    for start in range(0, len(df), chunk_rows):
+        values = []
+        for arr in arrays:
+            part = arr[start:start + chunk_rows]
+            if part.dtype.kind == "f":
+                nan_mask = np.isnan(part)
+                if nan_mask.any():
+                    part = part.astype(object)
+                    part[nan_mask] = None
+            values.append(part.tolist())
+        chunk = dumps_bytes([dict(zip(cols, row)) for row in zip(*values)])
+        yield (b"," if start else b"") + chunk[1:-1]
+    yield b"]"
+
+
 @app.get("/trading_data/{ticker}/historical", summary="获取历史行情数据")
-async def get_historical_data_endpoint(ticker: str, period: str = Query('1y', pattern="^(3y|1y|3mo|5y)$")) -> List[Dict]:
+async def get_historical_data_endpoint(ticker: str, period: str = Query('1y', pattern="^(3y|1y|3mo|5y)$")) -> StreamingResponse:
     """
     **主要行为:** 获取指定股票的历史 K 线数据。
 
@@ -2358,38 +3092,37 @@ async def get_historical_data_endpoint(ticker: str, period: str = Query('1y', pa
         period_days = 5 * 365
 
     # Prefer persisted data (GCS) when available; refresh only when stale (rate-limited).
-    df = _load_historical_data_from_storage(ticker)
-    try:
-        if _should_refresh_on_request(ticker, df):
-            _maybe_refresh_daily_once(ticker, min_interval_seconds=HISTORICAL_REFRESH_MAX_AGE_SECONDS)
-            df = _load_historical_data_from_storage(ticker, force_reload=True).sort_index()
-    except Exception:
-        pass
+    # 存储/yfinance 均为阻塞 I/O，放到线程池执行，避免阻塞事件循环
+    df = await asyncio.to_thread(_load_historical_with_refresh, ticker)
 
     if df.empty:
         # Fallback: fetch via yfinance, and persist so subsequent requests are fast + consistent.
-        df = _fetch_historical_df(ticker, period=period)  # Returns with DatetimeIndex (naive)
+        df = await asyncio.to_thread(_fetch_historical_df, ticker, period=period)  # Returns with DatetimeIndex (naive)
         if df.empty:
             raise HTTPException(status_code=404, detail=f"周期 {period} 的 {ticker} 历史数据未找到。")
         if isinstance(df.index, pd.DatetimeIndex):
             df.index = df.index.normalize()
-        _save_historical_data_to_storage(ticker, df)
+        await asyncio.to_thread(_save_historical_data_to_storage, ticker, df)
 
     # Slice to requested period (approx) to reduce payload.
     if isinstance(df.index, pd.DatetimeIndex) and len(df.index):
-        cutoff = datetime.now(TIMEZONE).date() - timedelta(days=int(period_days))
-        df = df[df.index.date >= cutoff].copy()
+        cutoff = pd.Timestamp(datetime.now(TIMEZONE).date() - timedelta(days=int(period_days)))
+        # 有序索引上 searchsorted 定位起点后切片，不构造逐行掩码
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        df = df.iloc[df.index.searchsorted(cutoff, side="left"):]
         if df.empty:
             raise HTTPException(status_code=404, detail=f"周期 {period} 的 {ticker} 历史数据未找到。")
 
     # 转换为 dict 列表以便 API 响应
     # 确保 'Date' 列转换为字符串，并将 NaN 替换以便 JSON 序列化
     if isinstance(df.index, pd.DatetimeIndex):
-        df = df.reset_index()
-        df['Date'] = df['Date'].dt.strftime("%Y-%m-%d")
-    df = df.replace({np.nan: None}) # 替换数据中的 NaNs
-    
-    return df.to_dict(orient="records")
+        # 直接在索引上格式化日期，省去 reset 后再对 Series 做一次 .dt.strftime
+        date_strs = df.index.strftime("%Y-%m-%d")
+        df = df.reset_index(drop=True)
+        df.insert(0, "Date", date_strs)
+    # 分块流式输出 JSON 数组，峰值内存只与块大小有关；NaN 由 _iter_json_records 转为 null
+    return StreamingResponse(_iter_json_records(df), media_type="application/json")
 
 
 @app.get("/portfolio/prices", summary="获取财富自由组合的最新收盘价")
@@ -2407,6 +3140,14 @@ async def get_portfolio_prices_endpoint(tickers: str = Query(..., description="
     payload: Dict[str, Dict[str, float]] = {}
     missing: List[str] = []
 
+    resolved_by_raw: Dict[str, Optional[str]] = {
+        raw_ticker: _resolve_portfolio_ticker(raw_ticker)
+        for raw_ticker in requested
+        if raw_ticker.upper() not in _STATIC_PORTFOLIO_TICKERS
+    }
+    resolved_list = [r for r in resolved_by_raw.values() if r]
+    snapshots = await asyncio.to_thread(_load_latest_price_snapshots, resolved_list) if resolved_list else {}
+
     for raw_ticker in requested:
         upper = raw_ticker.upper()
 
@@ -2414,12 +3155,12 @@ async def get_portfolio_prices_endpoint(tickers: str = Query(..., description="
             payload[raw_ticker] = {"price": 1.0, "changePercent": 0.0}
             continue
 
-        resolved = _resolve_portfolio_ticker(raw_ticker)
+        resolved = resolved_by_raw.get(raw_ticker)
         if not resolved:
             missing.append(raw_ticker)
             continue
 
-        snapshot = _load_latest_price_snapshot(resolved)
+        snapshot = snapshots.get(resolved)
         if snapshot:
             payload[raw_ticker] = snapshot
         else:
@@ -2446,8 +3187,8 @@ async def get_features_endpoint(ticker: str, period: str = Query('1y', pattern="
     """
     ticker = ticker.upper()
     request_logger.info(f"API Request: /trading_data/{ticker}/features - Period: {period}")
-    df = _fetch_historical_df(ticker, period=period) # Returns with DatetimeIndex (naive)
-    features = _compute_features(df)
+    df = await asyncio.to_thread(_fetch_historical_df, ticker, period=period) # Returns with DatetimeIndex (naive)
+    features = await asyncio.to_thread(_compute_features, df)
     if not features:
         raise HTTPException(status_code=404, detail=f"未能计算 {ticker} 周期 {period} 的特征。数据可能不足。")
     return features
@@ -2468,7 +3209,7 @@ async def manual_backfill_5y_data(ticker: str) -> Dict[str, str]:
     """
     ticker = ticker.upper()
     request_logger.info(f"API Request: /trading_data/{ticker}/backfill_5y - Manual 5-year backfill")
-    filepath = backfill_5_year_data_job(ticker)
+    filepath = await asyncio.to_thread(backfill_5_year_data_job, ticker)
     if not filepath:
         raise HTTPException(status_code=500, detail=f"未能为 {ticker} 铺底 5 年数据。请检查服务日志。")
     return {"ticker": ticker, "message": f"成功启动 5 年数据铺底。数据已保存至 {filepath}。"}
@@ -2493,14 +3234,8 @@ async def daily_update_all_historical_trigger() -> Dict[str, Any]:
         logger.info("%s 不是交易日（周末），跳过每日更新。", today_date)
         return {"message": f"{today_date} 不是交易日（周末），跳过每日更新。"}
 
-    results: Dict[str, str] = {}
-    for ticker in _CURRENT_ACTIVE_TICKERS: # 使用动态列表
-        try:
-            daily_incremental_update_job(ticker) # 内部会处理铺底和增量补全
-            results[ticker] = "success"
-        except Exception as exc:
-            logger.error("为 %s 执行每日更新时出错: %s", ticker, exc)
-            results[ticker] = f"failed: {str(exc)}"
+    # 内部会处理铺底和增量补全；按 BATCH_WORKERS 并发执行
+    results: Dict[str, str] = await asyncio.to_thread(run_daily_updates, list(_CURRENT_ACTIVE_TICKERS)) # 使用动态列表
     logger.info("每日历史数据更新完成。")
     return {"message": "每日历史数据更新已触发。", "results": results}
 
@@ -2529,9 +3264,7 @@ async def batch_process_all_trigger() -> Dict[str, Any]:
     else:
         logger.info("%s 是交易日，执行批量处理。", current_processing_date)
 
-    results: Dict[str, Dict] = {}
-    for ticker in _CURRENT_ACTIVE_TICKERS: # 使用动态列表
-        results[ticker] = _process_ticker_for_batch(ticker, current_processing_date)
+    results: Dict[str, Dict] = await asyncio.to_thread(run_batch, list(_CURRENT_ACTIVE_TICKERS), current_processing_date) # 使用动态列表
     
     logger.info("所有股票的批量处理完成。")
     return {"message": "所有当前激活股票的批量处理已触发。", "results": results}
@@ -2565,9 +3298,7 @@ async def batch_refresh_specified_tickers(tickers: List[str] = Body(..., embed=T
     else:
         logger.info("%s 是交易日，执行批量处理。", current_processing_date)
 
-    results: Dict[str, Dict] = {}
-    for ticker in tickers:
-        results[ticker] = _process_ticker_for_batch(ticker, current_processing_date)
+    results: Dict[str, Dict] = await asyncio.to_thread(run_batch, tickers, current_processing_date)
     
     logger.info("指定股票的批量已完成。")
     return {"message": "指定股票的批量已完成。", "results": results}
@@ -2595,15 +3326,15 @@ async def update_default_tickers(new_tickers: List[str] = Body(..., description=
         raise HTTPException(status_code=400, detail="请求体必须是有效的字符串股票代码列表。")
 
     # 更新内存中的列表
-    _CURRENT_ACTIVE_TICKERS = [t.upper() for t in new_tickers]
+    _CURRENT_ACTIVE_TICKERS = _normalize_active_tickers(new_tickers)
     
     # 保存到 GCS
-    filepath = _save_dynamic_ticker_list(_CURRENT_ACTIVE_TICKERS)
+    filepath = await asyncio.to_thread(_save_dynamic_ticker_list, list(_CURRENT_ACTIVE_TICKERS))
     
     if not filepath:
         raise HTTPException(status_code=500, detail="未能将新的股票列表保存到 GCS。")
     
-    return {"message": "成功更新股票列表。", "new_active_tickers": _CURRENT_ACTIVE_TICKERS, "saved_to": filepath}
+    return {"message": "成功更新股票列表。", "new_active_tickers": list(_CURRENT_ACTIVE_TICKERS), "saved_to": filepath}
 
 
 @app.post("/admin/load_ticker_list_from_gcs", summary="从 GCS 重新加载当前激活股票列表")
@@ -2618,10 +3349,9 @@ async def load_ticker_list_from_gcs() -> Dict[str, Any]:
     global _CURRENT_ACTIVE_TICKERS
     request_logger.info("API Request: /admin/load_ticker_list_from_gcs - Reloading ticker list from GCS")
 
-    old_list = list(_CURRENT_ACTIVE_TICKERS) if _CURRENT_ACTIVE_TICKERS else []
-    new_list = _load_dynamic_ticker_list()
-    # 统一大写 & 去除空白
-    _CURRENT_ACTIVE_TICKERS = [t.upper().strip() for t in new_list if isinstance(t, str) and t.strip()]
+    old_list = list(_CURRENT_ACTIVE_TICKERS)
+    new_list = await asyncio.to_thread(_load_dynamic_ticker_list)
+    _CURRENT_ACTIVE_TICKERS = _normalize_active_tickers(new_list)
 
     old_set = set(old_list)
     new_set = set(_CURRENT_ACTIVE_TICKERS)
@@ -2636,7 +3366,7 @@ async def load_ticker_list_from_gcs() -> Dict[str, Any]:
     return {
         "message": "已从 GCS 重新加载股票列表。",
         "count": len(_CURRENT_ACTIVE_TICKERS),
-        "active_tickers": _CURRENT_ACTIVE_TICKERS,
+        "active_tickers": list(_CURRENT_ACTIVE_TICKERS),
         "added": added,
         "removed": removed,
         "previous_count": len(old_list),
@@ -2662,7 +3392,7 @@ async def get_daily_ai_context_index(date: str = Query(..., description="日期
     except ValueError:
         raise HTTPException(status_code=400, detail="日期格式无效。请使用 YYYY-MM-DD。")
     
-    daily_index = _load_daily_index_from_storage(index_date)
+    daily_index = await asyncio.to_thread(_load_daily_index_cached, index_date)
     return { "date": index_date, "items": daily_index }
 
 
@@ -2707,8 +3437,8 @@ async def market_next_earnings(
     s = _normalize_symbol(symbol)
     request_logger.info(f"API Request: /api/market/earnings/next - symbol={s}, force_refresh={force_refresh}")
     try:
-        payload = _get_or_refresh_next_earnings(s, force_refresh=bool(force_refresh))
-        return JSONResponse(
+        payload = await asyncio.to_thread(_get_or_refresh_next_earnings, s, force_refresh=bool(force_refresh))
+        return ORJSONResponse(
             content=payload,
             headers={"cache-control": "public, max-age=120, stale-while-revalidate=21600"},
         )
@@ -2727,8 +3457,17 @@ async def trading_data_next_earnings(
 
 # --- Health check endpoint ---
 
+# 健康检查内容只依赖启动时的环境变量，预先编码一次；探针高频轮询时直接返回字节
+_HEALTH_BODY = dumps_bytes({
+    "status": "ok",
+    "gcs_enabled": "1" if bool(GCS_BUCKET_NAME) else "0",
+    "gcs_bucket": str(GCS_BUCKET_NAME or ""),
+    "generate_analysis_in_batch": "1" if GENERATE_ANALYSIS_IN_BATCH else "0",
+})
+
+
 @app.get("/health", summary="健康检查")
-async def health() -> Dict[str, str]:
+async def health() -> Response:
     """
     **主要行为:** 提供一个简单的健康检查接口。
 
@@ -2740,12 +3479,7 @@ async def health() -> Dict[str, str]:
 
     **用途:** 用于 Cloud Run 或其他容器编排平台进行服务健康检查。
     """
-    return {
-        "status": "ok",
-        "gcs_enabled": "1" if bool(GCS_BUCKET_NAME) else "0",
-        "gcs_bucket": str(GCS_BUCKET_NAME or ""),
-        "generate_analysis_in_batch": "1" if GENERATE_ANALYSIS_IN_BATCH else "0",
-    }
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 
 # --- Compatibility endpoints for vercel-nextjs (optional, but helps swap data source later) ---
@@ -2768,7 +3502,7 @@ async def market_movers_daily(
     as_of_set: set[str] = set()
 
     for symbol in requested:
-        snapshot = _daily_mover_snapshot_from_storage(symbol)
+        snapshot = await asyncio.to_thread(_daily_mover_snapshot_from_storage, symbol)
         if not snapshot:
             missing.append(symbol)
             continue
@@ -2812,35 +3546,27 @@ async def market_candles(
     if interval != "1d":
         raise HTTPException(status_code=400, detail="Only interval=1d is supported for now.")
 
-    df = _load_historical_data_from_storage(s)
+    # If we have stored data but it's stale, serve it and refresh in the background (rate-limited per instance).
+    df = await asyncio.to_thread(_load_historical_with_refresh, s, True)
     source = "gcs" if GCS_BUCKET_NAME else "local-fallback"
 
-    # If we have stored data but it's stale, refresh it (rate-limited per instance).
-    try:
-        if _should_refresh_on_request(s, df):
-            _maybe_refresh_daily_once(s, min_interval_seconds=HISTORICAL_REFRESH_MAX_AGE_SECONDS)
-            df = _load_historical_data_from_storage(s, force_reload=True)
-    except Exception:
-        pass
-
     # Fallback: if no stored data, fetch via yfinance and persist.
     if df.empty:
         years_guess = 5
         if isinstance(range, str) and range.strip():
             r = range.strip().lower()
             years_guess = 1 if r == "1y" else 2 if r == "2y" else 5 if r == "5y" else 10 if r == "10y" else 5
-        df = _fetch_historical_df(s, period=_years_to_range(years_guess), interval="1d")
+        df = await asyncio.to_thread(_fetch_historical_df, s, period=_years_to_range(years_guess), interval="1d")
         if df.empty:
             raise HTTPException(status_code=502, detail=f"Failed to load candles for {s}.")
         df.index = df.index.normalize()
-        _save_historical_data_to_storage(s, df)
+        await asyncio.to_thread(_save_historical_data_to_storage, s, df)
         source = "yfinance"
 
     candles = _df_to_market_candles(df, limit=limit)
     if len(candles) < 30:
         raise HTTPException(status_code=502, detail="Not enough candles.")
 
-    df = df.sort_index()
     return {
         "symbol": s,
         "interval": "1d",
@@ -2856,20 +3582,19 @@ async def trading_us_analysis(body: Dict[str, Any] = Body(default_factory=dict))
     请求/返回尽量对齐 `vercel-nextjs/app/api/trading/us/analysis`.
     目前为 MVP：不做回测训练，只做可解释的因子打分 + sigmoid 融合。
     """
+    # 存储读写、yfinance 兜底、回测计算及 in-flight 等待都是阻塞的，整体放到线程池执行
+    return await asyncio.to_thread(_trading_us_analysis_sync, body)
+
+
+def _trading_us_analysis_sync(body: Dict[str, Any]):
     symbol = _normalize_symbol(body.get("symbol"))
     years = _clamp_int(body.get("years"), 5, 1, 10)
     days = _clamp_int(body.get("days"), 0, 0, 5000)
     horizon_days = _clamp_int(body.get("horizonDays"), 1, 1, 10)
     backtest_window = _clamp_int(body.get("backtestWindow"), 252, 20, 756)
 
-    df = _load_historical_data_from_storage(symbol)
-    # Ensure stored candles are up-to-date enough (best-effort), but keep L1 hit on fresh data.
-    try:
-        if _should_refresh_on_request(symbol, df):
-            _maybe_refresh_daily_once(symbol, min_interval_seconds=HISTORICAL_REFRESH_MAX_AGE_SECONDS)
-            df = _load_historical_data_from_storage(symbol, force_reload=True)
-    except Exception:
-        pass
+    # Serve stored candles immediately; stale data is refreshed in the background (best-effort).
+    df = _load_historical_with_refresh(symbol, background=True)
 
     if df.empty:
         df = _fetch_historical_df(symbol, period=_years_to_range(years), interval="1d")
@@ -2878,8 +3603,13 @@ async def trading_us_analysis(body: Dict[str, Any] = Body(default_factory=dict))
         df.index = df.index.normalize()
         _save_historical_data_to_storage(symbol, df)
 
+    # 只有 leader（登记了 inflight Event 的请求）在结束时移除并唤醒等待者
+    leader = False
+    ev: Optional[Event] = None
+    inflight_key = ""
     try:
-        df = df.sort_index()
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
         df_for_analysis = df
         if len(df_for_analysis):
             if days > 0:
@@ -2912,7 +3642,7 @@ async def trading_us_analysis(body: Dict[str, Any] = Body(default_factory=dict))
                     "backtestWindow": backtest_window,
                 }
                 cached["meta"] = meta
-                return JSONResponse(
+                return ORJSONResponse(
                     content=cached,
                     headers={"cache-control": "public, max-age=60, stale-while-revalidate=3600"},
                 )
@@ -2942,7 +3672,7 @@ async def trading_us_analysis(body: Dict[str, Any] = Body(default_factory=dict))
                         "backtestWindow": backtest_window,
                     }
                     cached2["meta"] = meta
-                    return JSONResponse(
+                    return ORJSONResponse(
                         content=cached2,
                         headers={"cache-control": "public, max-age=60, stale-while-revalidate=3600"},
                     )
@@ -2965,34 +3695,26 @@ async def trading_us_analysis(body: Dict[str, Any] = Body(default_factory=dict))
             path = _try_save_analysis_if_absent(symbol, analysis_date, analysis_payload)
             if path:
                 try:
-                    index_list = _load_analysis_daily_index_from_storage(analysis_date)
-                    index_list = [item for item in index_list if item.get("ticker") != symbol]
-                    index_list.append({"ticker": symbol, "path": path})
-                    _save_analysis_daily_index_to_storage(analysis_date, index_list)
+                    _update_daily_index(analysis_date, {symbol: path}, analysis=True)
                 except Exception:
                     pass
 
-        return JSONResponse(
+        return ORJSONResponse(
             content=analysis_payload,
             headers={"cache-control": "public, max-age=60, stale-while-revalidate=3600"},
         )
     except Exception as exc:
-        if _analysis_request_is_baseline(body):
-            with _ANALYSIS_LOCK:
-                ev = _ANALYSIS_INFLIGHT.pop(inflight_key, None) if "inflight_key" in locals() else None
-            if ev is not None:
-                ev.set()
         raise HTTPException(status_code=502, detail=str(exc))
     finally:
-        if _analysis_request_is_baseline(body):
+        if leader and ev is not None:
             with _ANALYSIS_LOCK:
-                ev = _ANALYSIS_INFLIGHT.pop(inflight_key, None) if "inflight_key" in locals() else None
-            if ev is not None:
-                ev.set()
+                if _ANALYSIS_INFLIGHT.get(inflight_key) is ev:
+                    _ANALYSIS_INFLIGHT.pop(inflight_key, None)
+            ev.set()
 
 
 if __name__ == "__main__": # pragma: no cover
     import uvicorn
     # When running locally without GCS_BUCKET_NAME env var, it will use local fallback for historical data
     # and print to console.
-    uvicorn.run(app, host="0.0.0.0", port=8080, log_level="info")
+    uvicorn.run(app, host="0.0.0.0", port=8080, log_level="info", loop="uvloop", http="httptools")
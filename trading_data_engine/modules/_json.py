@@ -0,0 +1,42 @@
+"""Fast JSON encoding/decoding for storage objects.
+
+`dumps_bytes` / `loads` use orjson when it is installed (compact UTF-8 bytes,
+numpy scalars); otherwise they fall back to the standard library with the
+same compact separators. `pretty=True` indents with two spaces, for
+human-facing local files only. `loads` also falls back to the standard library for
+legacy objects containing NaN/Infinity literals, which orjson rejects.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj: Any, pretty: bool = False) -> bytes:
+        option = _ORJSON_OPTIONS | orjson.OPT_INDENT_2 if pretty else _ORJSON_OPTIONS
+        return orjson.dumps(obj, option=option)
+
+    def loads(data: Union[bytes, str]) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Objects written by json.dumps before the switch may contain NaN literals.
+            return json.loads(data)
+
+except ImportError:  # pragma: no cover - depends on deployment image
+
+    def dumps_bytes(obj: Any, pretty: bool = False) -> bytes:
+        if pretty:
+            return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+__all__ = ["dumps_bytes", "loads"]
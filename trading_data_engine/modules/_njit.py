@@ -0,0 +1,26 @@
+"""Optional Numba JIT support.
+
+`njit` compiles with Numba when it is installed; otherwise it returns the
+function unchanged so callers can keep a pure-Python/pandas fallback.
+"""
+
+from __future__ import annotations
+
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = True
+except ImportError:  # pragma: no cover - depends on deployment image
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+
+        return decorator
+
+
+__all__ = ["NUMBA_AVAILABLE", "njit"]
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
 import os
 import time
@@ -14,9 +14,12 @@ import pandas as pd
 import pytz
 import yfinance as yf
 from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
 
+from modules._json import dumps_bytes, loads
+
 
 @dataclass(frozen=True)
 class OptionsSummaryDeps:
@@ -30,6 +33,7 @@ class OptionsSummaryDeps:
     is_after_market_close: Callable[[datetime], bool]
     normalize_symbol: Callable[[Any], str]
     request_logger: logging.Logger
+    gcs_bucket: Callable[[], storage.Bucket]
 
 
 class OptionsSummaryService:
@@ -131,14 +135,14 @@ class OptionsSummaryService:
         gcs_bucket_name = self._deps.gcs_bucket_name
         if gcs_bucket_name:
             try:
-                storage_client = storage.Client()
-                bucket = storage_client.bucket(gcs_bucket_name)
+                bucket = self._deps.gcs_bucket()
                 blob_name = self._get_gcs_blob_name(t)
                 blob = bucket.blob(blob_name)
-                if not blob.exists():
+                try:
+                    raw = blob.download_as_bytes()
+                except NotFound:
                     return None
-                raw = blob.download_as_text(encoding="utf-8")
-                payload = json.loads(raw)
+                payload = loads(raw)
                 return payload if isinstance(payload, dict) else None
             except Exception as exc:
                 logging.getLogger(__name__).error("从 GCS 加载 %s 的 options 摘要失败: %s", t, exc)
@@ -148,8 +152,8 @@ class OptionsSummaryService:
         if not os.path.exists(filepath):
             return None
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                payload = json.load(f)
+            with open(filepath, "rb") as f:
+                payload = loads(f.read())
             return payload if isinstance(payload, dict) else None
         except Exception as exc:
             logging.getLogger(__name__).error("从本地 fallback 文件 %s 加载 %s 的 options 摘要失败: %s", filepath, t, exc)
@@ -157,17 +161,15 @@ class OptionsSummaryService:
 
     def _save_to_storage(self, ticker: str, payload: Dict[str, Any]) -> str:
         t = ticker.upper()
-        content = json.dumps(payload, indent=2, ensure_ascii=False)
         gcs_bucket_name = self._deps.gcs_bucket_name
 
         if gcs_bucket_name:
             try:
-                storage_client = storage.Client()
-                bucket = storage_client.bucket(gcs_bucket_name)
+                bucket = self._deps.gcs_bucket()
                 blob_name = self._get_gcs_blob_name(t)
                 blob = bucket.blob(blob_name)
                 blob.cache_control = "public, max-age=120, stale-while-revalidate=3600"
-                blob.upload_from_string(content, content_type="application/json")
+                blob.upload_from_string(dumps_bytes(payload), content_type="application/json")
                 logging.getLogger(__name__).info("成功保存 %s 的 options 摘要到 GCS: gs://%s/%s", t, gcs_bucket_name, blob_name)
                 return f"gs://{gcs_bucket_name}/{blob_name}"
             except Exception as exc:
@@ -176,8 +178,8 @@ class OptionsSummaryService:
 
         filepath = self._get_local_fallback_filepath(t)
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(content)
+            with open(filepath, "wb") as f:
+                f.write(dumps_bytes(payload, pretty=True))
             logging.getLogger(__name__).warning("GCS_BUCKET_NAME 未设置。已保存 %s 的 options 摘要到本地 fallback: %s", t, filepath)
             return filepath
         except Exception as exc:
@@ -560,8 +562,8 @@ def build_options_router(service: OptionsSummaryService) -> APIRouter:
         s = service.normalize_symbol(symbol)
         service.request_logger.info(f"API Request: /api/market/options/summary - symbol={s}, force_refresh={force_refresh}")
         try:
-            payload = service.get_or_refresh_summary(s, force_refresh=bool(force_refresh))
-            return JSONResponse(
+            payload = await asyncio.to_thread(service.get_or_refresh_summary, s, force_refresh=bool(force_refresh))
+            return ORJSONResponse(
                 content=payload,
                 headers={"cache-control": "public, max-age=60, stale-while-revalidate=600"},
             )